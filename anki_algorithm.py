@@ -7,6 +7,7 @@ Références:
 - https://faqs.ankiweb.net/what-spaced-repetition-algorithm.html
 """
 
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 
 
@@ -23,6 +24,91 @@ DEFAULT_CONFIG = {
 }
 
 
+@dataclass(frozen=True)
+class SchedulerConfig:
+    """
+    Configuration validée et précalculée de l'algorithme (voir compile_config)
+
+    Immuable : une même instance peut être partagée entre threads et gardée en
+    cache. Les délais des étapes d'apprentissage sont convertis une fois pour
+    toutes en timedelta. L'accès par clé (config['max_interval']) reste possible
+    comme avec un dictionnaire de configuration.
+    """
+    learning_steps: tuple
+    graduating_interval: int
+    easy_interval: int
+    starting_ease: float
+    easy_bonus: float
+    interval_modifier: float
+    max_interval: int
+    min_ease: float
+    learning_deltas: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'learning_deltas',
+                           tuple(timedelta(minutes=m) for m in self.learning_steps))
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self):
+        """Convertit en dictionnaire de configuration (pour stockage ou affichage)"""
+        return {key: (list(self.learning_steps) if key == 'learning_steps' else getattr(self, key))
+                for key in DEFAULT_CONFIG}
+
+
+def _check_number(settings, key, minimum, integer=False):
+    value = settings[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} doit être un nombre")
+    if integer and value != int(value):
+        raise ValueError(f"{key} doit être un nombre entier")
+    if value < minimum:
+        raise ValueError(f"{key} doit être supérieur ou égal à {minimum}")
+    return int(value) if integer else float(value)
+
+
+def compile_config(settings=None) -> SchedulerConfig:
+    """
+    Valide une configuration et la transforme en SchedulerConfig
+
+    Args:
+        settings: Dictionnaire de paramètres (les clés absentes prennent la
+                  valeur de DEFAULT_CONFIG)
+
+    Raises:
+        ValueError si un paramètre est inconnu ou invalide
+    """
+    settings = dict(settings or {})
+    unknown = set(settings) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Paramètres inconnus: {', '.join(sorted(unknown))}")
+    settings = {**DEFAULT_CONFIG, **settings}
+
+    steps = settings['learning_steps']
+    if not isinstance(steps, (list, tuple)) or not steps:
+        raise ValueError("learning_steps doit être une liste non vide de durées en minutes")
+    for minutes in steps:
+        if isinstance(minutes, bool) or not isinstance(minutes, (int, float)) or minutes <= 0:
+            raise ValueError("learning_steps doit contenir des durées positives en minutes")
+
+    min_ease = _check_number(settings, 'min_ease', 1.0)
+    return SchedulerConfig(
+        learning_steps=tuple(steps),
+        graduating_interval=_check_number(settings, 'graduating_interval', 1, integer=True),
+        easy_interval=_check_number(settings, 'easy_interval', 1, integer=True),
+        starting_ease=_check_number(settings, 'starting_ease', min_ease),
+        easy_bonus=_check_number(settings, 'easy_bonus', 1.0),
+        interval_modifier=_check_number(settings, 'interval_modifier', 0.01),
+        max_interval=_check_number(settings, 'max_interval', 1, integer=True),
+        min_ease=min_ease,
+    )
+
+
+# Configuration par défaut compilée, utilisée quand aucune configuration n'est fournie
+DEFAULT_SCHEDULER = compile_config()
+
+
 class AnkiCard:
     """
     Représente l'état d'une carte selon l'algorithme Anki
@@ -60,7 +146,7 @@ class AnkiCard:
         )
 
 
-def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> AnkiCard:
+def calculate_next_review(card: AnkiCard, rating: int, config=None, now: datetime = None) -> AnkiCard:
     """
     Calcule le prochain intervalle de révision selon l'algorithme SM-2
 
@@ -71,17 +157,24 @@ def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> A
                 1 = Hard (Difficile)
                 2 = Good (Bon)
                 3 = Easy (Facile)
-        config: Configuration (utilise DEFAULT_CONFIG si None)
+        config: SchedulerConfig, ou dictionnaire validé à chaque appel
+                (utilise DEFAULT_SCHEDULER si None)
+        now: Date de la révision (utilise datetime.now() si None)
 
     Returns:
         AnkiCard avec les nouveaux paramètres
     """
     if config is None:
-        config = DEFAULT_CONFIG
+        config = DEFAULT_SCHEDULER
+    elif not isinstance(config, SchedulerConfig):
+        config = compile_config(config)
+    if now is None:
+        now = datetime.now()
 
     new_card = AnkiCard(
         ease_factor=card.ease_factor,
         interval=card.interval,
+        due_date=now,
         step=card.step,
         is_learning=card.is_learning,
         repetitions=card.repetitions
@@ -92,31 +185,29 @@ def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> A
         if rating == 0:  # Again
             # Recommencer l'apprentissage
             new_card.step = 0
-            new_card.due_date = datetime.now() + timedelta(minutes=config['learning_steps'][0])
+            new_card.due_date = now + config.learning_deltas[0]
 
         elif rating == 1:  # Hard
-            # Répéter l'étape actuelle
-            minutes = config['learning_steps'][new_card.step]
-            new_card.due_date = datetime.now() + timedelta(minutes=minutes)
+            # Répéter l'étape actuelle (la dernière si le preset a depuis perdu des étapes)
+            new_card.due_date = now + config.learning_deltas[min(new_card.step, len(config.learning_deltas) - 1)]
 
         elif rating == 2:  # Good
             # Passer à l'étape suivante
-            if new_card.step < len(config['learning_steps']) - 1:
+            if new_card.step < len(config.learning_deltas) - 1:
                 new_card.step += 1
-                minutes = config['learning_steps'][new_card.step]
-                new_card.due_date = datetime.now() + timedelta(minutes=minutes)
+                new_card.due_date = now + config.learning_deltas[new_card.step]
             else:
                 # Graduation: passer en révision
                 new_card.is_learning = False
-                new_card.interval = config['graduating_interval']
-                new_card.due_date = datetime.now() + timedelta(days=new_card.interval)
+                new_card.interval = config.graduating_interval
+                new_card.due_date = now + timedelta(days=new_card.interval)
                 new_card.repetitions = 1
 
         elif rating == 3:  # Easy
             # Graduation immédiate avec intervalle "facile"
             new_card.is_learning = False
-            new_card.interval = config['easy_interval']
-            new_card.due_date = datetime.now() + timedelta(days=new_card.interval)
+            new_card.interval = config.easy_interval
+            new_card.due_date = now + timedelta(days=new_card.interval)
             new_card.repetitions = 1
 
     # Carte en phase de révision
@@ -125,17 +216,17 @@ def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> A
             # Retour en apprentissage
             new_card.is_learning = True
             new_card.step = 0
-            new_card.due_date = datetime.now() + timedelta(minutes=config['learning_steps'][0])
+            new_card.due_date = now + config.learning_deltas[0]
             new_card.repetitions = 0
             # Réduire l'ease factor
-            new_card.ease_factor = max(config['min_ease'], new_card.ease_factor - 0.2)
+            new_card.ease_factor = max(config.min_ease, new_card.ease_factor - 0.2)
 
         elif rating == 1:  # Hard
             # Intervalle réduit
             new_card.interval = int(new_card.interval * 1.2)
-            new_card.due_date = datetime.now() + timedelta(days=new_card.interval)
+            new_card.due_date = now + timedelta(days=new_card.interval)
             # Réduire légèrement l'ease factor
-            new_card.ease_factor = max(config['min_ease'], new_card.ease_factor - 0.15)
+            new_card.ease_factor = max(config.min_ease, new_card.ease_factor - 0.15)
             new_card.repetitions += 1
 
         elif rating == 2:  # Good
@@ -145,21 +236,21 @@ def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> A
             elif new_card.repetitions == 1:
                 new_card.interval = 6
             else:
-                new_card.interval = int(new_card.interval * new_card.ease_factor * config['interval_modifier'])
+                new_card.interval = int(new_card.interval * new_card.ease_factor * config.interval_modifier)
 
-            new_card.interval = min(new_card.interval, config['max_interval'])
-            new_card.due_date = datetime.now() + timedelta(days=new_card.interval)
+            new_card.interval = min(new_card.interval, config.max_interval)
+            new_card.due_date = now + timedelta(days=new_card.interval)
             new_card.repetitions += 1
 
         elif rating == 3:  # Easy
             # Intervalle augmenté avec bonus
             if new_card.repetitions == 0:
-                new_card.interval = config['easy_interval']
+                new_card.interval = config.easy_interval
             else:
-                new_card.interval = int(new_card.interval * new_card.ease_factor * config['easy_bonus'] * config['interval_modifier'])
+                new_card.interval = int(new_card.interval * new_card.ease_factor * config.easy_bonus * config.interval_modifier)
 
-            new_card.interval = min(new_card.interval, config['max_interval'])
-            new_card.due_date = datetime.now() + timedelta(days=new_card.interval)
+            new_card.interval = min(new_card.interval, config.max_interval)
+            new_card.due_date = now + timedelta(days=new_card.interval)
             # Augmenter l'ease factor
             new_card.ease_factor += 0.15
             new_card.repetitions += 1
@@ -167,6 +258,293 @@ def calculate_next_review(card: AnkiCard, rating: int, config: dict = None) -> A
     return new_card
 
 
+def calculate_next_review_batch(ease_factor, interval, step, is_learning, repetitions, ratings,
+                                config=None, now: datetime = None) -> dict:
+    """
+    Version vectorisée (NumPy) de calculate_next_review pour un lot de cartes
+
+    Chaque argument d'état est un tableau (ou une liste) de même longueur : la
+    carte i a l'état (ease_factor[i], interval[i], ...) et reçoit la note
+    ratings[i]. Les règles sont exactement celles de calculate_next_review,
+    appliquées par masques sur tout le lot : le résultat est identique à
+    l'appel carte par carte, sans créer d'objet AnkiCard. Utile pour
+    replanifier un deck entier, simuler ou importer un historique.
+
+    Args:
+        ease_factor, interval, step, is_learning, repetitions: État des cartes
+        ratings: Notes (0 = Again, 1 = Hard, 2 = Good, 3 = Easy)
+        config: SchedulerConfig ou dictionnaire (utilise DEFAULT_SCHEDULER si None)
+        now: Date des révisions (utilise datetime.now() si None), ou tableau
+             datetime64 d'une date par carte
+
+    Returns:
+        dict de tableaux NumPy : ease_factor, interval, step, is_learning,
+        repetitions et due_date (datetime64[us])
+    """
+    import numpy as np
+
+    if config is None:
+        config = DEFAULT_SCHEDULER
+    elif not isinstance(config, SchedulerConfig):
+        config = compile_config(config)
+    if now is None:
+        now = datetime.now()
+
+    ease = np.array(ease_factor, dtype=np.float64)
+    # Même valeur par défaut que AnkiCard (ease_factor or starting_ease)
+    ease[ease == 0] = config['starting_ease']
+    interval = np.array(interval, dtype=np.int64)
+    step = np.array(step, dtype=np.int64)
+    learning = np.array(is_learning, dtype=bool)
+    repetitions = np.array(repetitions, dtype=np.int64)
+    ratings = np.asarray(ratings)
+
+    steps = np.asarray(config['learning_steps'], dtype=np.float64)
+    last_step = len(steps) - 1
+
+    # Délai avant la prochaine révision : en minutes (apprentissage) ou en jours
+    due_minutes = np.zeros(len(ratings), dtype=np.float64)
+    due_days = np.zeros(len(ratings), dtype=np.int64)
+
+    again, hard, good, easy = (ratings == 0), (ratings == 1), (ratings == 2), (ratings == 3)
+    review = ~learning
+
+    # --- Cartes en phase d'apprentissage ---
+    m = learning & again
+    step[m] = 0
+    due_minutes[m] = steps[0]
+
+    m = learning & hard
+    due_minutes[m] = steps[np.clip(step[m], 0, last_step)]
+
+    m = learning & good & (step < last_step)
+    step[m] += 1
+    due_minutes[m] = steps[step[m]]
+
+    graduated = learning & ((good & (step >= last_step) & ~m) | easy)
+    interval[graduated] = np.where(easy[graduated], config['easy_interval'], config['graduating_interval'])
+    due_days[graduated] = interval[graduated]
+    repetitions[graduated] = 1
+
+    # --- Cartes en phase de révision ---
+    m = review & again
+    step[m] = 0
+    due_minutes[m] = steps[0]
+    repetitions[m] = 0
+    ease[m] = np.maximum(config['min_ease'], ease[m] - 0.2)
+
+    m = review & hard
+    interval[m] = np.trunc(interval[m] * 1.2)
+    due_days[m] = interval[m]
+    ease[m] = np.maximum(config['min_ease'], ease[m] - 0.15)
+    repetitions[m] += 1
+
+    m = review & good
+    grown = np.trunc(interval[m] * ease[m] * config['interval_modifier']).astype(np.int64)
+    grown = np.where(repetitions[m] == 0, 1, np.where(repetitions[m] == 1, 6, grown))
+    interval[m] = np.minimum(grown, config['max_interval'])
+    due_days[m] = interval[m]
+    repetitions[m] += 1
+
+    m = review & easy
+    grown = np.trunc(
+        interval[m] * ease[m] * config['easy_bonus'] * config['interval_modifier']
+    ).astype(np.int64)
+    grown = np.where(repetitions[m] == 0, config['easy_interval'], grown)
+    interval[m] = np.minimum(grown, config['max_interval'])
+    due_days[m] = interval[m]
+    ease[m] += 0.15
+    repetitions[m] += 1
+
+    # Changements de phase (après les calculs qui dépendent de la phase d'origine)
+    learning = np.where(graduated, False, np.where(review & again, True, learning))
+
+    offsets = np.rint(due_minutes * 60_000_000).astype(np.int64) + due_days * 86_400_000_000
+    due_date = np.asarray(now, dtype='datetime64[us]') + offsets.astype('timedelta64[us]')
+
+    return {
+        'ease_factor': ease,
+        'interval': interval,
+        'step': step,
+        'is_learning': learning,
+        'repetitions': repetitions,
+        'due_date': due_date,
+    }
+
+
+# Modèle de réponse par défaut de simulate : probabilités des notes
+# (Again, Hard, Good, Easy) selon la phase de la carte
+DEFAULT_ANSWER_MODEL = {
+    'learning': (0.15, 0.10, 0.65, 0.10),
+    'review': (0.10, 0.15, 0.65, 0.10),
+}
+
+
+def _sample_ratings(rng, answer_model, state):
+    """Tire une note par carte selon le modèle de réponse (voir simulate)"""
+    import numpy as np
+
+    if callable(answer_model):
+        probabilities = np.asarray(answer_model(state), dtype=np.float64)
+    else:
+        probabilities = np.where(state['is_learning'][:, None],
+                                 np.asarray(answer_model['learning'], dtype=np.float64),
+                                 np.asarray(answer_model['review'], dtype=np.float64))
+
+    cumulative = np.cumsum(probabilities, axis=1)
+    cumulative /= cumulative[:, -1:]
+    draws = rng.random(len(probabilities))
+    return (draws[:, None] > cumulative[:, :-1]).sum(axis=1)
+
+
+def simulate(progress_rows, days=30, answer_model=None, runs=10, config=None, deck_configs=None,
+             start: datetime = None, seed=None, max_reviews_per_day=20) -> dict:
+    """
+    Prévoit la charge de révisions des prochains jours (simulation de Monte-Carlo)
+
+    Les cartes sont révisées jour après jour avec l'algorithme (version
+    vectorisée calculate_next_review_batch) : chaque jour, toutes les cartes
+    dues reçoivent une note tirée selon le modèle de réponse, puis celles
+    revenues en apprentissage sont revues dans la journée. La simulation est
+    répétée runs fois en parallèle (les cartes sont dupliquées dans les
+    tableaux) pour obtenir une charge moyenne et une charge de pointe.
+
+    Args:
+        progress_rows: Lignes de user_progress (mappings avec ease_factor, interval,
+                       due_date, step, is_learning, repetitions, deck_id et
+                       éventuellement folder_id)
+        days: Nombre de jours simulés (aujourd'hui compris)
+        answer_model: Dictionnaire {'learning': (p0, p1, p2, p3), 'review': (...)} des
+                      probabilités des notes, ou fonction state -> tableau (n, 4) où
+                      state contient les tableaux ease_factor, interval, is_learning,
+                      repetitions et overdue_days (DEFAULT_ANSWER_MODEL si None)
+        runs: Nombre de simulations
+        config: Configuration de l'algorithme (DEFAULT_SCHEDULER si None)
+        deck_configs: Configurations propres à certains decks {deck_id: config}
+        start: Début de la simulation (datetime.now() si None)
+        seed: Graine du générateur aléatoire (résultats reproductibles)
+        max_reviews_per_day: Nombre maximal de passages d'une carte dans une journée
+
+    Returns:
+        dict avec :
+            dates: liste des jours simulés (date ISO)
+            total: charge moyenne par jour (liste)
+            peak: charge du 95e centile des simulations, par jour (liste)
+            decks: {deck_id: charge moyenne par jour}
+            folders: {folder_id: charge moyenne par jour} (None = hors dossier)
+    """
+    import numpy as np
+
+    if answer_model is None:
+        answer_model = DEFAULT_ANSWER_MODEL
+    if config is None:
+        config = DEFAULT_SCHEDULER
+    elif not isinstance(config, SchedulerConfig):
+        config = compile_config(config)
+    deck_configs = {deck_id: c if isinstance(c, SchedulerConfig) else compile_config(c)
+                    for deck_id, c in (deck_configs or {}).items()}
+    if start is None:
+        start = datetime.now()
+
+    rows = list(progress_rows)
+    midnight = datetime(start.year, start.month, start.day)
+    dates = [(midnight + timedelta(days=d)).date().isoformat() for d in range(days)]
+    if not rows:
+        return {'dates': dates, 'total': [0.0] * days, 'peak': [0.0] * days, 'decks': {}, 'folders': {}}
+
+    # --- État initial, dupliqué pour chaque simulation ---
+    deck_ids = sorted({row['deck_id'] for row in rows})
+    deck_index = {deck_id: i for i, deck_id in enumerate(deck_ids)}
+    folder_of_deck = {}
+    for row in rows:
+        folder_of_deck[row['deck_id']] = row['folder_id'] if 'folder_id' in row.keys() else None
+
+    def column(key, default):
+        return np.array([row[key] if row[key] is not None else default for row in rows])
+
+    start_us = np.datetime64(start, 'us')
+    ease = np.tile(column('ease_factor', config.starting_ease).astype(np.float64), runs)
+    interval = np.tile(column('interval', 0).astype(np.int64), runs)
+    step = np.tile(column('step', 0).astype(np.int64), runs)
+    learning = np.tile(column('is_learning', 1).astype(bool), runs)
+    repetitions = np.tile(column('repetitions', 0).astype(np.int64), runs)
+    due = np.tile(np.array([row['due_date'] or start.isoformat() for row in rows],
+                           dtype='datetime64[us]'), runs)
+    deck = np.tile(np.array([deck_index[row['deck_id']] for row in rows]), runs)
+    run = np.repeat(np.arange(runs), len(rows))
+
+    # Groupes de cartes par configuration (une seule en l'absence de deck_configs)
+    groups = [(config, None)]
+    if deck_configs:
+        specific = np.array([deck_id in deck_configs for deck_id in deck_ids])
+        groups = [(config, ~specific[deck])] + [
+            (deck_config, deck == deck_index[deck_id])
+            for deck_id, deck_config in deck_configs.items() if deck_id in deck_index
+        ]
+
+    rng = np.random.default_rng(seed)
+    load = np.zeros((runs, days, len(deck_ids)), dtype=np.int64)
+    one_day = np.timedelta64(1, 'D')
+
+    for d in range(days):
+        day_start = np.datetime64(midnight, 'us') + d * one_day
+        day_end = day_start + one_day
+        # Les cartes en retard sont révisées au moment où commence la simulation
+        review_time = max(start_us, day_start)
+
+        # Seules les cartes révisées dans la journée peuvent y redevenir dues
+        idx = np.flatnonzero(due < day_end)
+        for _ in range(max_reviews_per_day):
+            if not len(idx):
+                break
+            np.add.at(load, (run[idx], d, deck[idx]), 1)
+
+            state = {
+                'ease_factor': ease[idx], 'interval': interval[idx], 'is_learning': learning[idx],
+                'repetitions': repetitions[idx],
+                'overdue_days': (review_time - due[idx]) / one_day,
+            }
+            ratings = _sample_ratings(rng, answer_model, state)
+            when = np.maximum(due[idx], review_time)
+
+            for group_config, group_mask in groups:
+                sel = idx if group_mask is None else idx[group_mask[idx]]
+                pos = slice(None) if group_mask is None else group_mask[idx]
+                if not len(sel):
+                    continue
+                new = calculate_next_review_batch(
+                    ease[sel], interval[sel], step[sel], learning[sel], repetitions[sel],
+                    ratings[pos], group_config, when[pos]
+                )
+                ease[sel] = new['ease_factor']
+                interval[sel] = new['interval']
+                step[sel] = new['step']
+                learning[sel] = new['is_learning']
+                repetitions[sel] = new['repetitions']
+                due[sel] = new['due_date']
+
+            idx = idx[due[idx] < day_end]
+        else:
+            # Cartes encore dues après max_reviews_per_day passages : reportées au lendemain
+            due[idx] = day_end
+
+    per_deck = load.mean(axis=0)
+    totals = load.sum(axis=2)
+
+    folders = {}
+    for deck_id, i in deck_index.items():
+        folder_load = folders.setdefault(folder_of_deck[deck_id], np.zeros(days))
+        folder_load += per_deck[:, i]
+
+    return {
+        'dates': dates,
+        'total': totals.mean(axis=0).tolist(),
+        'peak': np.percentile(totals, 95, axis=0).tolist(),
+        'decks': {deck_id: per_deck[:, i].tolist() for deck_id, i in deck_index.items()},
+        'folders': {folder_id: folder_load.tolist() for folder_id, folder_load in folders.items()},
+    }
+
+
 def get_cards_to_review(cards_with_progress, current_date=None):
     """
     Filtre les cartes qui doivent être révisées
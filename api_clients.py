@@ -0,0 +1,193 @@
+"""
+Clients partagés des API de génération (Claude, Gemini, OpenAI)
+
+Les clients sont créés à la première utilisation puis réutilisés par tout le
+processus (générations de flashcards, fiches, tâches de fond) : les connexions
+HTTP restent ouvertes (keep-alive) et la négociation TLS n'a lieu qu'une fois.
+Les clients Anthropic et OpenAI sont thread-safe ; la création est protégée
+par un verrou.
+
+Les délais et le nombre de tentatives se règlent dans config.py (API_TIMEOUT,
+API_MAX_RETRIES) ou avec configure_api_clients(). Les SDK ne refont pas
+eux-mêmes les appels échoués : les nouvelles tentatives passent par
+call_with_retries, donc par le limiteur de débit (voir rate_limiter.py).
+"""
+import threading
+import time
+
+import config
+from rate_limiter import limiteur_api
+
+# Réglages des clients (modifiables avec configure_api_clients)
+API_CLIENT_SETTINGS = {
+    'timeout': getattr(config, 'API_TIMEOUT', 120.0),         # Délai d'une requête (s)
+    'connect_timeout': 10.0,                                  # Délai de connexion (s)
+    'max_retries': getattr(config, 'API_MAX_RETRIES', 2),     # Nouvelles tentatives
+    'max_connections': 20,                                    # Connexions simultanées
+    'max_keepalive_connections': 10,                          # Connexions gardées ouvertes
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def configure_api_clients(**settings):
+    """Modifie les réglages des clients et force leur recréation"""
+    unknown = set(settings) - set(API_CLIENT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    API_CLIENT_SETTINGS.update(settings)
+    reset_api_clients()
+
+
+def reset_api_clients():
+    """Ferme et oublie les clients existants (ils seront recréés au besoin)"""
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, 'close', None)
+            if close:
+                close()
+        _clients.clear()
+
+
+def _http_client():
+    """Client httpx avec pool de connexions (sans proxy, pour éviter le bug 'proxies')"""
+    import httpx
+
+    return httpx.Client(
+        timeout=httpx.Timeout(API_CLIENT_SETTINGS['timeout'],
+                              connect=API_CLIENT_SETTINGS['connect_timeout']),
+        limits=httpx.Limits(
+            max_connections=API_CLIENT_SETTINGS['max_connections'],
+            max_keepalive_connections=API_CLIENT_SETTINGS['max_keepalive_connections']
+        )
+    )
+
+
+def _create_client(provider):
+    if provider == 'claude':
+        from anthropic import Anthropic
+
+        return Anthropic(
+            api_key=config.ANTHROPIC_API_KEY,
+            http_client=_http_client(),
+            max_retries=0
+        )
+
+    if provider == 'openai':
+        from openai import OpenAI
+
+        return OpenAI(
+            api_key=config.OPENAI_API_KEY,
+            http_client=_http_client(),
+            max_retries=0
+        )
+
+    if provider == 'gemini':
+        import google.generativeai as genai
+
+        # Configuration globale du SDK, faite une seule fois par processus
+        genai.configure(api_key=config.GOOGLE_API_KEY)
+        return genai
+
+    raise ValueError(f"Provider API non reconnu: {provider}")
+
+
+def get_api_client(provider):
+    """Retourne le client partagé d'un provider ('claude', 'openai' ou 'gemini')
+
+    Pour 'gemini', retourne le module google.generativeai configuré
+    (voir get_gemini_model).
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _create_client(provider)
+                _clients[provider] = client
+    return client
+
+
+def get_gemini_model(model_name):
+    """Retourne le modèle Gemini partagé pour ce nom de modèle"""
+    key = ('gemini', model_name)
+    model = _clients.get(key)
+    if model is None:
+        genai = get_api_client('gemini')
+        with _lock:
+            model = _clients.setdefault(key, genai.GenerativeModel(model_name))
+    return model
+
+
+def gemini_request_options():
+    """Options de requête Gemini : délai, sans nouvelle tentative du SDK
+
+    Les nouvelles tentatives (API_CLIENT_SETTINGS['max_retries']) sont faites
+    par call_with_retries, comme pour les autres providers.
+    """
+    return {'timeout': API_CLIENT_SETTINGS['timeout'], 'retry': None}
+
+
+def _erreur_temporaire(exc):
+    """Indique si un appel échoué peut être retenté (surcharge, quota, réseau)"""
+    status = getattr(exc, 'status_code', None)
+    if status is None and isinstance(getattr(exc, 'code', None), int):
+        status = exc.code
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    nom = type(exc).__name__
+    return 'Connection' in nom or 'Timeout' in nom
+
+
+def _nouvelle_tentative(provider, exc, tentative):
+    """Attend avant une nouvelle tentative ; False si l'erreur est définitive ou les tentatives épuisées"""
+    if tentative >= API_CLIENT_SETTINGS['max_retries'] or not _erreur_temporaire(exc):
+        return False
+    print(f"🔁 Erreur temporaire de l'API {provider} ({exc}), tentative {tentative + 2}")
+    time.sleep(min(8.0, 0.5 * 2 ** tentative))
+    return True
+
+
+def call_with_retries(provider, api_key, appel, user_id=None):
+    """Appelle l'API avec les nouvelles tentatives de API_CLIENT_SETTINGS['max_retries']
+
+    Chaque tentative attend son tour dans le limiteur de débit : une erreur 429
+    ne déclenche pas de rafale d'appels hors quota.
+
+    Usage:
+        response = call_with_retries('claude', config.ANTHROPIC_API_KEY,
+                                     lambda: client.messages.create(...), user_id)
+    """
+    tentative = 0
+    while True:
+        try:
+            with limiteur_api(provider, api_key, user_id):
+                return appel()
+        except Exception as e:
+            if not _nouvelle_tentative(provider, e, tentative):
+                raise
+            tentative += 1
+
+
+def stream_with_retries(provider, api_key, ouvrir, user_id=None):
+    """Générateur des fragments d'une réponse en flux, avec nouvelles tentatives
+
+    ouvrir() ouvre le flux et retourne un itérable de fragments. Chaque
+    tentative passe par le limiteur de débit ; une erreur n'est retentée que si
+    aucun fragment n'a encore été transmis (le texte déjà envoyé ne peut pas
+    être repris).
+    """
+    tentative = 0
+    while True:
+        transmis = False
+        try:
+            with limiteur_api(provider, api_key, user_id):
+                for fragment in ouvrir():
+                    transmis = True
+                    yield fragment
+            return
+        except Exception as e:
+            if transmis or not _nouvelle_tentative(provider, e, tentative):
+                raise
+            tentative += 1
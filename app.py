@@ -1,53 +1,107 @@
 import os
+import io
 import csv
+import json
 import random
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify,
+                   Response, stream_with_context)
 from werkzeug.security import generate_password_hash, check_password_hash
-from PyPDF2 import PdfReader
 
 # Importer la configuration
+import config
 from config import API_PROVIDER, ANTHROPIC_API_KEY, GOOGLE_API_KEY, OPENAI_API_KEY, MODELS
 
 # Importer les fonctions de la base de données
 from database import (
     init_database, get_user_by_username, create_user,
-    get_all_decks, get_user_decks, get_deck_by_name, create_deck,
-    get_flashcards_by_deck, create_flashcard,
+    get_all_decks, get_user_decks, get_deck_by_name, get_user_deck_by_name, create_deck,
+    create_flashcards_bulk,
     get_all_user_progress, update_progress, get_user_progress,
     get_user_prompt, save_user_prompt, get_user_statistics,
     get_user_flashcard_counts, create_folder, get_user_folders,
     get_decks_in_folder, move_deck_to_folder, get_folder_statistics,
     get_deck_statistics, rename_folder, delete_folder,
-    get_user_streak, update_daily_activity, get_yearly_activity,
+    get_user_streak_state, effective_streak, update_daily_activity, get_yearly_activity,
     get_leaderboard, toggle_leaderboard_visibility, can_see_leaderboard,
     get_show_in_leaderboard, get_user_security_question, verify_security_answer,
-    update_user_password
+    update_user_password, get_next_card, get_due_queue, get_card_with_progress,
+    record_review, review_transaction, get_folder_tree_statistics, delete_pdf_cache,
+    get_scheduler_preset, get_scheduler_config, save_scheduler_preset, delete_scheduler_preset,
+    get_user_scheduler_configs, get_progress_for_simulation, get_latest_activity
 )
-
-# Importer l'algorithme Anki
-from anki_algorithm import AnkiCard, calculate_next_review
-from datetime import datetime
+from anki_algorithm import simulate
+from datetime import datetime, date, timedelta
+from werkzeug.http import is_resource_modified
+from import_decks import import_flashcards, delimiter_for_filename
+from pdf_extraction import extraire_texte, extraire_pages, hash_pdf
+from jobs import JobError, register_handler, submit_job, job_status, start_workers
+from api_clients import (
+    get_api_client, get_gemini_model, gemini_request_options, call_with_retries,
+    stream_with_retries
+)
+from generation_cache import generation_cache_key, get_cached_generation, cache_generation
+from rate_limiter import configure_rate_limiter, rate_limiter_metrics
+from near_duplicates import normaliser_question, index_deck, filter_near_duplicates, relevant_questions
 
 app = Flask(__name__)
 app.secret_key = 'CLE_SECRETE_A_CHANGER'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Limites de débit des API surchargées dans config.py (voir rate_limiter.py)
+if hasattr(config, 'API_RATE_LIMITS'):
+    configure_rate_limiter(limits=config.API_RATE_LIMITS)
+
 # Dossier pour les flashcards CSV (pour la génération depuis PDF)
 FLASHCARDS_DIR = os.path.join(BASE_DIR, 'flashcards_data')
 os.makedirs(FLASHCARDS_DIR, exist_ok=True)
 
+# Nombre de cartes préchargées dans la file d'une session d'étude
+TAILLE_FILE_REVISION = 20
+
+# Génération par segments : tailles minimale et maximale d'un segment
+# (caractères) et nombre maximal d'appels simultanés à l'API
+TAILLE_SEGMENT_MIN = 12000
+TAILLE_SEGMENT_MAX = 50000
+APPELS_SIMULTANES_GENERATION = 4
+
+# Nombre maximal de questions existantes du deck citées dans le prompt
+QUESTIONS_EXISTANTES_PROMPT = 50
+
+# Périodes du classement (paramètre de la page -> période de get_leaderboard)
+PERIODES_CLASSEMENT = {'total': 'all', 'semaine': 'week', 'mois': 'month'}
+
+# Durée (secondes) pendant laquelle le streak affiché est lu depuis la session
+STREAK_CACHE_SECONDES = 300
+
+# Temps de réponse maximal enregistré dans le journal (onglet oublié ouvert, etc.)
+TEMPS_REPONSE_MAX_MS = 10 * 60 * 1000
+
 # Initialiser la base de données au démarrage
 init_database()
 
 # --- CONTEXT PROCESSOR POUR LE STREAK ---
 @app.context_processor
 def inject_streak():
-    """Injecte le streak dans tous les templates"""
-    if 'user_id' in session:
-        streak = get_user_streak(session['user_id'])
-        return dict(streak=streak)
-    return dict(streak=0)
+    """Injecte le streak dans tous les templates
+
+    L'état du streak (compteur et dernier jour validé) est gardé dans la
+    session pendant STREAK_CACHE_SECONDES : l'affichage d'une page ne coûte
+    pas de connexion à la base. Un streak interrompu est calculé à la lecture
+    (effective_streak), sans jamais écrire.
+    """
+    if 'user_id' not in session:
+        return dict(streak=0)
+
+    etat = session.get('streak')
+    maintenant = datetime.now().timestamp()
+    if (not etat or etat['user_id'] != session['user_id']
+            or maintenant - etat['lu'] > STREAK_CACHE_SECONDES):
+        streak_count, last_streak_date = get_user_streak_state(session['user_id'])
+        etat = {'user_id': session['user_id'], 'count': streak_count,
+                'last': last_streak_date, 'lu': maintenant}
+        session['streak'] = etat
+    return dict(streak=effective_streak(etat['count'], etat['last']))
 
 # --- PROMPT PAR DÉFAUT POUR LA GÉNÉRATION DE FLASHCARDS ---
 DEFAULT_PROMPT_TEMPLATE = """Tu es un assistant pédagogique. À partir du texte suivant, génère EXACTEMENT {nb_flashcards} flashcards de qualité pour aider l'étudiant à mémoriser les concepts clés.
@@ -113,34 +167,33 @@ def login_required(f):
 def extraire_texte_pdf(pdf_path, page_range=None):
     """Extrait le texte d'un fichier PDF
 
+    Le texte de chaque page est mis en cache (voir pdf_extraction) : seules les
+    pages jamais extraites de ce contenu sont analysées par PyPDF2.
+
     Args:
         pdf_path: Chemin vers le fichier PDF
         page_range: Tuple (page_debut, page_fin) pour extraire seulement certaines pages (1-indexed)
                    Si None, extrait toutes les pages
     """
     try:
-        reader = PdfReader(pdf_path)
-        texte_complet = ""
-
-        # Déterminer les pages à extraire
-        if page_range:
-            page_debut, page_fin = page_range
-            # Convertir en 0-indexed et s'assurer que c'est dans les limites
-            page_debut = max(0, page_debut - 1)
-            page_fin = min(len(reader.pages), page_fin)
-            pages_to_extract = range(page_debut, page_fin)
-        else:
-            pages_to_extract = range(len(reader.pages))
+        return extraire_texte(pdf_path, page_range)
+    except Exception as e:
+        print(f"Erreur lors de l'extraction du PDF: {e}")
+        return None
 
-        for i in pages_to_extract:
-            texte_complet += reader.pages[i].extract_text() + "\n"
+def extraire_pages_pdf(pdf_path, page_range=None):
+    """Extrait le texte d'un fichier PDF page par page (None en cas d'erreur)
 
-        return texte_complet
+    Voir extraire_texte_pdf pour les paramètres.
+    """
+    try:
+        return extraire_pages(pdf_path, page_range)
     except Exception as e:
         print(f"Erreur lors de l'extraction du PDF: {e}")
         return None
 
-def generer_flashcards_via_api(texte, nb_flashcards=10, prompt_template=None, existing_questions=None):
+def generer_flashcards_via_api(texte, nb_flashcards=10, prompt_template=None, existing_questions=None,
+                               max_chars=None, utiliser_cache=True, user_id=None, deck_id=None):
     """Génère des flashcards à partir du texte extrait en utilisant l'API configurée
 
     Args:
@@ -148,6 +201,11 @@ def generer_flashcards_via_api(texte, nb_flashcards=10, prompt_template=None, ex
         nb_flashcards: Nombre de flashcards à générer
         prompt_template: Template de prompt personnalisé (optionnel)
         existing_questions: Liste des questions déjà présentes dans le deck (optionnel)
+        max_chars: Longueur maximale du texte envoyé (par défaut selon nb_flashcards)
+        utiliser_cache: Si False, ignore la réponse en cache et rappelle l'API
+        user_id: Utilisateur à l'origine de l'appel (file équitable du limiteur de débit)
+        deck_id: Deck complété ; sans existing_questions, les questions du deck les
+            plus proches du texte sont ajoutées au prompt (voir near_duplicates)
     """
 
     print(f"🔍 Début génération de {nb_flashcards} flashcards avec {API_PROVIDER}")
@@ -158,7 +216,8 @@ def generer_flashcards_via_api(texte, nb_flashcards=10, prompt_template=None, ex
 
     # Adapter la limite de texte selon le nombre de flashcards demandées
     # Plus on veut de flashcards, plus on a besoin de texte
-    max_chars = min(8000 + (nb_flashcards * 100), 50000)
+    if max_chars is None:
+        max_chars = min(8000 + (nb_flashcards * 100), TAILLE_SEGMENT_MAX)
 
     # Formatter le prompt avec les variables
     # Utiliser replace() au lieu de format() pour éviter les erreurs
@@ -166,9 +225,12 @@ def generer_flashcards_via_api(texte, nb_flashcards=10, prompt_template=None, ex
     prompt = prompt_template.replace('{nb_flashcards}', str(nb_flashcards))
     prompt = prompt.replace('{texte}', texte[:max_chars])
 
+    if existing_questions is None and deck_id is not None:
+        existing_questions = relevant_questions(deck_id, texte[:max_chars], QUESTIONS_EXISTANTES_PROMPT)
+
     # Si des questions existent déjà, ajouter une instruction pour éviter les doublons
     if existing_questions and len(existing_questions) > 0:
-        questions_list = "\n".join([f"- {q}" for q in existing_questions[:50]])  # Limiter à 50 questions
+        questions_list = "\n".join([f"- {q}" for q in existing_questions[:QUESTIONS_EXISTANTES_PROMPT]])
         prompt += f"""
 
 IMPORTANT - Questions déjà existantes dans ce deck:
@@ -182,6 +244,16 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
     print(f"📝 Utilisation du prompt {'personnalisé' if prompt_template != DEFAULT_PROMPT_TEMPLATE else 'par défaut'}")
     print(f"📏 Texte limité à {max_chars} caractères pour {nb_flashcards} flashcards")
 
+    # Même demande déjà servie par l'API : réponse en cache (voir generation_cache)
+    cle_cache = generation_cache_key('flashcards', API_PROVIDER, MODELS.get(API_PROVIDER),
+                                     prompt_template, texte[:max_chars], nb_flashcards,
+                                     existing_questions)
+    if utiliser_cache:
+        flashcards = get_cached_generation(cle_cache)
+        if flashcards is not None:
+            print(f"⚡ {len(flashcards)} flashcards servies depuis le cache")
+            return flashcards, None
+
     # Calculer max_tokens en fonction du nombre de flashcards
     # Environ 100 tokens par flashcard (pour gérer LaTeX et explications) + marge de sécurité
     max_tokens = max(2000, nb_flashcards * 100 + 1000)
@@ -189,57 +261,49 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
     try:
         if API_PROVIDER == 'claude':
             # Utiliser l'API Claude (Anthropic)
-            from anthropic import Anthropic
-            import httpx
-
             if ANTHROPIC_API_KEY == 'votre-cle-api-claude-ici':
                 print("⚠️  Clé API Claude non configurée - Génération de flashcards d'exemple")
                 return generer_flashcards_exemple(nb_flashcards), None
 
             print(f"📡 Appel API Claude ({MODELS['claude']}) - max_tokens: {max_tokens}")
-            # Créer un client httpx sans proxy pour éviter le bug 'proxies'
-            http_client = httpx.Client()
-            client = Anthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client)
-            response = client.messages.create(
+            client = get_api_client('claude')
+            response = call_with_retries('claude', ANTHROPIC_API_KEY, lambda: client.messages.create(
                 model=MODELS['claude'],
                 max_tokens=max_tokens,
                 messages=[{
                     "role": "user",
                     "content": prompt
                 }]
-            )
+            ), user_id)
             contenu = response.content[0].text
 
         elif API_PROVIDER == 'gemini':
             # Utiliser l'API Gemini (Google)
-            import google.generativeai as genai
-
             if GOOGLE_API_KEY == 'votre-cle-api-gemini-ici':
                 print("⚠️  Clé API Gemini non configurée - Génération de flashcards d'exemple")
                 return generer_flashcards_exemple(nb_flashcards), None
 
             print(f"📡 Appel API Gemini ({MODELS['gemini']}) - max_tokens: {max_tokens}")
-            genai.configure(api_key=GOOGLE_API_KEY)
-            model = genai.GenerativeModel(MODELS['gemini'])
-            response = model.generate_content(
+            genai = get_api_client('gemini')
+            model = get_gemini_model(MODELS['gemini'])
+            response = call_with_retries('gemini', GOOGLE_API_KEY, lambda: model.generate_content(
                 prompt,
                 generation_config=genai.types.GenerationConfig(
                     max_output_tokens=max_tokens,
-                )
-            )
+                ),
+                request_options=gemini_request_options()
+            ), user_id)
             contenu = response.text
 
         elif API_PROVIDER == 'openai':
             # Utiliser l'API OpenAI
-            from openai import OpenAI
-
             if OPENAI_API_KEY == 'votre-cle-api-openai-ici':
                 print("⚠️  Clé API OpenAI non configurée - Génération de flashcards d'exemple")
                 return generer_flashcards_exemple(nb_flashcards), None
 
             print(f"📡 Appel API OpenAI ({MODELS['openai']}) - max_tokens: {max_tokens}")
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            response = client.chat.completions.create(
+            client = get_api_client('openai')
+            response = call_with_retries('openai', OPENAI_API_KEY, lambda: client.chat.completions.create(
                 model=MODELS['openai'],
                 messages=[
                     {"role": "system", "content": "Tu es un assistant pédagogique expert en création de flashcards."},
@@ -247,7 +311,7 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
                 ],
                 temperature=0.7,
                 max_tokens=max_tokens
-            )
+            ), user_id)
             contenu = response.choices[0].message.content
         else:
             return None, f"Provider API non reconnu: {API_PROVIDER}"
@@ -276,6 +340,7 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
             flashcards = flashcards[:nb_flashcards]
 
         print(f"✅ {len(flashcards)} flashcards générées avec succès")
+        cache_generation(cle_cache, 'flashcards', flashcards)
         return flashcards, None
 
     except Exception as e:
@@ -285,6 +350,170 @@ NE PAS répéter ou paraphraser ces questions existantes!"""
         return None, f"Erreur lors de la génération ({API_PROVIDER}): {str(e)}"
 
 
+def decouper_en_segments(pages, nb_segments, taille_max=None):
+    """Découpe le texte d'un document en segments contigus de tailles voisines
+
+    Les coupures se font entre les pages ; une page plus longue qu'un segment
+    est coupée entre ses lignes (et une ligne trop longue, en morceaux).
+
+    Args:
+        pages: Liste des textes des pages, dans l'ordre
+        nb_segments: Nombre de segments souhaité
+        taille_max: Taille maximale d'un segment (caractères), respectée en
+                    ouvrant un segment de plus si nécessaire (doit valoir au
+                    moins total / nb_segments)
+
+    Returns:
+        Liste de textes (sans segment vide)
+    """
+    total = sum(len(page) for page in pages)
+    if total == 0 or nb_segments <= 1:
+        return ['\n'.join(pages)] if total else []
+
+    cible = total / nb_segments
+    unites = []
+    for page in pages:
+        if len(page) <= cible:
+            unites.append(page)
+            continue
+        # Page trop longue : regrouper ses lignes en blocs d'au plus une cible
+        bloc = []
+        taille_bloc = 0
+        largeur = max(1, int(cible))
+        lignes = [ligne[i:i + largeur]
+                  for ligne in page.split('\n') for i in range(0, max(1, len(ligne)), largeur)]
+        for ligne in lignes:
+            if bloc and taille_bloc + len(ligne) > cible:
+                unites.append('\n'.join(bloc))
+                bloc, taille_bloc = [], 0
+            bloc.append(ligne)
+            taille_bloc += len(ligne) + 1
+        unites.append('\n'.join(bloc))
+
+    # Chaque unité rejoint le segment qui contient son milieu, ou le suivant
+    # si elle ferait dépasser taille_max au segment courant
+    segments = [[]]
+    taille = 0
+    position = 0
+    for unite in unites:
+        index = min(nb_segments - 1, int((position + len(unite) / 2) / cible))
+        if segments[-1] and (index >= len(segments)
+                             or (taille_max and taille + len(unite) > taille_max)):
+            segments.append([])
+            taille = 0
+        segments[-1].append(unite)
+        taille += len(unite) + 1
+        position += len(unite)
+
+    return ['\n'.join(segment) for segment in segments]
+
+
+def repartir_budget(tailles, nb_flashcards):
+    """Répartit le nombre de flashcards proportionnellement à la taille des segments
+
+    Méthode du plus fort reste, avec au moins une carte par segment. S'il y a
+    moins de cartes que de segments, la carte k va au segment qui contient la
+    position (k + 1/2) * total / nb_flashcards du document : les cartes restent
+    réparties sur tout le document et certains segments n'en reçoivent aucune.
+    """
+    if nb_flashcards < len(tailles):
+        from bisect import bisect_right
+        from itertools import accumulate
+
+        fins = list(accumulate(tailles))
+        budget = [0] * len(tailles)
+        for k in range(nb_flashcards):
+            budget[bisect_right(fins, (k + 0.5) * fins[-1] / nb_flashcards)] += 1
+        return budget
+
+    reste_a_repartir = nb_flashcards - len(tailles)
+    total = sum(tailles)
+    parts = [reste_a_repartir * taille / total for taille in tailles]
+    budget = [1 + int(part) for part in parts]
+
+    manquant = nb_flashcards - sum(budget)
+    par_reste = sorted(range(len(tailles)), key=lambda i: parts[i] - int(parts[i]), reverse=True)
+    for i in par_reste[:manquant]:
+        budget[i] += 1
+    return budget
+
+
+def generer_flashcards_par_segments(pages, nb_flashcards=10, prompt_template=None, existing_questions=None,
+                                    utiliser_cache=True, user_id=None, deck_id=None):
+    """Génère des flashcards couvrant tout le document (map-reduce)
+
+    Le texte est découpé en segments (voir decouper_en_segments), chaque segment
+    reçoit une part des cartes proportionnelle à sa taille et les segments sont
+    envoyés en parallèle à l'API (au plus APPELS_SIMULTANES_GENERATION appels).
+    Les résultats sont fusionnés dans l'ordre du document et dédoublonnés.
+
+    Il y a autant de segments que d'appels simultanés tant que les segments ne
+    dépassent pas TAILLE_SEGMENT_MAX : le temps de génération reste celui d'un
+    appel. Au-delà, le nombre de segments augmente pour qu'aucun ne dépasse
+    TAILLE_SEGMENT_MAX, quel que soit le nombre de cartes demandé ; les
+    segments qui ne reçoivent aucune carte ne sont pas envoyés. Un document
+    plus court que TAILLE_SEGMENT_MIN est traité en un seul appel, comme avant.
+
+    Args:
+        pages: Liste des textes des pages du PDF
+        nb_flashcards: Nombre total de flashcards à générer
+        prompt_template: Template de prompt personnalisé (optionnel)
+        existing_questions: Liste des questions déjà présentes dans le deck (optionnel)
+        utiliser_cache: Si False, ignore les réponses en cache
+        user_id: Utilisateur à l'origine de la génération (limiteur de débit)
+        deck_id: Deck complété (questions existantes choisies par segment)
+
+    Returns:
+        Tuple (flashcards, erreur) comme generer_flashcards_via_api
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    total = sum(len(page) for page in pages)
+    nb_segments = max(-(-total // TAILLE_SEGMENT_MAX),
+                      min(APPELS_SIMULTANES_GENERATION, -(-total // TAILLE_SEGMENT_MIN)))
+    if nb_segments <= 1 or nb_flashcards < 1:
+        return generer_flashcards_via_api(
+            ''.join(page + '\n' for page in pages), nb_flashcards, prompt_template, existing_questions,
+            utiliser_cache=utiliser_cache, user_id=user_id, deck_id=deck_id
+        )
+
+    segments = decouper_en_segments(pages, nb_segments, TAILLE_SEGMENT_MAX)
+    budget = repartir_budget([len(segment) for segment in segments], nb_flashcards)
+    print(f"🧩 Génération par segments: {len(segments)} segments, cartes par segment: {budget}")
+    segments, budget = zip(*[(segment, n) for segment, n in zip(segments, budget) if n > 0])
+
+    with ThreadPoolExecutor(max_workers=min(APPELS_SIMULTANES_GENERATION, len(segments))) as executor:
+        resultats = list(executor.map(
+            lambda args: generer_flashcards_via_api(args[0], args[1], prompt_template,
+                                                    existing_questions, max_chars=len(args[0]),
+                                                    utiliser_cache=utiliser_cache, user_id=user_id,
+                                                    deck_id=deck_id),
+            zip(segments, budget)
+        ))
+
+    # Fusion dans l'ordre du document, sans doublons (entre segments et avec le deck)
+    vues = {normaliser_question(q) for q in (existing_questions or [])}
+    flashcards = []
+    erreurs = []
+    for cartes, erreur in resultats:
+        if erreur:
+            erreurs.append(erreur)
+            continue
+        for carte in cartes:
+            cle = normaliser_question(carte['question'])
+            if cle and cle not in vues:
+                vues.add(cle)
+                flashcards.append(carte)
+
+    if erreurs:
+        print(f"⚠️  {len(erreurs)} segment(s) en erreur sur {len(segments)}")
+    if not flashcards:
+        return None, erreurs[0] if erreurs else "Aucune flashcard générée"
+
+    print(f"✅ {len(flashcards)} flashcards après fusion des segments")
+    return flashcards[:nb_flashcards], None
+
+
 def generer_flashcards_exemple(nb_flashcards=10):
     """Génère des flashcards d'exemple pour tester le système (sans API)"""
     exemples = [
@@ -314,78 +543,140 @@ def generer_flashcards_exemple(nb_flashcards=10):
     return exemples[:min(nb_flashcards, len(exemples))]
 
 def sauvegarder_flashcards_db(flashcards, nom_deck, user_id):
-    """Sauvegarde les flashcards générées dans la base de données pour un utilisateur"""
+    """Sauvegarde les flashcards générées dans la base de données pour un utilisateur
+
+    Returns:
+        Nombre de flashcards ajoutées (doublons et quasi-doublons écartés), ou None en cas d'erreur
+    """
     try:
-        # Créer ou récupérer le deck pour cet utilisateur
+        # Récupérer le deck de cet utilisateur (créé seulement s'il n'existe pas)
         deck_id = create_deck(nom_deck, user_id)
 
-        # Ajouter les flashcards
-        for card in flashcards:
-            create_flashcard(deck_id, card['question'], card['reponse'])
+        # Écarter les reformulations de questions déjà présentes (ou générées deux fois)
+        flashcards, doublons = filter_near_duplicates(deck_id, flashcards)
+        if doublons:
+            print(f"♻️  {len(doublons)} quasi-doublon(s) écarté(s)")
 
-        return True
+        # Ajouter les flashcards en une seule transaction
+        result = create_flashcards_bulk(
+            deck_id, ((card['question'], card['reponse']) for card in flashcards)
+        )
+        print(f"✅ {result['inserted']} flashcard(s) ajoutée(s), {result['skipped']} doublon(s) ignoré(s)")
+
+        return result['inserted']
     except Exception as e:
         print(f"Erreur lors de la sauvegarde dans la DB: {e}")
-        return False
+        return None
 
 # --- GESTION DES FLASHCARDS ---
 
+def formater_carte(carte):
+    """Convertit une ligne carte + progression en dictionnaire pour les templates"""
+    if carte is None:
+        return None
+
+    return {
+        'id': carte['id'],
+        'question': carte['question'],
+        'reponse': carte['answer'],
+        'ease_factor': carte['ease_factor'],
+        'interval': carte['interval'],
+        'due_date': carte['due_date'],
+        'step': carte['step'],
+        'is_learning': carte['is_learning'],
+        'repetitions': carte['repetitions']
+    }
+
 def piocher_carte(deck_name, user_id):
     """Pioche une carte selon l'algorithme Anki (cartes dues en priorité)"""
     deck = get_deck_by_name(deck_name)
     if not deck:
         return None
 
-    # Récupérer toutes les flashcards avec leur progression
-    cartes_progress = get_all_user_progress(user_id, deck['id'])
+    return formater_carte(get_next_card(user_id, deck['id']))
+
+# --- SESSION D'ÉTUDE (FILE PRÉCHARGÉE) ---
+#
+# La file est stockée dans la session Flask sous la forme:
+#   {'deck': nom, 'deck_id': id, 'cartes': [ids...], 'apprentissage': [[id, due_iso], ...]}
+# 'cartes' est calculée une fois par get_due_queue; 'apprentissage' contient les
+# cartes notées pendant la session qui sont encore en phase d'apprentissage et
+# doivent revenir à leur échéance (1 min, 10 min...).
 
-    if not cartes_progress:
+def nouvelle_file_revision(deck_name, user_id):
+    """Crée la file de révision d'une session d'étude pour un deck"""
+    deck = get_deck_by_name(deck_name)
+    if not deck:
         return None
 
-    now = datetime.now()
+    return {
+        'deck': deck_name,
+        'deck_id': deck['id'],
+        'cartes': get_due_queue(user_id, deck['id'], TAILLE_FILE_REVISION),
+        'apprentissage': []
+    }
 
-    # Filtrer les cartes à réviser
-    cartes_a_reviser = []
-    for carte in cartes_progress:
-        # Nouvelle carte (pas de progression)
-        if carte['due_date'] is None:
-            cartes_a_reviser.append((carte, 0))  # Priorité max
+def piocher_carte_session(deck_name, user_id):
+    """Pioche la carte suivante dans la file de la session d'étude
+
+    Ordre: cartes en apprentissage redevenues dues, puis la file préchargée.
+    La file n'est recalculée que lorsqu'elle est vide.
+    """
+    file_revision = session.get('file_revision')
+    if not file_revision or file_revision.get('deck') != deck_name:
+        file_revision = nouvelle_file_revision(deck_name, user_id)
+        if file_revision is None:
+            session.pop('file_revision', None)
+            return None
+
+    now = datetime.now()
+    carte = None
+    while carte is None:
+        apprentissage = sorted(file_revision['apprentissage'], key=lambda x: x[1])
+        if apprentissage and datetime.fromisoformat(apprentissage[0][1]) <= now:
+            # Une carte en apprentissage est redevenue due pendant la session
+            flashcard_id = apprentissage[0][0]
+            file_revision['apprentissage'].remove(apprentissage[0])
+        elif file_revision['cartes']:
+            flashcard_id = file_revision['cartes'].pop(0)
         else:
-            # Carte existante
-            due_date = datetime.fromisoformat(carte['due_date'])
-            if due_date <= now:
-                # Carte due
-                delay = (now - due_date).total_seconds() / 3600  # En heures
-                cartes_a_reviser.append((carte, delay))
-
-    # S'il n'y a pas de cartes à réviser, on prend les prochaines cartes
-    if not cartes_a_reviser:
-        for carte in cartes_progress:
-            if carte['due_date'] is not None:
-                due_date = datetime.fromisoformat(carte['due_date'])
-                delay = -(due_date - now).total_seconds() / 3600  # Négatif = futur
-                cartes_a_reviser.append((carte, delay))
-
-    if not cartes_a_reviser:
-        return None
+            # File épuisée: la recalculer (sans les cartes déjà suivies en apprentissage)
+            en_apprentissage = {x[0] for x in apprentissage}
+            file_revision['cartes'] = [
+                fid for fid in get_due_queue(user_id, file_revision['deck_id'], TAILLE_FILE_REVISION)
+                if fid not in en_apprentissage
+            ]
+            if not file_revision['cartes']:
+                # Rien n'est dû: montrer la prochaine carte à venir
+                if apprentissage:
+                    flashcard_id = apprentissage[0][0]
+                    file_revision['apprentissage'].remove(apprentissage[0])
+                else:
+                    session['file_revision'] = file_revision
+                    return piocher_carte(deck_name, user_id)
+            else:
+                continue
 
-    # Trier par priorité (nouvelles cartes d'abord, puis cartes en retard)
-    cartes_a_reviser.sort(key=lambda x: x[1], reverse=True)
+        # La carte peut avoir été supprimée depuis le calcul de la file
+        carte = get_card_with_progress(user_id, flashcard_id)
 
-    # Prendre la carte la plus prioritaire
-    carte = cartes_a_reviser[0][0]
+    session['file_revision'] = file_revision
+    return formater_carte(carte)
 
-    return {
-        'id': carte['id'],
-        'question': carte['question'],
-        'reponse': carte['answer'],
-        'ease_factor': carte['ease_factor'],
-        'interval': carte['interval'],
-        'due_date': carte['due_date'],
-        'step': carte['step'],
-        'is_learning': carte['is_learning'],
-        'repetitions': carte['repetitions']
-    }
+def enregistrer_vote_session(deck_name, user_id, flashcard_id, rating, elapsed_ms=None):
+    """Enregistre une réponse et met à jour la file de la session d'étude"""
+    new_card = record_review(user_id, flashcard_id, rating, elapsed_ms)
+    # Le streak a pu changer: le relire au prochain affichage
+    session.pop('streak', None)
+
+    file_revision = session.get('file_revision')
+    if file_revision and file_revision.get('deck') == deck_name:
+        # Retirer la carte de la file (vote depuis un autre onglet, par ex.)
+        file_revision['cartes'] = [fid for fid in file_revision['cartes'] if fid != flashcard_id]
+        file_revision['apprentissage'] = [x for x in file_revision['apprentissage'] if x[0] != flashcard_id]
+        if new_card.is_learning:
+            file_revision['apprentissage'].append([flashcard_id, new_card.due_date.isoformat()])
+        session['file_revision'] = file_revision
 
 # --- ROUTES AUTHENTIFICATION ---
 
@@ -628,34 +919,50 @@ def fiches():
 
 # --- ROUTES FLASHCARDS ---
 
-def build_folder_tree(user_id, parent_id=None):
-    """Construit récursivement l'arborescence des dossiers avec leurs statistiques"""
-    folders = get_user_folders(user_id, parent_id)
-    result = []
-
-    for folder in folders:
-        folder_dict = {
-            'id': folder['id'],
-            'name': folder['name'],
-            'type': 'folder',
-            'stats': get_folder_statistics(user_id, folder['id']),
-            'children': build_folder_tree(user_id, folder['id']),
-            'decks': []
-        }
-
-        # Récupérer les decks dans ce dossier
-        decks = get_decks_in_folder(user_id, folder['id'])
-        for deck in decks:
-            folder_dict['decks'].append({
-                'id': deck['id'],
-                'name': deck['name'],
-                'type': 'deck',
-                'stats': get_deck_statistics(user_id, deck['id'])
-            })
+def build_folder_tree(user_id):
+    """Construit l'arborescence des dossiers avec leurs statistiques
+
+    Toutes les statistiques viennent d'une seule requête agrégée,
+    l'arbre est ensuite assemblé en mémoire.
+
+    Returns:
+        Tuple (folder_tree, root_decks, global_stats)
+    """
+    folders = {}
+    decks = []
+    for row in get_folder_tree_statistics(user_id):
+        stats = {'new': row['new'], 'relearn': row['relearn'], 'review': row['review']}
+        if row['kind'] == 'folder':
+            folders[row['id']] = {
+                'id': row['id'],
+                'name': row['name'],
+                'type': 'folder',
+                'stats': stats,
+                'children': [],
+                'decks': [],
+                'parent_id': row['parent_id']
+            }
+        else:
+            decks.append((row, stats))
 
-        result.append(folder_dict)
+    # Rattacher les decks à leur dossier (ou à la racine), du plus récent au plus ancien
+    root_decks = []
+    global_stats = {'new': 0, 'relearn': 0, 'review': 0}
+    decks.sort(key=lambda x: x[0]['created_at'] or '', reverse=True)
+    for row, stats in decks:
+        deck_dict = {'id': row['id'], 'name': row['name'], 'type': 'deck', 'stats': stats}
+        parent = folders.get(row['parent_id'])
+        (parent['decks'] if parent else root_decks).append(deck_dict)
+        for key in global_stats:
+            global_stats[key] += stats[key]
 
-    return result
+    # Rattacher les dossiers à leur parent, triés par nom
+    folder_tree = []
+    for folder in sorted(folders.values(), key=lambda x: x['name']):
+        parent = folders.get(folder.pop('parent_id'))
+        (parent['children'] if parent else folder_tree).append(folder)
+
+    return folder_tree, root_decks, global_stats
 
 
 @app.route('/flashcards')
@@ -664,22 +971,9 @@ def flashcards_menu():
     """Affiche la liste des decks de l'utilisateur avec arborescence"""
     user_id = session.get('user_id')
 
-    # Construire l'arborescence des dossiers
-    folder_tree = build_folder_tree(user_id)
-
-    # Récupérer les decks à la racine (sans dossier)
-    root_decks = get_decks_in_folder(user_id, None)
-    root_decks_list = []
-    for deck in root_decks:
-        root_decks_list.append({
-            'id': deck['id'],
-            'name': deck['name'],
-            'type': 'deck',
-            'stats': get_deck_statistics(user_id, deck['id'])
-        })
-
-    # Récupérer les statistiques globales
-    global_stats = get_user_flashcard_counts(user_id)
+    # Construire l'arborescence des dossiers, les decks à la racine et les
+    # statistiques globales
+    folder_tree, root_decks_list, global_stats = build_folder_tree(user_id)
 
     return render_template('flashcards_menu.html',
                          folder_tree=folder_tree,
@@ -737,6 +1031,89 @@ def api_move_deck(deck_id):
     return jsonify({'success': True})
 
 
+@app.route('/api/planification', methods=['GET', 'POST', 'DELETE'])
+@app.route('/api/decks/<int:deck_id>/planification', methods=['GET', 'POST', 'DELETE'])
+@login_required
+def api_scheduler_preset(deck_id=None):
+    """API des réglages de l'algorithme de révision, pour un deck ou pour tous les decks
+
+    GET renvoie les réglages enregistrés et la configuration effective, POST
+    enregistre {"settings": {...}} (étapes d'apprentissage, intervalles...),
+    DELETE revient aux réglages hérités.
+    """
+    user_id = session['user_id']
+    if deck_id is not None and deck_id not in {deck['id'] for deck in get_user_decks(user_id)}:
+        return jsonify({'success': False, 'error': 'Deck introuvable'}), 404
+
+    if request.method == 'POST':
+        settings = (request.get_json() or {}).get('settings')
+        if not isinstance(settings, dict):
+            return jsonify({'success': False, 'error': 'Paramètre settings manquant'}), 400
+        try:
+            save_scheduler_preset(user_id, settings, deck_id)
+        except ValueError as e:
+            print(f"❌ Réglages refusés: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    elif request.method == 'DELETE':
+        delete_scheduler_preset(user_id, deck_id)
+
+    return jsonify({
+        'success': True,
+        'settings': get_scheduler_preset(user_id, deck_id),
+        'config': get_scheduler_config(user_id, deck_id).to_dict()
+    })
+
+
+def tache_prevision(user_id, params, progress):
+    """Tâche de fond : prévision de la charge de révisions (simulation des prochains jours)
+
+    Sur un gros historique, 365 jours et 50 simulations demandent plusieurs
+    secondes : trop pour le temps d'une requête.
+    """
+    progress("Simulation des révisions")
+    user_config, deck_configs = get_user_scheduler_configs(user_id)
+    prevision = simulate(get_progress_for_simulation(user_id), days=params['jours'],
+                         runs=params['simulations'], config=user_config, deck_configs=deck_configs)
+
+    noms = {deck['id']: deck['name'] for deck in get_user_decks(user_id)}
+    return {
+        'dates': prevision['dates'],
+        'total': prevision['total'],
+        'pic': prevision['peak'],
+        'decks': [{'deck_id': deck_id, 'nom': noms.get(deck_id), 'charge': charge}
+                  for deck_id, charge in prevision['decks'].items()],
+        'dossiers': [{'folder_id': folder_id, 'charge': charge}
+                     for folder_id, charge in prevision['folders'].items()]
+    }
+
+
+register_handler('prevision_charge', tache_prevision)
+
+
+@app.route('/api/prevision')
+@login_required
+def api_review_forecast():
+    """API de prévision de la charge de révisions (simulation des prochains jours)
+
+    Paramètres: jours (1 à 365, 30 par défaut), simulations (1 à 50, 10 par défaut)
+
+    La simulation tourne en tâche de fond : la réponse (202) donne l'URL de
+    suivi de la tâche, dont le résultat contient dates, total, pic, decks et
+    dossiers.
+    """
+    user_id = session['user_id']
+    jours = min(max(request.args.get('jours', 30, type=int), 1), 365)
+    simulations = min(max(request.args.get('simulations', 10, type=int), 1), 50)
+
+    job_id = submit_job(user_id, 'prevision_charge', {'jours': jours, 'simulations': simulations})
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('api_job_status', job_id=job_id)
+    }), 202
+
+
 @app.route('/flashcards/play')
 @login_required
 def flashcards_play():
@@ -747,7 +1124,9 @@ def flashcards_play():
         return redirect(url_for('flashcards_menu'))
 
     user_id = session.get('user_id')
-    carte = piocher_carte(deck_name, user_id)
+    # Nouvelle session d'étude: (re)calculer la file préchargée
+    session.pop('file_revision', None)
+    carte = piocher_carte_session(deck_name, user_id)
     return render_template('flashcards.html', page='flashcards', carte=carte, current_deck=deck_name)
 
 @app.route('/flashcards/vote')
@@ -758,60 +1137,117 @@ def vote_card():
     deck_name = request.args.get('deck')
     flashcard_id = request.args.get('flashcard_id')
     rating = request.args.get('rating')  # 0=Again, 1=Hard, 2=Good, 3=Easy
+    elapsed_ms = request.args.get('elapsed', type=int)  # Temps de réponse mesuré par le navigateur
     user_id = session.get('user_id')
 
-    if flashcard_id and deck_name and rating is not None:
-        flashcard_id = int(flashcard_id)
-        rating = int(rating)
-
-        # Récupérer la progression actuelle
-        progress = get_user_progress(user_id, flashcard_id)
-
-        # Créer l'objet AnkiCard
-        if progress:
-            card = AnkiCard(
-                ease_factor=progress['ease_factor'],
-                interval=progress['interval'],
-                due_date=datetime.fromisoformat(progress['due_date']) if progress['due_date'] else None,
-                step=progress['step'],
-                is_learning=bool(progress['is_learning']),
-                repetitions=progress['repetitions']
-            )
-        else:
-            # Nouvelle carte
-            card = AnkiCard()
-
-        # Calculer le prochain intervalle avec l'algorithme Anki
-        new_card = calculate_next_review(card, rating)
-
-        # Sauvegarder la nouvelle progression
-        update_progress(
-            user_id,
-            flashcard_id,
-            new_card.ease_factor,
-            new_card.interval,
-            new_card.due_date.isoformat(),
-            new_card.step,
-            1 if new_card.is_learning else 0,
-            new_card.repetitions
-        )
+    if elapsed_ms is not None:
+        elapsed_ms = min(max(elapsed_ms, 0), TEMPS_REPONSE_MAX_MS)
 
-        # Mettre à jour l'activité quotidienne
-        # Vérifier si toutes les cartes dues sont terminées
-        stats = get_user_flashcard_counts(user_id)
-        all_completed = (stats['new'] == 0 and stats['relearn'] == 0 and stats['review'] == 0)
-        update_daily_activity(user_id, 1, all_completed)
-
-    # Piocher la carte suivante
-    nouvelle_carte = piocher_carte(deck_name, user_id)
+    # Réponse (progression, journal, activité, streak) et pioche de la carte
+    # suivante dans la file de la session : une seule transaction
+    with review_transaction():
+        if flashcard_id and deck_name and rating is not None:
+            enregistrer_vote_session(deck_name, user_id, int(flashcard_id), int(rating), elapsed_ms)
+        nouvelle_carte = piocher_carte_session(deck_name, user_id)
     return render_template('card_fragment.html', carte=nouvelle_carte, current_deck=deck_name)
 
 # --- ROUTE GENERATION FLASHCARDS DEPUIS PDF ---
 
+def tache_generation_flashcards(user_id, params, progress):
+    """Tâche de fond : extraction du PDF, appel à l'API de génération et sauvegarde
+
+    Lève JobError avec un message pour l'utilisateur en cas d'échec.
+    """
+    nom_deck = params['nom_deck']
+    page_range = tuple(params['page_range']) if params.get('page_range') else None
+
+    progress("Extraction du texte du PDF")
+    pages = extraire_pages_pdf(params['pdf_path'], page_range)
+    if not pages:
+        print("❌ Impossible d'extraire le texte")
+        raise JobError('Impossible d\'extraire le texte du PDF')
+
+    print(f"✅ Texte extrait ({len(pages)} pages, {sum(len(page) for page in pages)} caractères)")
+
+    # Vérifier si le deck existe déjà : ses questions les plus proches de chaque
+    # segment seront ajoutées au prompt pour éviter les doublons
+    deck_id = None
+    existing_deck = get_user_deck_by_name(nom_deck, user_id)
+    if existing_deck:
+        print(f"📚 Deck existant détecté - indexation des questions pour éviter les doublons")
+        deck_id = existing_deck['id']
+        print(f"📝 {index_deck(deck_id)} nouvelle(s) question(s) indexée(s)")
+
+    # Déterminer le prompt à utiliser (priorité: éphémère > personnalisé > défaut)
+    prompt_template = None
+    if params.get('ephemeral_prompt'):
+        prompt_template = params['ephemeral_prompt']
+        print("🎨 Utilisation du prompt éphémère")
+    else:
+        user_custom_prompt = get_user_prompt(user_id)
+        if user_custom_prompt:
+            prompt_template = user_custom_prompt
+            print("👤 Utilisation du prompt personnalisé de l'utilisateur")
+        else:
+            print("📋 Utilisation du prompt par défaut")
+
+    print(f"🤖 Génération des flashcards avec {API_PROVIDER}...")
+    progress(f"Génération des flashcards avec {API_PROVIDER}")
+
+    # Génération des flashcards
+    flashcards, error = generer_flashcards_par_segments(
+        pages, params['nb_flashcards'], prompt_template,
+        utiliser_cache=not params.get('ignorer_cache'), user_id=user_id, deck_id=deck_id
+    )
+    if error:
+        print(f"❌ Erreur de génération: {error}")
+        raise JobError(error)
+
+    if not flashcards:
+        print("❌ Aucune flashcard générée")
+        raise JobError('Aucune flashcard générée')
+
+    print(f"✅ {len(flashcards)} flashcards générées")
+    print(f"💾 Sauvegarde dans la base de données...")
+    progress("Sauvegarde des flashcards")
+
+    # Sauvegarde dans la base de données SQLite
+    nb_ajoutees = sauvegarder_flashcards_db(flashcards, nom_deck, user_id)
+    if nb_ajoutees is None:
+        print("❌ Erreur lors de la sauvegarde")
+        raise JobError('Erreur lors de la sauvegarde des flashcards')
+
+    print(f"✅ Sauvegarde réussie! Deck: {nom_deck}")
+
+    # Message selon si c'est avec API ou exemples
+    if GOOGLE_API_KEY == 'votre-cle-api-gemini-ici' and API_PROVIDER == 'gemini':
+        message_prefix = "⚠️ MODE TEST: "
+    else:
+        message_prefix = ""
+
+    message = f'{message_prefix}{nb_ajoutees} flashcards générées avec succès'
+    if nb_ajoutees < len(flashcards):
+        message += f' ({len(flashcards) - nb_ajoutees} doublon(s) écarté(s))'
+
+    return {
+        'message': message,
+        'deck_name': nom_deck,
+        'nb_flashcards': nb_ajoutees,
+        'api_provider': API_PROVIDER
+    }
+
+
+register_handler('generation_flashcards', tache_generation_flashcards)
+
+
 @app.route('/api/generer-flashcards', methods=['POST'])
 @login_required
 def generer_flashcards_from_pdf():
-    """Endpoint API pour générer des flashcards à partir d'un PDF"""
+    """Endpoint API pour générer des flashcards à partir d'un PDF
+
+    La génération s'exécute en tâche de fond : la réponse contient l'ID de la
+    tâche, dont l'avancement se suit avec /api/jobs/<job_id>.
+    """
     try:
         data = request.get_json()
         print(f"\n{'='*60}")
@@ -861,8 +1297,7 @@ def generer_flashcards_from_pdf():
                 'error': f'Fichier PDF non trouvé: {pdf_filename}'
             }), 404
 
-        print("✅ PDF trouvé, extraction du texte...")
-        # Extraction du texte avec sélection de pages optionnelle
+        # Sélection de pages optionnelle
         page_range = None
         if page_debut and page_fin:
             try:
@@ -873,83 +1308,22 @@ def generer_flashcards_from_pdf():
                     'error': 'Les numéros de page doivent être des entiers valides'
                 }), 400
 
-        texte = extraire_texte_pdf(pdf_path, page_range)
-        if not texte:
-            print("❌ Impossible d'extraire le texte")
-            return jsonify({
-                'success': False,
-                'error': 'Impossible d\'extraire le texte du PDF'
-            }), 500
-
-        print(f"✅ Texte extrait ({len(texte)} caractères)")
-
-        # Vérifier si le deck existe déjà et récupérer les questions existantes
-        existing_questions = []
-        existing_deck = get_deck_by_name(nom_deck)
-        if existing_deck and existing_deck['user_id'] == user_id:
-            print(f"📚 Deck existant détecté - récupération des questions pour éviter les doublons")
-            existing_cards = get_flashcards_by_deck(existing_deck['id'])
-            existing_questions = [card['question'] for card in existing_cards]
-            print(f"📝 {len(existing_questions)} questions existantes dans le deck")
-
-        # Déterminer le prompt à utiliser (priorité: éphémère > personnalisé > défaut)
-        prompt_template = None
-        if ephemeral_prompt:
-            prompt_template = ephemeral_prompt
-            print("🎨 Utilisation du prompt éphémère")
-        else:
-            user_custom_prompt = get_user_prompt(user_id)
-            if user_custom_prompt:
-                prompt_template = user_custom_prompt
-                print("👤 Utilisation du prompt personnalisé de l'utilisateur")
-            else:
-                print("📋 Utilisation du prompt par défaut")
-
-        print(f"🤖 Génération des flashcards avec {API_PROVIDER}...")
-
-        # Génération des flashcards
-        flashcards, error = generer_flashcards_via_api(texte, nb_flashcards, prompt_template, existing_questions)
-        if error:
-            print(f"❌ Erreur de génération: {error}")
-            return jsonify({
-                'success': False,
-                'error': error
-            }), 500
-
-        if not flashcards:
-            print("❌ Aucune flashcard générée")
-            return jsonify({
-                'success': False,
-                'error': 'Aucune flashcard générée'
-            }), 500
-
-        print(f"✅ {len(flashcards)} flashcards générées")
-        print(f"💾 Sauvegarde dans la base de données...")
-
-        # Sauvegarde dans la base de données SQLite
-        if sauvegarder_flashcards_db(flashcards, nom_deck, user_id):
-            print(f"✅ Sauvegarde réussie! Deck: {nom_deck}")
-            print(f"{'='*60}\n")
-
-            # Message selon si c'est avec API ou exemples
-            if GOOGLE_API_KEY == 'votre-cle-api-gemini-ici' and API_PROVIDER == 'gemini':
-                message_prefix = "⚠️ MODE TEST: "
-            else:
-                message_prefix = ""
+        job_id = submit_job(user_id, 'generation_flashcards', {
+            'pdf_path': pdf_path,
+            'page_range': page_range,
+            'nb_flashcards': nb_flashcards,
+            'nom_deck': nom_deck,
+            'ephemeral_prompt': ephemeral_prompt,
+            'ignorer_cache': bool(data.get('ignorer_cache'))
+        })
+        print(f"📨 Tâche de génération {job_id} en file d'attente")
+        print(f"{'='*60}\n")
 
-            return jsonify({
-                'success': True,
-                'message': f'{message_prefix}{len(flashcards)} flashcards générées avec succès',
-                'deck_name': nom_deck,
-                'nb_flashcards': len(flashcards),
-                'api_provider': API_PROVIDER
-            })
-        else:
-            print("❌ Erreur lors de la sauvegarde")
-            return jsonify({
-                'success': False,
-                'error': 'Erreur lors de la sauvegarde des flashcards'
-            }), 500
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('api_job_status', job_id=job_id)
+        }), 202
 
     except Exception as e:
         print(f"❌ ERREUR SERVEUR: {str(e)}")
@@ -960,6 +1334,40 @@ def generer_flashcards_from_pdf():
             'error': f'Erreur serveur: {str(e)}'
         }), 500
 
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job_status(job_id):
+    """API pour suivre l'avancement d'une tâche de fond"""
+    job = job_status(job_id)
+    if job is None or job['user_id'] != session.get('user_id'):
+        return jsonify({'success': False, 'error': 'Tâche introuvable'}), 404
+
+    response = {
+        'success': job['status'] != 'failed',
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'progress': job['progress']
+    }
+    if job['status'] == 'done':
+        response.update(job['result'] or {})
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/api/limites-api')
+@login_required
+def api_rate_limits():
+    """API des métriques du limiteur de débit (file d'attente, temps d'attente)
+
+    Les métriques portent sur les clés API et tous les utilisateurs : réservées
+    aux comptes listés dans config.API_METRICS_USERS.
+    """
+    if session.get('user') not in getattr(config, 'API_METRICS_USERS', ()):
+        print(f"⛔ Métriques du limiteur refusées à {session.get('user')}")
+        return jsonify({'success': False, 'error': 'Accès refusé'}), 403
+    return jsonify({'success': True, 'buckets': rate_limiter_metrics()})
+
 # --- ROUTES PARAMÈTRES ---
 
 @app.route('/parametres')
@@ -1007,90 +1415,18 @@ def prompt_settings():
 @app.route('/parametres/statistiques')
 @login_required
 def statistics():
-    """Page des statistiques de l'utilisateur"""
-    from datetime import datetime, date, timedelta
-    import calendar
+    """Page des statistiques de l'utilisateur
 
+    Le calendrier d'activité est dessiné dans le navigateur à partir de
+    /api/activite (voir api_activity_calendar).
+    """
     user_id = session.get('user_id')
     stats = get_user_statistics(user_id)
 
-    # Générer le calendrier annuel
-    year = datetime.now().year
-    activity_dict, max_cards = get_yearly_activity(user_id, year)
-
-    # Construire le calendrier par mois
-    calendar_data = []
-    for month in range(1, 13):
-        month_name = calendar.month_abbr[month]
-        # Obtenir le calendrier du mois (liste de semaines)
-        month_cal = calendar.monthcalendar(year, month)
-
-        weeks_data = []
-        today = date.today()
-        for week in month_cal:
-            week_data = []
-            for day_num in week:
-                if day_num == 0:  # Jour vide
-                    week_data.append(None)
-                else:
-                    day_date = date(year, month, day_num)
-
-                    # Ne pas afficher les jours futurs
-                    if day_date > today:
-                        week_data.append(None)
-                        continue
-
-                    day_str = day_date.strftime('%Y-%m-%d')
-
-                    # Récupérer l'activité du jour
-                    activity = activity_dict.get(day_str, {'cards_reviewed': 0, 'all_completed': 0})
-                    cards = activity['cards_reviewed']
-                    completed = activity['all_completed']
-
-                    # Déterminer la couleur
-                    if cards == 0:
-                        color = '#ebedf0'  # Gris clair (aucune révision)
-                        status = 'no-activity'
-                    elif completed:
-                        # Vert avec intensité selon le nombre de cartes
-                        intensity = min(cards / max_cards, 1.0)
-                        if intensity < 0.25:
-                            color = '#9be9a8'
-                        elif intensity < 0.5:
-                            color = '#40c463'
-                        elif intensity < 0.75:
-                            color = '#30a14e'
-                        else:
-                            color = '#216e39'
-                        status = 'completed'
-                    else:
-                        # Bleu avec intensité selon le nombre de cartes
-                        intensity = min(cards / max_cards, 1.0)
-                        if intensity < 0.25:
-                            color = '#c6dbef'
-                        elif intensity < 0.5:
-                            color = '#9ecae1'
-                        elif intensity < 0.75:
-                            color = '#6baed6'
-                        else:
-                            color = '#3182bd'
-                        status = 'partial'
-
-                    week_data.append({
-                        'date': day_date.strftime('%d/%m/%Y'),
-                        'cards': cards,
-                        'completed': completed,
-                        'color': color,
-                        'status': status
-                    })
-
-            weeks_data.append(week_data)
-
-        calendar_data.append((month_name, weeks_data))
-
+    year = date.today().year
     year_activity = {
         'year': year,
-        'calendar': calendar_data
+        'url': url_for('api_activity_calendar', user_id=user_id, year=year)
     }
 
     return render_template('statistiques.html',
@@ -1099,18 +1435,82 @@ def statistics():
                           page='parametres')
 
 
+def calendrier_activite(user_id, year, fin):
+    """Activité d'une année en tableaux compacts, un élément par jour du 1er janvier à fin"""
+    activity_dict, _ = get_yearly_activity(user_id, year)
+    debut = date(year, 1, 1)
+    jours = [activity_dict.get((debut + timedelta(days=i)).isoformat())
+             for i in range((fin - debut).days + 1)]
+    return {
+        'annee': year,
+        'debut': debut.isoformat(),
+        'cartes': [jour['cards_reviewed'] if jour else 0 for jour in jours],
+        'terminees': [1 if jour and jour['all_completed'] else 0 for jour in jours]
+    }
+
+
+@app.route('/api/activite/<int:user_id>/<int:year>')
+@login_required
+def api_activity_calendar(user_id, year):
+    """API du calendrier d'activité d'une année (cartes révisées et journées terminées)
+
+    Les années passées ne changent plus : elles sont mises en cache par le
+    navigateur sans limite. L'année en cours est revalidée à chaque visite
+    et coûte une réponse 304 tant que rien n'a changé : l'ETag est tiré de la
+    dernière ligne de daily_activity de l'année, la table d'où vient le
+    contenu (seule l'entrée du jour change). L'identifiant de
+    l'utilisateur fait partie de l'URL pour que deux comptes d'un même
+    navigateur ne partagent pas le cache.
+    """
+    if user_id != session['user_id']:
+        return jsonify({'success': False, 'error': 'Accès refusé'}), 403
+
+    today = date.today()
+    if not 1970 <= year <= today.year:
+        return jsonify({'success': False, 'error': 'Année invalide'}), 404
+
+    annee_passee = year < today.year
+    fin = date(year, 12, 31) if annee_passee else today
+
+    # Le calendrier de l'année en cours change aussi à minuit (un jour de plus)
+    derniere = get_latest_activity(user_id, year)
+    version = (f"{derniere['date']}-{derniere['cards_reviewed']}-{derniere['all_cards_completed']}"
+               if derniere else 'aucune')
+    etag = f'{user_id}-{year}-{fin.isoformat()}-{version}'
+
+    if is_resource_modified(request.environ, etag=etag):
+        response = jsonify(calendrier_activite(user_id, year, fin))
+    else:
+        response = Response(status=304)
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if annee_passee:
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/parametres/classement')
 @login_required
 def leaderboard():
-    """Page du classement des utilisateurs"""
+    """Page du classement des utilisateurs
+
+    Paramètre: periode (total par défaut, semaine ou mois)
+    """
     user_id = session.get('user_id')
+    periode = request.args.get('periode', 'total')
+    if periode not in PERIODES_CLASSEMENT:
+        periode = 'total'
 
     # Vérifier si l'utilisateur peut voir le classement
     can_view = can_see_leaderboard(user_id)
 
     if can_view:
         # Récupérer le classement
-        leaderboard_data = get_leaderboard()
+        leaderboard_data = get_leaderboard(PERIODES_CLASSEMENT[periode])
     else:
         leaderboard_data = []
 
@@ -1122,6 +1522,7 @@ def leaderboard():
                           can_view=can_view,
                           show_in_leaderboard=show_in_leaderboard,
                           current_user_id=user_id,
+                          periode=periode,
                           page='parametres')
 
 
@@ -1184,14 +1585,11 @@ def creer_flashcard_manuelle():
         # Créer ou récupérer le deck
         deck_id = create_deck(nom_deck, user_id)
 
-        # Créer la flashcard principale
-        create_flashcard(deck_id, question, reponse)
-        cards_created = 1
-
-        # Si bidirectionnel, créer aussi la carte inverse
+        # Créer la flashcard principale et, si bidirectionnel, la carte inverse
+        rows = [(question, reponse)]
         if bidirectional:
-            create_flashcard(deck_id, reponse, question)
-            cards_created = 2
+            rows.append((reponse, question))
+        cards_created = create_flashcards_bulk(deck_id, rows)['inserted']
 
         return jsonify({
             'success': True,
@@ -1209,6 +1607,59 @@ def creer_flashcard_manuelle():
         }), 500
 
 
+@app.route('/api/importer-deck', methods=['POST'])
+@login_required
+def importer_deck():
+    """Endpoint API pour importer un deck depuis un fichier CSV/TSV ou un export texte d'Anki"""
+    try:
+        user_id = session.get('user_id')
+        file = request.files.get('fichier')
+
+        if not file or not file.filename:
+            return jsonify({
+                'success': False,
+                'error': 'Aucun fichier fourni'
+            }), 400
+
+        nom_deck = request.form.get('nom_deck', '').strip()
+        if not nom_deck:
+            nom_deck = os.path.splitext(os.path.basename(file.filename))[0]
+
+        deck_id = create_deck(nom_deck, user_id)
+        print(f"📥 Import de {file.filename} dans le deck '{nom_deck}'")
+
+        def progress(stats):
+            print(f"   ... {stats['read']} lignes lues, {stats['inserted']} ajoutées")
+
+        # Lecture en flux : le fichier n'est jamais chargé entièrement en mémoire
+        lines = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        stats = import_flashcards(lines, deck_id, delimiter_for_filename(file.filename),
+                                  progress=progress)
+
+        print(f"✅ {stats['inserted']} flashcard(s) importée(s), {stats['skipped']} doublon(s)")
+        return jsonify({
+            'success': True,
+            'deck_name': nom_deck,
+            'read': stats['read'],
+            'inserted': stats['inserted'],
+            'skipped': stats['skipped'],
+            'invalid': stats['invalid']
+        })
+
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"❌ Fichier d'import illisible: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Fichier illisible (UTF-8 CSV/TSV attendu): {str(e)}'
+        }), 400
+    except Exception as e:
+        print(f"Erreur lors de l'import du deck: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Erreur serveur: {str(e)}'
+        }), 500
+
+
 @app.route('/api/creer-fiche-manuelle', methods=['POST'])
 @login_required
 def creer_fiche_manuelle():
@@ -1370,7 +1821,8 @@ def supprimer_pdf():
                 'error': f'Fichier PDF non trouvé: {filename}'
             }), 404
 
-        # Supprimer le fichier
+        # Supprimer le texte en cache puis le fichier
+        delete_pdf_cache(hash_pdf(pdf_path))
         os.remove(pdf_path)
         print(f"✅ Fichier supprimé: {pdf_path}")
 
@@ -1409,6 +1861,13 @@ def generer_fiche_from_pdf():
         print(f"📁 Catégorie: {categorie}, Source: {source}")
         print(f"📝 Nom de la fiche: {fiche_nom}")
 
+        # Noms utilisés dans des chemins : pas de '..' ni de séparateurs
+        from werkzeug.utils import secure_filename
+        pdf_filename = secure_filename(pdf_filename or '')
+        fiche_nom = secure_filename(fiche_nom or '')
+        categorie = secure_filename(categorie)
+        source = secure_filename(source)
+
         if not pdf_filename or not fiche_nom:
             print("❌ Paramètres manquants")
             return jsonify({
@@ -1441,7 +1900,8 @@ def generer_fiche_from_pdf():
 
         # Génération de la fiche via l'API
         print("🤖 Génération de la fiche résumé via l'API...")
-        fiche_content = generer_fiche_via_api(texte)
+        fiche_content = generer_fiche_via_api(texte, utiliser_cache=not data.get('ignorer_cache'),
+                                              user_id=session['user_id'])
 
         if not fiche_content:
             print("❌ Échec de la génération de la fiche")
@@ -1458,8 +1918,16 @@ def generer_fiche_from_pdf():
         fiche_filename = f"{fiche_nom}.md"
         fiche_path = os.path.join(fiches_dir, fiche_filename)
 
-        with open(fiche_path, 'w', encoding='utf-8') as f:
-            f.write(fiche_content)
+        # Écriture dans un fichier temporaire renommé une fois complet :
+        # jamais de fiche tronquée sous le nom final
+        partial_path = fiche_path + '.part'
+        try:
+            with open(partial_path, 'w', encoding='utf-8') as f:
+                f.write(fiche_content)
+            os.replace(partial_path, fiche_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
 
         print(f"✅ Fiche sauvegardée: {fiche_path}")
 
@@ -1480,79 +1948,261 @@ def generer_fiche_from_pdf():
         }), 500
 
 
-def generer_fiche_via_api(texte):
-    """Génère une fiche résumé à partir du texte extrait en utilisant l'API configurée"""
+@app.route('/api/generer-fiche-flux', methods=['POST'])
+@login_required
+def generer_fiche_flux_from_pdf():
+    """Endpoint API pour générer une fiche résumé en flux (Server-Sent Events)
+
+    Le markdown est envoyé au navigateur et écrit dans le fichier de la fiche
+    au fur et à mesure de sa génération. Événements envoyés :
+        progression  {"message": ...}
+        fragment     {"texte": ...}
+        fin          {"success": true, "message", "fiche_name", "download_url"}
+        erreur       {"success": false, "error": ...}
+    """
+    data = request.get_json()
+    print(f"\n{'='*60}")
+    print(f"📝 GÉNÉRATION DE FICHE RÉSUMÉ (FLUX) - Nouvelle requête")
+    print(f"{'='*60}")
+
+    # Récupération des paramètres
+    pdf_filename = data.get('pdf_filename')
+    categorie = data.get('categorie', 'cours')
+    source = data.get('source', 'uploads')
+    fiche_nom = data.get('fiche_nom')
+    utiliser_cache = not data.get('ignorer_cache')
+    user_id = session['user_id']
+
+    print(f"📄 PDF: {pdf_filename}")
+    print(f"📝 Nom de la fiche: {fiche_nom}")
+
+    # Noms utilisés dans des chemins : pas de '..' ni de séparateurs
+    from werkzeug.utils import secure_filename
+    pdf_filename = secure_filename(pdf_filename or '')
+    fiche_nom = secure_filename(fiche_nom or '')
+    categorie = secure_filename(categorie)
+    source = secure_filename(source)
+
+    if not pdf_filename or not fiche_nom:
+        print("❌ Paramètres manquants")
+        return jsonify({
+            'success': False,
+            'error': 'Paramètres manquants (pdf_filename, fiche_nom requis)'
+        }), 400
+
+    # Construction du chemin du PDF
+    pdf_path = os.path.join(BASE_DIR, 'static/pdfs', categorie, source, pdf_filename)
+    if not os.path.exists(pdf_path):
+        print(f"❌ Fichier PDF non trouvé: {pdf_path}")
+        return jsonify({
+            'success': False,
+            'error': f'Fichier PDF non trouvé: {pdf_filename}'
+        }), 404
+
+    # Créer le dossier pour les fiches si nécessaire
+    fiches_dir = os.path.join(BASE_DIR, 'static/fiches')
+    os.makedirs(fiches_dir, exist_ok=True)
+    fiche_filename = f"{fiche_nom}.md"
+    fiche_path = os.path.join(fiches_dir, fiche_filename)
+    # Fichier en cours d'écriture, renommé en .md une fois la fiche complète
+    partial_path = fiche_path + '.part'
+
+    def evenement(nom, donnees):
+        return f"event: {nom}\ndata: {json.dumps(donnees)}\n\n"
+
+    def flux():
+        termine = False
+        try:
+            yield evenement('progression', {'message': 'Extraction du texte du PDF'})
+            texte = extraire_texte_pdf(pdf_path)
+            if not texte:
+                print("❌ Impossible d'extraire le texte du PDF")
+                yield evenement('erreur', {
+                    'success': False,
+                    'error': 'Impossible d\'extraire le texte du PDF'
+                })
+                return
+
+            yield evenement('progression', {'message': f'Génération avec {API_PROVIDER}'})
+            taille = 0
+            with open(partial_path, 'w', encoding='utf-8') as f:
+                for fragment in generer_fiche_flux(texte, utiliser_cache, user_id):
+                    f.write(fragment)
+                    f.flush()
+                    taille += len(fragment)
+                    yield evenement('fragment', {'texte': fragment})
+
+            if not taille:
+                print("❌ Échec de la génération de la fiche")
+                yield evenement('erreur', {
+                    'success': False,
+                    'error': 'Échec de la génération de la fiche résumé'
+                })
+                return
+
+            os.replace(partial_path, fiche_path)
+            termine = True
+            print(f"✅ Fiche sauvegardée: {fiche_path}")
+            yield evenement('fin', {
+                'success': True,
+                'message': 'Fiche résumé générée avec succès',
+                'fiche_name': fiche_nom,
+                'download_url': url_for('static', filename=f'fiches/{fiche_filename}')
+            })
+
+        except Exception as e:
+            print(f"❌ Erreur lors de la génération de la fiche: {e}")
+            import traceback
+            traceback.print_exc()
+            yield evenement('erreur', {'success': False, 'error': str(e)})
+
+        finally:
+            # Erreur ou navigateur déconnecté : ne pas laisser de fiche tronquée
+            if not termine and os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    return Response(stream_with_context(flux()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+FICHE_EXEMPLE = "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
+
+
+def generer_fiche_flux(texte, utiliser_cache=True, user_id=None):
+    """Génère une fiche résumé en renvoyant le texte au fur et à mesure de sa production
+
+    Les fragments du provider (mode stream) sont transmis dès leur arrivée. La
+    fiche complète est mise en cache à la fin du flux.
+
+    Args:
+        texte: Le texte extrait du PDF
+        utiliser_cache: Si False, ignore la fiche en cache et rappelle l'API
+        user_id: Utilisateur à l'origine de l'appel (file équitable du limiteur de débit)
+
+    Yields:
+        Fragments successifs du markdown de la fiche
+
+    Raises:
+        ValueError si le provider configuré est inconnu, RateLimitError si l'attente
+        du limiteur de débit est trop longue, ou l'erreur du SDK
+    """
 
     print(f"🔍 Génération de fiche résumé avec {API_PROVIDER}")
 
     # Formatter le prompt
     prompt = FICHE_RESUME_PROMPT_TEMPLATE.format(texte=texte[:8000])
 
-    try:
-        if API_PROVIDER == 'claude':
-            from anthropic import Anthropic
-            import httpx
-
-            if ANTHROPIC_API_KEY == 'votre-cle-api-claude-ici':
-                print("⚠️  Clé API Claude non configurée - Génération d'une fiche d'exemple")
-                return "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
-
-            print(f"📡 Appel API Claude ({MODELS['claude']})")
-            # Créer un client httpx sans proxy pour éviter le bug 'proxies'
-            http_client = httpx.Client()
-            client = Anthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client)
-            response = client.messages.create(
+    # Même demande déjà servie par l'API : fiche en cache (voir generation_cache)
+    cle_cache = generation_cache_key('fiche', API_PROVIDER, MODELS.get(API_PROVIDER),
+                                     FICHE_RESUME_PROMPT_TEMPLATE, texte[:8000])
+    if utiliser_cache:
+        fiche_content = get_cached_generation(cle_cache)
+        if fiche_content is not None:
+            print(f"⚡ Fiche servie depuis le cache ({len(fiche_content)} caractères)")
+            yield fiche_content
+            return
+
+    fragments = []
+
+    if API_PROVIDER == 'claude':
+        if ANTHROPIC_API_KEY == 'votre-cle-api-claude-ici':
+            print("⚠️  Clé API Claude non configurée - Génération d'une fiche d'exemple")
+            yield FICHE_EXEMPLE
+            return
+
+        print(f"📡 Appel API Claude ({MODELS['claude']})")
+        client = get_api_client('claude')
+
+        def ouvrir_flux():
+            with client.messages.stream(
                 model=MODELS['claude'],
                 max_tokens=4000,
                 messages=[{
                     "role": "user",
                     "content": prompt
                 }]
-            )
-            fiche_content = response.content[0].text
-            print(f"✅ Fiche générée ({len(fiche_content)} caractères)")
-            return fiche_content
-
-        elif API_PROVIDER == 'gemini':
-            import google.generativeai as genai
-
-            if GOOGLE_API_KEY == 'votre-cle-api-gemini-ici':
-                print("⚠️  Clé API Gemini non configurée - Génération d'une fiche d'exemple")
-                return "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
-
-            print(f"📡 Appel API Gemini ({MODELS['gemini']})")
-            genai.configure(api_key=GOOGLE_API_KEY)
-            model = genai.GenerativeModel(MODELS['gemini'])
-            response = model.generate_content(prompt)
-            fiche_content = response.text
-            print(f"✅ Fiche générée ({len(fiche_content)} caractères)")
-            return fiche_content
-
-        elif API_PROVIDER == 'openai':
-            from openai import OpenAI
-
-            if OPENAI_API_KEY == 'votre-cle-api-openai-ici':
-                print("⚠️  Clé API OpenAI non configurée - Génération d'une fiche d'exemple")
-                return "# Fiche Résumé - Mode Test\n\nCeci est une fiche d'exemple générée en mode test.\n\n## Note\nConfigurez votre clé API dans config.py pour générer de vraies fiches."
-
-            print(f"📡 Appel API OpenAI ({MODELS['openai']})")
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            response = client.chat.completions.create(
+            ) as stream:
+                yield from stream.text_stream
+
+        for fragment in stream_with_retries('claude', ANTHROPIC_API_KEY, ouvrir_flux, user_id):
+            fragments.append(fragment)
+            yield fragment
+
+    elif API_PROVIDER == 'gemini':
+        if GOOGLE_API_KEY == 'votre-cle-api-gemini-ici':
+            print("⚠️  Clé API Gemini non configurée - Génération d'une fiche d'exemple")
+            yield FICHE_EXEMPLE
+            return
+
+        print(f"📡 Appel API Gemini ({MODELS['gemini']})")
+        model = get_gemini_model(MODELS['gemini'])
+
+        def ouvrir_flux():
+            response = model.generate_content(prompt, stream=True,
+                                              request_options=gemini_request_options())
+            for chunk in response:
+                try:
+                    fragment = chunk.text
+                except ValueError:
+                    # Morceau sans texte (fin de réponse, filtre de sécurité)
+                    continue
+                if fragment:
+                    yield fragment
+
+        for fragment in stream_with_retries('gemini', GOOGLE_API_KEY, ouvrir_flux, user_id):
+            fragments.append(fragment)
+            yield fragment
+
+    elif API_PROVIDER == 'openai':
+        if OPENAI_API_KEY == 'votre-cle-api-openai-ici':
+            print("⚠️  Clé API OpenAI non configurée - Génération d'une fiche d'exemple")
+            yield FICHE_EXEMPLE
+            return
+
+        print(f"📡 Appel API OpenAI ({MODELS['openai']})")
+        client = get_api_client('openai')
+
+        def ouvrir_flux():
+            stream = client.chat.completions.create(
                 model=MODELS['openai'],
                 messages=[{
                     "role": "user",
                     "content": prompt
                 }],
-                max_tokens=4000
+                max_tokens=4000,
+                stream=True
             )
-            fiche_content = response.choices[0].message.content
-            print(f"✅ Fiche générée ({len(fiche_content)} caractères)")
-            return fiche_content
+            for chunk in stream:
+                fragment = chunk.choices[0].delta.content if chunk.choices else None
+                if fragment:
+                    yield fragment
 
-        else:
-            print(f"❌ Provider inconnu: {API_PROVIDER}")
-            return None
+        for fragment in stream_with_retries('openai', OPENAI_API_KEY, ouvrir_flux, user_id):
+            fragments.append(fragment)
+            yield fragment
+
+    else:
+        raise ValueError(f"Provider inconnu: {API_PROVIDER}")
+
+    fiche_content = ''.join(fragments)
+    print(f"✅ Fiche générée ({len(fiche_content)} caractères)")
+    if fiche_content:
+        cache_generation(cle_cache, 'fiche', fiche_content)
+
+
+def generer_fiche_via_api(texte, utiliser_cache=True, user_id=None):
+    """Génère une fiche résumé à partir du texte extrait en utilisant l'API configurée
 
+    Args:
+        texte: Le texte extrait du PDF
+        utiliser_cache: Si False, ignore la fiche en cache et rappelle l'API
+        user_id: Utilisateur à l'origine de l'appel (limiteur de débit)
+
+    Returns:
+        Le markdown de la fiche, ou None en cas d'erreur
+    """
+    try:
+        return ''.join(generer_fiche_flux(texte, utiliser_cache, user_id)) or None
     except Exception as e:
         print(f"❌ Erreur API: {e}")
         import traceback
@@ -1560,5 +2210,19 @@ def generer_fiche_via_api(texte):
         return None
 
 
+@app.before_request
+def demarrer_workers():
+    """Démarre les workers dans le processus qui sert les requêtes (gunicorn, etc.)
+
+    Jamais à l'import : ni le processus parent du rechargement automatique ni
+    un processus maître gunicorn --preload ne doivent réserver de tâches.
+    """
+    start_workers()
+
+
 if __name__ == '__main__':
+    # Reprendre les tâches en attente dès le démarrage, seulement dans le
+    # processus enfant du rechargement automatique (celui qui sert les requêtes)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -35,3 +35,20 @@ MODELS = {
     'gemini': 'gemini-2.0-flash',  # Gratuit jusqu'à un certain quota
     'openai': 'gpt-4o-mini'  # Version économique d'OpenAI
 }
+
+# === CONNEXIONS AUX API ===
+# Délai maximal d'une requête (secondes) et nombre de nouvelles tentatives
+# en cas d'erreur réseau ou de surcharge (voir api_clients.py)
+API_TIMEOUT = 120
+API_MAX_RETRIES = 2
+
+# Limites de débit par provider, partagées par tous les processus utilisant la
+# même clé (voir rate_limiter.py). Seules les valeurs indiquées remplacent
+# celles par défaut, par exemple pour un compte Gemini payant :
+# API_RATE_LIMITS = {
+#     'gemini': {'per_minute': 1000, 'per_day': None},
+# }
+
+# Comptes (noms d'utilisateur) autorisés à consulter les métriques du limiteur
+# sur /api/limites-api ; personne par défaut
+API_METRICS_USERS = []
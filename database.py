@@ -1,6 +1,14 @@
+import atexit
 import sqlite3
 import os
+import json
+import threading
+import time
 from contextlib import contextmanager
+from functools import partial
+from datetime import datetime
+
+from anki_algorithm import AnkiCard, calculate_next_review, compile_config, DEFAULT_SCHEDULER
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'flashcards.db')
@@ -8,11 +16,26 @@ DB_PATH = os.path.join(BASE_DIR, 'flashcards.db')
 # Variable globale pour permettre de changer la DB (utilisé pour les tests)
 _current_db_path = DB_PATH
 
+# Réglages des connexions SQLite (modifiables via configure_database)
+DB_SETTINGS = {
+    'pool': True,              # Réutiliser une connexion par thread
+    'journal_mode': 'WAL',     # Lecteurs et écrivain ne se bloquent plus entre eux
+    'synchronous': 'NORMAL',   # Suffisant en WAL (pas de fsync à chaque COMMIT)
+    'cache_size': -20000,      # Négatif = en KiB, soit ~20 Mo de cache de pages
+    'mmap_size': 268435456,    # 256 Mo de lecture mappée en mémoire
+    'busy_timeout': 5000,      # Attente max (ms) d'un verrou avant "database is locked"
+}
+
+# Pool: une connexion par thread, invalidée quand la génération change
+_pool = threading.local()
+_pool_generation = 0
+
 
 def set_database_path(path):
     """Change le chemin de la base de données (utilisé pour les tests)"""
     global _current_db_path
     _current_db_path = path
+    reset_db_connections()
 
 
 def get_database_path():
@@ -20,21 +43,159 @@ def get_database_path():
     return _current_db_path
 
 
-@contextmanager
-def get_db_connection():
-    """Context manager pour gérer les connexions à la base de données"""
-    conn = sqlite3.connect(_current_db_path)
+def configure_database(**settings):
+    """Modifie les réglages des connexions (voir DB_SETTINGS) et vide le pool"""
+    unknown = set(settings) - set(DB_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    DB_SETTINGS.update(settings)
+    reset_db_connections()
+
+
+def reset_db_connections():
+    """Invalide les connexions du pool
+
+    La connexion du thread courant est fermée immédiatement, celles des autres
+    threads le seront à leur prochaine utilisation.
+    """
+    global _pool_generation
+    _pool_generation += 1
+    close_db_connection()
+
+
+def close_db_connection():
+    """Ferme la connexion du pool appartenant au thread courant"""
+    conn = getattr(_pool, 'conn', None)
+    _pool.conn = None
+    _pool.depth = 0
+    if conn is not None and getattr(_pool, 'pid', None) == os.getpid():
+        conn.close()
+
+
+class _Connection(sqlite3.Connection):
+    """Connexion SQLite avec des actions à exécuter après le COMMIT en cours (voir after_commit)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after_commit = []
+
+
+def after_commit(conn, action):
+    """Exécute action() après le COMMIT de la transaction ouverte sur conn
+
+    Sans transaction ouverte, action() est exécutée immédiatement. Si la
+    transaction (ou le bloc imbriqué qui l'a enregistrée) est annulée,
+    action() n'est jamais exécutée.
+    """
+    if conn.in_transaction:
+        conn.after_commit.append(action)
+    else:
+        action()
+
+
+def _commit(conn):
+    """COMMIT puis exécution des actions enregistrées avec after_commit"""
+    conn.commit()
+    actions = conn.after_commit[:]
+    del conn.after_commit[:]
+    for action in actions:
+        action()
+
+
+def _rollback(conn):
+    """ROLLBACK en abandonnant les actions enregistrées avec after_commit"""
+    conn.rollback()
+    del conn.after_commit[:]
+
+
+def _connect():
+    """Ouvre une connexion SQLite configurée selon DB_SETTINGS"""
+    conn = sqlite3.connect(_current_db_path, timeout=DB_SETTINGS['busy_timeout'] / 1000,
+                           factory=_Connection)
     conn.row_factory = sqlite3.Row  # Pour accéder aux colonnes par nom
     # Activer les contraintes de clés étrangères (nécessaire pour CASCADE)
     conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_SETTINGS['busy_timeout'])}")
+    if DB_SETTINGS['journal_mode']:
+        conn.execute(f"PRAGMA journal_mode = {DB_SETTINGS['journal_mode']}")
+    if DB_SETTINGS['synchronous']:
+        conn.execute(f"PRAGMA synchronous = {DB_SETTINGS['synchronous']}")
+    if DB_SETTINGS['cache_size']:
+        conn.execute(f"PRAGMA cache_size = {int(DB_SETTINGS['cache_size'])}")
+    if DB_SETTINGS['mmap_size']:
+        conn.execute(f"PRAGMA mmap_size = {int(DB_SETTINGS['mmap_size'])}")
+    return conn
+
+
+def _pooled_connection():
+    """Retourne la connexion du thread courant, en la (ré)ouvrant si nécessaire
+
+    Une connexion héritée d'un fork (workers gunicorn) ou d'une génération
+    précédente du pool n'est jamais réutilisée.
+    """
+    conn = getattr(_pool, 'conn', None)
+    if conn is not None and (_pool.pid != os.getpid()
+                             or _pool.generation != _pool_generation):
+        if _pool.pid == os.getpid():
+            conn.close()
+        conn = None
+
+    if conn is None:
+        conn = _connect()
+        _pool.conn = conn
+        _pool.pid = os.getpid()
+        _pool.generation = _pool_generation
+        _pool.depth = 0
+    return conn
+
+
+@contextmanager
+def get_db_connection():
+    """Context manager pour gérer les connexions à la base de données
+
+    Avec le pool activé, la connexion du thread est réutilisée d'un appel à
+    l'autre. Les appels imbriqués partagent la transaction: seul le bloc le
+    plus externe fait le COMMIT (ou le ROLLBACK). Un bloc imbriqué qui échoue
+    annule ses propres écritures (SAVEPOINT / ROLLBACK TO) : si l'appelant
+    rattrape l'exception, le bloc externe ne les valide pas.
+    """
+    if not DB_SETTINGS['pool']:
+        conn = _connect()
+        try:
+            yield conn
+            _commit(conn)
+        except Exception:
+            _rollback(conn)
+            raise
+        finally:
+            conn.close()
+        return
+
+    conn = _pooled_connection()
+    _pool.depth += 1
+    # Bloc imbriqué dans une transaction ouverte : point de reprise à son entrée
+    savepoint = None
+    if _pool.depth > 1 and conn.in_transaction:
+        savepoint = f'imbrique_{_pool.depth}'
+        conn.execute(f'SAVEPOINT {savepoint}')
+        pending = len(conn.after_commit)
     try:
         yield conn
-        conn.commit()
+        if _pool.depth == 1:
+            _commit(conn)
+        elif savepoint and conn.in_transaction:
+            conn.execute(f'RELEASE {savepoint}')
     except Exception:
-        conn.rollback()
+        if savepoint is None:
+            # Bloc externe, ou transaction ouverte dans ce bloc : tout annuler
+            _rollback(conn)
+        elif conn.in_transaction:
+            conn.execute(f'ROLLBACK TO {savepoint}')
+            conn.execute(f'RELEASE {savepoint}')
+            del conn.after_commit[pending:]
         raise
     finally:
-        conn.close()
+        _pool.depth -= 1
 
 
 def init_database():
@@ -89,6 +250,7 @@ def init_database():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 flashcard_id INTEGER NOT NULL,
+                deck_id INTEGER,  -- copie de flashcards.deck_id (index de la pioche)
                 ease_factor REAL DEFAULT 2.5,
                 interval INTEGER DEFAULT 0,
                 due_date TEXT,
@@ -101,6 +263,7 @@ def init_database():
                 UNIQUE(user_id, flashcard_id)
             )
         ''')
+        _migrate_progress_deck_id(cursor)
 
         # Table des prompts personnalisés par utilisateur
         cursor.execute('''
@@ -140,6 +303,222 @@ def init_database():
             )
         ''')
 
+        # Compteurs matérialisés par utilisateur/deck (voir _CURRENT_DECK_COUNTERS)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deck_counters (
+                user_id INTEGER NOT NULL,
+                deck_id INTEGER NOT NULL,
+                new_count INTEGER NOT NULL DEFAULT 0,
+                learning_count INTEGER NOT NULL DEFAULT 0,
+                review_count INTEGER NOT NULL DEFAULT 0,
+                counted_until TEXT NOT NULL,
+                next_due TEXT,
+                studied_until INTEGER NOT NULL DEFAULT 0,
+                card_count INTEGER NOT NULL DEFAULT 0,
+                learning_cards INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, deck_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
+        _migrate_deck_counters_columns(cursor)
+        _backfill_deck_counters(cursor)
+
+        # Cache du texte extrait des PDF, par empreinte du contenu et numéro de page
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_documents (
+                content_hash TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_pages (
+                content_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (content_hash, page),
+                FOREIGN KEY (content_hash) REFERENCES pdf_documents(content_hash) ON DELETE CASCADE
+            )
+        ''')
+
+        # File des tâches de fond (génération de flashcards, voir jobs.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                worker_pid INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+
+        _migrate_jobs_attempts(cursor)
+
+        # Cache des réponses des API de génération (voir generation_cache.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                cache_key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+
+        # Limiteur de débit des API partagé entre processus (voir rate_limiter.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                day TEXT,
+                day_count INTEGER NOT NULL DEFAULT 0,
+                granted INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                throttle_seconds REAL NOT NULL DEFAULT 0
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_waiters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket_key TEXT NOT NULL,
+                user_id INTEGER,
+                enqueued_at REAL NOT NULL,
+                seen_at REAL NOT NULL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_users (
+                bucket_key TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                last_served REAL NOT NULL,
+                PRIMARY KEY (bucket_key, user_id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_leases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket_key TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+        # Index des quasi-doublons par deck (voir near_duplicates.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS duplicate_index_state (
+                deck_id INTEGER PRIMARY KEY,
+                last_flashcard_id INTEGER NOT NULL,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS flashcard_lsh (
+                deck_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                PRIMARY KEY (deck_id, bucket, flashcard_id),
+                FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS flashcard_terms (
+                deck_id INTEGER NOT NULL,
+                term TEXT NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                PRIMARY KEY (deck_id, term, flashcard_id),
+                FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        # Réglages de l'algorithme par utilisateur (deck_id NULL) ou par deck
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_presets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                deck_id INTEGER,
+                settings TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Journal des réponses (ajouts seulement, voir log_review)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'review_log'")
+        review_log_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                deck_id INTEGER,
+                rating INTEGER,            -- NULL: réponse antérieure au journal
+                elapsed_ms INTEGER,
+                previous_interval INTEGER,
+                new_interval INTEGER NOT NULL,
+                was_learning INTEGER,
+                is_learning INTEGER NOT NULL,
+                reviewed_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+        if not review_log_exists:
+            _backfill_review_log(cursor)
+
+        # Agrégats quotidiens du journal par utilisateur/jour/deck (voir _rollup_review_log)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_review_stats'")
+        daily_review_stats_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_review_stats (
+                user_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                deck_id INTEGER NOT NULL,     -- 0: deck inconnu
+                reviews INTEGER NOT NULL DEFAULT 0,
+                new_cards INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                mature INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day, deck_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        if not daily_review_stats_exists:
+            _rollup_review_log(cursor)
+
+        # Scores du classement, tenus à jour à chaque réponse (voir get_leaderboard)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leaderboard_scores'")
+        leaderboard_scores_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leaderboard_scores (
+                user_id INTEGER NOT NULL,
+                period TEXT NOT NULL,          -- 'all', 'week' ou 'month'
+                period_start TEXT NOT NULL,    -- '' pour 'all', sinon lundi ou 1er du mois
+                cards INTEGER NOT NULL DEFAULT 0,
+                streak INTEGER NOT NULL DEFAULT 0,
+                score INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, period, period_start),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        if not leaderboard_scores_exists:
+            _backfill_leaderboard_scores(cursor)
+        _ensure_leaderboard_rows(cursor)
+
         # Index pour améliorer les performances
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_flashcards_deck
@@ -181,19 +560,125 @@ def init_database():
             ON decks(folder_id)
         ''')
 
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_decks_user_name
+            ON decks(user_id, name)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_deck_counters_deck
+            ON deck_counters(deck_id)
+        ''')
+
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_users_leaderboard
             ON users(show_in_leaderboard)
         ''')
 
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status
+            ON jobs(status, id)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_generation_cache_used
+            ON generation_cache(last_used)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rate_waiters_bucket
+            ON rate_waiters(bucket_key, id)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_flashcard_lsh_card
+            ON flashcard_lsh(flashcard_id)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_flashcard_terms_card
+            ON flashcard_terms(flashcard_id)
+        ''')
+
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_scheduler_presets_owner
+            ON scheduler_presets(user_id, COALESCE(deck_id, 0))
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_review_log_user
+            ON review_log(user_id, reviewed_at)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_rank
+            ON leaderboard_scores(period, period_start, score DESC, streak DESC)
+        ''')
+
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_progress_due
             ON user_progress(due_date)
         ''')
 
+        # File des cartes dues d'un utilisateur, tous decks confondus
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_user_due
+            ON user_progress(user_id, due_date)
+        ''')
+
+        # File des cartes dues d'un deck (pioche de la carte suivante)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_user_deck_due
+            ON user_progress(user_id, deck_id, due_date)
+        ''')
+
         print("✅ Base de données initialisée avec succès")
 
 
+def _migrate_progress_deck_id(cursor):
+    """Ajoute et remplit user_progress.deck_id sur une base antérieure à la colonne"""
+    cursor.execute("PRAGMA table_info(user_progress)")
+    if 'deck_id' in [col[1] for col in cursor.fetchall()]:
+        return
+    cursor.execute('ALTER TABLE user_progress ADD COLUMN deck_id INTEGER')
+    cursor.execute('''
+        UPDATE user_progress
+        SET deck_id = (SELECT deck_id FROM flashcards WHERE id = user_progress.flashcard_id)
+    ''')
+    print("  ✅ Colonne 'deck_id' ajoutée à user_progress")
+
+
+def _migrate_deck_counters_columns(cursor):
+    """Ajoute les colonnes de deck_counters absentes d'une base antérieure
+
+    studied_until vaut 0 par défaut (aucune carte connue comme étudiée, ce qui
+    reste exact); card_count et learning_cards demandent un recalcul des lignes.
+    """
+    cursor.execute("PRAGMA table_info(deck_counters)")
+    counter_columns = [col[1] for col in cursor.fetchall()]
+
+    if 'studied_until' not in counter_columns:
+        cursor.execute('ALTER TABLE deck_counters ADD COLUMN studied_until INTEGER NOT NULL DEFAULT 0')
+        print("  ✅ Colonne 'studied_until' ajoutée à deck_counters")
+
+    if 'card_count' not in counter_columns:
+        cursor.execute('ALTER TABLE deck_counters ADD COLUMN card_count INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('ALTER TABLE deck_counters ADD COLUMN learning_cards INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('SELECT user_id, deck_id FROM deck_counters')
+        now = datetime.now().isoformat()
+        for pair in cursor.fetchall():
+            _rebuild_deck_counters(cursor, pair['user_id'], pair['deck_id'], now)
+        print("  ✅ Colonnes 'card_count' et 'learning_cards' ajoutées à deck_counters")
+
+
+def _migrate_jobs_attempts(cursor):
+    """Ajoute le compteur de tentatives des tâches absent d'une base antérieure"""
+    cursor.execute("PRAGMA table_info(jobs)")
+    if 'attempts' not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+        print("  ✅ Colonne 'attempts' ajoutée à jobs")
+
+
 def run_migrations():
     """
     Exécute les migrations pour mettre à jour une base de données existante.
@@ -274,6 +759,8 @@ def run_migrations():
         if 'score' in progress_columns:
             print("  ℹ️  Ancienne colonne 'score' détectée (les nouvelles colonnes Anki sont utilisées)")
 
+        _migrate_progress_deck_id(cursor)
+
         # --- Création de la table folders si elle n'existe pas ---
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS folders (
@@ -301,61 +788,295 @@ def run_migrations():
             )
         ''')
 
-        # --- Création des index ---
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flashcards_deck ON flashcards(deck_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_user ON user_progress(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_flashcard ON user_progress(flashcard_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_due ON user_progress(due_date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_decks_folder ON decks(folder_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_activity_user ON daily_activity(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_activity_date ON daily_activity(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_leaderboard ON users(show_in_leaderboard)')
-
-        print("✅ Migrations terminées avec succès")
+        # --- Création de la table deck_counters si elle n'existe pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deck_counters (
+                user_id INTEGER NOT NULL,
+                deck_id INTEGER NOT NULL,
+                new_count INTEGER NOT NULL DEFAULT 0,
+                learning_count INTEGER NOT NULL DEFAULT 0,
+                review_count INTEGER NOT NULL DEFAULT 0,
+                counted_until TEXT NOT NULL,
+                next_due TEXT,
+                studied_until INTEGER NOT NULL DEFAULT 0,
+                card_count INTEGER NOT NULL DEFAULT 0,
+                learning_cards INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, deck_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
+        _migrate_deck_counters_columns(cursor)
+        _backfill_deck_counters(cursor)
 
+        # --- Création des tables du cache de texte des PDF si elles n'existent pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_documents (
+                content_hash TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
-# --- FONCTIONS POUR LES UTILISATEURS ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_pages (
+                content_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (content_hash, page),
+                FOREIGN KEY (content_hash) REFERENCES pdf_documents(content_hash) ON DELETE CASCADE
+            )
+        ''')
 
-def create_user(username, password_hash, security_question=None, security_answer_hash=None):
-    """Crée un nouvel utilisateur avec question de sécurité optionnelle"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO users (username, password_hash, security_question, security_answer_hash) VALUES (?, ?, ?, ?)',
-            (username, password_hash, security_question, security_answer_hash)
-        )
-        return cursor.lastrowid
+        # --- Création de la table jobs si elle n'existe pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                worker_pid INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
 
+        _migrate_jobs_attempts(cursor)
 
-def get_user_by_username(username):
-    """Récupère un utilisateur par son nom"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        return cursor.fetchone()
+        # --- Création de la table generation_cache si elle n'existe pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                cache_key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
 
+        # --- Création des tables du limiteur de débit si elles n'existent pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                day TEXT,
+                day_count INTEGER NOT NULL DEFAULT 0,
+                granted INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                throttle_seconds REAL NOT NULL DEFAULT 0
+            )
+        ''')
 
-def get_all_users():
-    """Récupère tous les utilisateurs"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users')
-        return cursor.fetchall()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_waiters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket_key TEXT NOT NULL,
+                user_id INTEGER,
+                enqueued_at REAL NOT NULL,
+                seen_at REAL NOT NULL
+            )
+        ''')
 
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_users (
+                bucket_key TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                last_served REAL NOT NULL,
+                PRIMARY KEY (bucket_key, user_id)
+            )
+        ''')
 
-def get_user_security_question(username):
-    """Récupère la question de sécurité d'un utilisateur"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT security_question FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
-        return result['security_question'] if result else None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_leases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket_key TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
 
+        # --- Création des tables de l'index des quasi-doublons si elles n'existent pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS duplicate_index_state (
+                deck_id INTEGER PRIMARY KEY,
+                last_flashcard_id INTEGER NOT NULL,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
 
-def verify_security_answer(username, answer):
-    """Vérifie la réponse à la question de sécurité"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS flashcard_lsh (
+                deck_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                PRIMARY KEY (deck_id, bucket, flashcard_id),
+                FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS flashcard_terms (
+                deck_id INTEGER NOT NULL,
+                term TEXT NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                PRIMARY KEY (deck_id, term, flashcard_id),
+                FOREIGN KEY (flashcard_id) REFERENCES flashcards(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        # --- Création de la table des réglages de l'algorithme si elle n'existe pas ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_presets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                deck_id INTEGER,
+                settings TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # --- Création du journal des réponses s'il n'existe pas ---
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'review_log'")
+        review_log_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                flashcard_id INTEGER NOT NULL,
+                deck_id INTEGER,
+                rating INTEGER,            -- NULL: réponse antérieure au journal
+                elapsed_ms INTEGER,
+                previous_interval INTEGER,
+                new_interval INTEGER NOT NULL,
+                was_learning INTEGER,
+                is_learning INTEGER NOT NULL,
+                reviewed_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+        if not review_log_exists:
+            _backfill_review_log(cursor)
+
+        # --- Création des agrégats quotidiens du journal s'ils n'existent pas ---
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_review_stats'")
+        daily_review_stats_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_review_stats (
+                user_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                deck_id INTEGER NOT NULL,     -- 0: deck inconnu
+                reviews INTEGER NOT NULL DEFAULT 0,
+                new_cards INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                mature INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day, deck_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        if not daily_review_stats_exists:
+            _rollup_review_log(cursor)
+
+        # --- Création des scores du classement s'ils n'existent pas ---
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leaderboard_scores'")
+        leaderboard_scores_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leaderboard_scores (
+                user_id INTEGER NOT NULL,
+                period TEXT NOT NULL,          -- 'all', 'week' ou 'month'
+                period_start TEXT NOT NULL,    -- '' pour 'all', sinon lundi ou 1er du mois
+                cards INTEGER NOT NULL DEFAULT 0,
+                streak INTEGER NOT NULL DEFAULT 0,
+                score INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, period, period_start),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        if not leaderboard_scores_exists:
+            _backfill_leaderboard_scores(cursor)
+        _ensure_leaderboard_rows(cursor)
+
+        # --- Création des index ---
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flashcards_deck ON flashcards(deck_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_user ON user_progress(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_flashcard ON user_progress(flashcard_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_due ON user_progress(due_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_user_due ON user_progress(user_id, due_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_user_deck_due ON user_progress(user_id, deck_id, due_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_decks_folder ON decks(folder_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_decks_user_name ON decks(user_id, name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deck_counters_deck ON deck_counters(deck_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_cache_used ON generation_cache(last_used)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rate_waiters_bucket ON rate_waiters(bucket_key, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flashcard_lsh_card ON flashcard_lsh(flashcard_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flashcard_terms_card ON flashcard_terms(flashcard_id)')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_scheduler_presets_owner ON scheduler_presets(user_id, COALESCE(deck_id, 0))')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_review_log_user ON review_log(user_id, reviewed_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_rank ON leaderboard_scores(period, period_start, score DESC, streak DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_activity_user ON daily_activity(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_activity_date ON daily_activity(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_leaderboard ON users(show_in_leaderboard)')
+
+        print("✅ Migrations terminées avec succès")
+
+
+# --- FONCTIONS POUR LES UTILISATEURS ---
+
+def create_user(username, password_hash, security_question=None, security_answer_hash=None):
+    """Crée un nouvel utilisateur avec question de sécurité optionnelle"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO users (username, password_hash, security_question, security_answer_hash) VALUES (?, ?, ?, ?)',
+            (username, password_hash, security_question, security_answer_hash)
+        )
+        user_id = cursor.lastrowid
+        # Score total à 0 : le classement ne lit que leaderboard_scores
+        cursor.execute(
+            "INSERT INTO leaderboard_scores (user_id, period, period_start) VALUES (?, 'all', '')",
+            (user_id,)
+        )
+        return user_id
+
+
+def get_user_by_username(username):
+    """Récupère un utilisateur par son nom"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+        return cursor.fetchone()
+
+
+def get_all_users():
+    """Récupère tous les utilisateurs"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users')
+        return cursor.fetchall()
+
+
+def get_user_security_question(username):
+    """Récupère la question de sécurité d'un utilisateur"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT security_question FROM users WHERE username = ?', (username,))
+        result = cursor.fetchone()
+        return result['security_question'] if result else None
+
+
+def verify_security_answer(username, answer):
+    """Vérifie la réponse à la question de sécurité"""
     from werkzeug.security import check_password_hash
 
     with get_db_connection() as conn:
@@ -367,171 +1088,1694 @@ def verify_security_answer(username, answer):
         return False
 
 
-def update_user_password(username, new_password_hash):
-    """Met à jour le mot de passe d'un utilisateur"""
+def update_user_password(username, new_password_hash):
+    """Met à jour le mot de passe d'un utilisateur"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE users SET password_hash = ? WHERE username = ?',
+            (new_password_hash, username)
+        )
+
+
+# --- FONCTIONS POUR LES DECKS ---
+
+def create_deck(name, user_id=None):
+    """Crée un deck pour un utilisateur, ou retourne l'id de son deck de même nom
+
+    Les appelants (génération, creer_flashcard_manuelle, importer_deck,
+    import_decks.import_file) comptent sur ce comportement : des cartes
+    ajoutées sous un nom existant complètent le deck de l'utilisateur.
+
+    decks.name n'est pas unique (deux utilisateurs peuvent avoir un deck
+    "Maths") : la recherche est limitée aux decks de l'utilisateur, et faite
+    sous le verrou d'écriture pour que deux sauvegardes simultanées ne créent
+    pas deux decks.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        deck = _select_user_deck(cursor, name, user_id)
+        if deck:
+            return deck['id']
+        cursor.execute('INSERT INTO decks (name, user_id) VALUES (?, ?)', (name, user_id))
+        deck_id = cursor.lastrowid
+        if user_id is not None:
+            # Compteurs du propriétaire: deck vide, rien n'est dû
+            cursor.execute(
+                'INSERT INTO deck_counters (user_id, deck_id, counted_until) VALUES (?, ?, ?)',
+                (user_id, deck_id, datetime.now().isoformat())
+            )
+        return deck_id
+
+
+def _select_user_deck(cursor, name, user_id):
+    """Deck de l'utilisateur portant ce nom (le plus ancien s'il y en a plusieurs)"""
+    cursor.execute(
+        'SELECT * FROM decks WHERE name = ? AND user_id IS ? ORDER BY id LIMIT 1',
+        (name, user_id)
+    )
+    return cursor.fetchone()
+
+
+def get_user_deck_by_name(name, user_id):
+    """Récupère le deck d'un utilisateur par son nom (None s'il n'en a pas)"""
+    with get_db_connection() as conn:
+        return _select_user_deck(conn.cursor(), name, user_id)
+
+
+def get_deck_by_name(name):
+    """Récupère un deck par son nom"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM decks WHERE name = ?', (name,))
+        return cursor.fetchone()
+
+
+def get_all_decks():
+    """Récupère tous les decks"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM decks ORDER BY name')
+        return cursor.fetchall()
+
+
+def get_user_decks(user_id):
+    """Récupère tous les decks d'un utilisateur"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM decks WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
+        return cursor.fetchall()
+
+
+def delete_deck(deck_id):
+    """Supprime un deck et toutes ses flashcards"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM deck_counters WHERE deck_id = ?', (deck_id,))
+        cursor.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+
+
+# --- FONCTIONS POUR LES FLASHCARDS ---
+
+def create_flashcard(deck_id, question, answer):
+    """Crée une nouvelle flashcard"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                'INSERT INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)',
+                (deck_id, question, answer)
+            )
+            flashcard_id = cursor.lastrowid
+            # Nouvelle carte pour tous les utilisateurs qui ont des compteurs sur ce deck
+            cursor.execute(
+                'UPDATE deck_counters SET new_count = new_count + 1, card_count = card_count + 1 WHERE deck_id = ?',
+                (deck_id,)
+            )
+            return flashcard_id
+        except sqlite3.IntegrityError:
+            # La flashcard existe déjà dans ce deck
+            cursor.execute(
+                'SELECT id FROM flashcards WHERE deck_id = ? AND question = ?',
+                (deck_id, question)
+            )
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+
+def create_flashcards_bulk(deck_id, rows):
+    """Crée plusieurs flashcards dans un deck en une seule transaction
+
+    Les questions déjà présentes dans le deck (contrainte UNIQUE(deck_id, question))
+    sont ignorées, y compris les doublons à l'intérieur de rows.
+
+    Args:
+        deck_id: ID du deck
+        rows: Itérable de couples (question, answer)
+
+    Returns:
+        Dictionnaire {'inserted': ..., 'skipped': ...}
+    """
+    rows = list(rows)
+    if not rows:
+        return {'inserted': 0, 'skipped': 0}
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany('''
+            INSERT INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)
+            ON CONFLICT(deck_id, question) DO NOTHING
+        ''', ((deck_id, question, answer) for question, answer in rows))
+        inserted = cursor.rowcount
+
+        if inserted:
+            cursor.execute(
+                '''
+                UPDATE deck_counters
+                SET new_count = new_count + ?, card_count = card_count + ?
+                WHERE deck_id = ?
+                ''',
+                (inserted, inserted, deck_id)
+            )
+
+        return {'inserted': inserted, 'skipped': len(rows) - inserted}
+
+
+def get_flashcards_by_deck(deck_id):
+    """Récupère toutes les flashcards d'un deck"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT * FROM flashcards WHERE deck_id = ? ORDER BY id',
+            (deck_id,)
+        )
+        return cursor.fetchall()
+
+
+def get_flashcard_by_id(flashcard_id):
+    """Récupère une flashcard par son ID"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM flashcards WHERE id = ?', (flashcard_id,))
+        return cursor.fetchone()
+
+
+# --- FONCTIONS POUR LA PROGRESSION ---
+
+def get_user_progress(user_id, flashcard_id):
+    """Récupère la progression d'un utilisateur pour une flashcard"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT * FROM user_progress WHERE user_id = ? AND flashcard_id = ?',
+            (user_id, flashcard_id)
+        )
+        return cursor.fetchone()
+
+
+def update_progress(user_id, flashcard_id, ease_factor, interval, due_date,
+                   step, is_learning, repetitions):
+    """Met à jour ou crée la progression d'un utilisateur (système Anki)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        old = _select_progress_for_update(cursor, user_id, flashcard_id)
+        _write_progress(cursor, user_id, flashcard_id, old, ease_factor, interval,
+                        due_date, step, is_learning, repetitions)
+
+
+def _select_progress_for_update(cursor, user_id, flashcard_id):
+    """Récupère le deck et la progression actuelle d'une carte (progress_id NULL si nouvelle)
+
+    Retourne aussi les réglages de l'algorithme qui s'appliquent (ceux du deck,
+    sinon ceux de l'utilisateur) dans preset_settings, NULL s'il n'y en a pas.
+    """
+    cursor.execute('''
+        SELECT
+            f.deck_id, up.id as progress_id,
+            up.ease_factor, up.interval, up.due_date,
+            up.step, up.is_learning, up.repetitions,
+            sp.settings as preset_settings
+        FROM flashcards f
+        LEFT JOIN user_progress up
+            ON f.id = up.flashcard_id AND up.user_id = ?
+        LEFT JOIN scheduler_presets sp ON sp.id = (
+            SELECT id FROM scheduler_presets
+            WHERE user_id = ? AND COALESCE(deck_id, 0) IN (0, f.deck_id)
+            ORDER BY deck_id IS NULL
+            LIMIT 1
+        )
+        WHERE f.id = ?
+    ''', (user_id, user_id, flashcard_id))
+    return cursor.fetchone()
+
+
+def _write_progress(cursor, user_id, flashcard_id, old, ease_factor, interval,
+                    due_date, step, is_learning, repetitions):
+    """Écrit la progression d'une carte et répercute le changement sur deck_counters
+
+    Args:
+        old: Ligne retournée par _select_progress_for_update avant l'écriture
+    """
+    counters = None
+    if old is not None:
+        # Compteurs à jour de l'état AVANT l'écriture, pour appliquer le delta
+        counters = _refresh_deck_counters(cursor, user_id, old['deck_id'])
+
+    cursor.execute('''
+        INSERT INTO user_progress
+            (user_id, flashcard_id, deck_id, ease_factor, interval, due_date,
+             step, is_learning, repetitions, last_reviewed)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, flashcard_id)
+        DO UPDATE SET
+            deck_id = excluded.deck_id,
+            ease_factor = excluded.ease_factor,
+            interval = excluded.interval,
+            due_date = excluded.due_date,
+            step = excluded.step,
+            is_learning = excluded.is_learning,
+            repetitions = excluded.repetitions,
+            last_reviewed = CURRENT_TIMESTAMP
+    ''', (user_id, flashcard_id, old['deck_id'] if old else None, ease_factor, interval,
+          due_date, step, is_learning, repetitions))
+
+    if counters is None:
+        return
+
+    if old['progress_id'] is None:
+        _advance_studied_until(cursor, user_id, old['deck_id'], counters['studied_until'])
+
+    delta = {'new_count': 0, 'learning_count': 0, 'review_count': 0, 'learning_cards': 0}
+    counted_until = counters['counted_until']
+    next_due = counters['next_due']
+
+    # Retirer l'ancienne contribution de la carte
+    if old['progress_id'] is None:
+        delta['new_count'] -= 1
+    else:
+        if old['is_learning']:
+            delta['learning_cards'] -= 1
+        if old['due_date'] is not None and old['due_date'] <= counted_until:
+            delta['learning_count' if old['is_learning'] else 'review_count'] -= 1
+
+    # Ajouter la nouvelle contribution
+    if is_learning:
+        delta['learning_cards'] += 1
+    if due_date is not None:
+        if due_date <= counted_until:
+            delta['learning_count' if is_learning else 'review_count'] += 1
+        elif next_due is None or due_date < next_due:
+            next_due = due_date
+
+    cursor.execute('''
+        UPDATE deck_counters
+        SET new_count = new_count + ?,
+            learning_count = learning_count + ?,
+            review_count = review_count + ?,
+            learning_cards = learning_cards + ?,
+            next_due = ?
+        WHERE user_id = ? AND deck_id = ?
+    ''', (delta['new_count'], delta['learning_count'], delta['review_count'],
+          delta['learning_cards'], next_due, user_id, old['deck_id']))
+
+
+def _advance_studied_until(cursor, user_id, deck_id, studied_until):
+    """Avance le curseur des nouvelles cartes après la première révision d'une carte
+
+    studied_until est le plus grand id tel que toutes les cartes du deck
+    d'id <= studied_until ont une progression pour l'utilisateur. La recherche
+    repart du curseur et s'arrête à la première carte jamais étudiée: les
+    nouvelles cartes étant piochées par id croissant, chaque carte n'est
+    parcourue qu'une fois sur toute la vie du deck.
+    """
+    cursor.execute('''
+        SELECT f.id
+        FROM flashcards f
+        LEFT JOIN user_progress up
+            ON f.id = up.flashcard_id AND up.user_id = ?
+        WHERE f.deck_id = ? AND f.id > ? AND up.due_date IS NULL
+        ORDER BY f.id
+        LIMIT 1
+    ''', (user_id, deck_id, studied_until))
+    first_new = cursor.fetchone()
+    if first_new:
+        new_studied_until = first_new['id'] - 1
+    else:
+        cursor.execute('SELECT MAX(id) FROM flashcards WHERE deck_id = ?', (deck_id,))
+        new_studied_until = cursor.fetchone()[0] or 0
+
+    if new_studied_until > studied_until:
+        cursor.execute(
+            'UPDATE deck_counters SET studied_until = ? WHERE user_id = ? AND deck_id = ?',
+            (new_studied_until, user_id, deck_id)
+        )
+
+
+def get_all_user_progress(user_id, deck_id):
+    """Récupère toute la progression d'un utilisateur pour un deck (système Anki)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT
+                f.id, f.question, f.answer,
+                up.ease_factor, up.interval, up.due_date,
+                up.step, up.is_learning, up.repetitions
+            FROM flashcards f
+            LEFT JOIN user_progress up
+                ON f.id = up.flashcard_id AND up.user_id = ?
+            WHERE f.deck_id = ?
+            ORDER BY
+                CASE
+                    WHEN up.due_date IS NULL THEN 0
+                    WHEN up.due_date <= datetime('now') THEN 1
+                    ELSE 2
+                END,
+                up.due_date
+        ''', (user_id, deck_id))
+        return cursor.fetchall()
+
+
+def _select_next_card(cursor, user_id, deck_id):
+    """Choisit la carte la plus prioritaire d'un deck avec le curseur fourni
+
+    Priorité: cartes en retard (la plus en retard d'abord), puis nouvelles
+    cartes, puis, si rien n'est dû, la prochaine carte à venir.
+
+    Chaque étape est une requête LIMIT 1 bornée: les cartes dues et à venir
+    sont lues dans l'ordre de l'index idx_progress_user_deck_due
+    (user_id, deck_id, due_date), sans parcourir les autres decks; les
+    nouvelles cartes dans l'ordre de idx_flashcards_deck, à partir du curseur
+    deck_counters.studied_until (voir _advance_studied_until). On s'arrête à
+    la première ligne trouvée au lieu de charger et trier tout le deck.
+    """
+    now = datetime.now().isoformat()
+
+    # 1. Carte en retard la plus ancienne
+    cursor.execute('''
+        SELECT
+            f.id, f.question, f.answer,
+            up.ease_factor, up.interval, up.due_date,
+            up.step, up.is_learning, up.repetitions
+        FROM user_progress up
+        INNER JOIN flashcards f ON f.id = up.flashcard_id
+        WHERE up.user_id = ? AND up.deck_id = ? AND up.due_date <= ?
+        ORDER BY up.due_date
+        LIMIT 1
+    ''', (user_id, deck_id, now))
+    carte = cursor.fetchone()
+    if carte:
+        return carte
+
+    # 2. Nouvelle carte (jamais étudiée)
+    cursor.execute('''
+        SELECT
+            f.id, f.question, f.answer,
+            up.ease_factor, up.interval, up.due_date,
+            up.step, up.is_learning, up.repetitions
+        FROM flashcards f
+        LEFT JOIN user_progress up
+            ON f.id = up.flashcard_id AND up.user_id = ?
+        WHERE f.deck_id = ? AND f.id > ? AND up.due_date IS NULL
+        ORDER BY f.id
+        LIMIT 1
+    ''', (user_id, deck_id, _studied_until(cursor, user_id, deck_id)))
+    carte = cursor.fetchone()
+    if carte:
+        return carte
+
+    # 3. Rien n'est dû: prochaine carte à venir
+    cursor.execute('''
+        SELECT
+            f.id, f.question, f.answer,
+            up.ease_factor, up.interval, up.due_date,
+            up.step, up.is_learning, up.repetitions
+        FROM user_progress up
+        INNER JOIN flashcards f ON f.id = up.flashcard_id
+        WHERE up.user_id = ? AND up.deck_id = ? AND up.due_date > ?
+        ORDER BY up.due_date
+        LIMIT 1
+    ''', (user_id, deck_id, now))
+    return cursor.fetchone()
+
+
+def _studied_until(cursor, user_id, deck_id):
+    """Retourne le curseur des nouvelles cartes d'un (utilisateur, deck) (0 si inconnu)"""
+    cursor.execute(
+        'SELECT studied_until FROM deck_counters WHERE user_id = ? AND deck_id = ?',
+        (user_id, deck_id)
+    )
+    row = cursor.fetchone()
+    return row['studied_until'] if row else 0
+
+
+def get_next_card(user_id, deck_id):
+    """Récupère la prochaine carte à réviser d'un deck pour un utilisateur"""
+    with get_db_connection() as conn:
+        return _select_next_card(conn.cursor(), user_id, deck_id)
+
+
+def get_due_queue(user_id, deck_id, limit):
+    """Récupère les IDs des prochaines cartes à réviser d'un deck, dans l'ordre de pioche
+
+    Même priorité que _select_next_card (cartes en retard puis nouvelles
+    cartes), mais pour `limit` cartes d'un coup: la file d'une session d'étude
+    est calculée une fois au lieu d'une fois par vote. Les cartes à venir ne
+    sont pas incluses.
+    """
+    now = datetime.now().isoformat()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT up.flashcard_id
+            FROM user_progress up
+            WHERE up.user_id = ? AND up.deck_id = ? AND up.due_date <= ?
+            ORDER BY up.due_date
+            LIMIT ?
+        ''', (user_id, deck_id, now, limit))
+        queue = [row['flashcard_id'] for row in cursor.fetchall()]
+
+        if len(queue) < limit:
+            cursor.execute('''
+                SELECT f.id
+                FROM flashcards f
+                LEFT JOIN user_progress up
+                    ON f.id = up.flashcard_id AND up.user_id = ?
+                WHERE f.deck_id = ? AND f.id > ? AND up.due_date IS NULL
+                ORDER BY f.id
+                LIMIT ?
+            ''', (user_id, deck_id, _studied_until(cursor, user_id, deck_id), limit - len(queue)))
+            queue.extend(row['id'] for row in cursor.fetchall())
+
+        return queue
+
+
+def get_card_with_progress(user_id, flashcard_id):
+    """Récupère une flashcard avec la progression de l'utilisateur"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT
+                f.id, f.question, f.answer,
+                up.ease_factor, up.interval, up.due_date,
+                up.step, up.is_learning, up.repetitions
+            FROM flashcards f
+            LEFT JOIN user_progress up
+                ON f.id = up.flashcard_id AND up.user_id = ?
+            WHERE f.id = ?
+        ''', (user_id, flashcard_id))
+        return cursor.fetchone()
+
+
+def _apply_review(cursor, user_id, flashcard_id, rating, elapsed_ms=None):
+    """Applique une réponse (SM-2, progression, journal, activité, streak) avec le curseur fourni
+
+    La réponse est ajoutée au tampon de review_log au COMMIT, écrit plus tard par lot.
+
+    Returns:
+        AnkiCard avec le nouvel état de la carte
+    """
+    progress = _select_progress_for_update(cursor, user_id, flashcard_id)
+    config = _compiled_preset(progress['preset_settings'] if progress else None)
+    previous = progress if progress and progress['progress_id'] is not None else None
+
+    if previous:
+        card = AnkiCard(
+            ease_factor=previous['ease_factor'],
+            interval=previous['interval'],
+            due_date=datetime.fromisoformat(previous['due_date']) if previous['due_date'] else None,
+            step=previous['step'],
+            is_learning=bool(previous['is_learning']),
+            repetitions=previous['repetitions']
+        )
+    else:
+        card = AnkiCard(ease_factor=config.starting_ease)
+
+    new_card = calculate_next_review(card, rating, config)
+
+    _write_progress(cursor, user_id, flashcard_id, progress, new_card.ease_factor,
+                    new_card.interval, new_card.due_date.isoformat(), new_card.step,
+                    1 if new_card.is_learning else 0, new_card.repetitions)
+    # Journal : réponse mise en tampon seulement si le vote est validé
+    after_commit(cursor.connection, partial(
+        log_review, user_id, flashcard_id, progress['deck_id'] if progress else None, rating,
+        previous['interval'] if previous else None, new_card.interval,
+        previous['is_learning'] if previous else None,
+        1 if new_card.is_learning else 0, elapsed_ms, datetime.now()
+    ))
+
+    counts = _count_user_cards(cursor, user_id)
+    all_completed = (counts['new_cards'] == 0 and counts['relearn_cards'] == 0
+                     and counts['review_cards'] == 0)
+    _record_daily_activity(cursor, user_id, 1, counts['cards_due'], all_completed)
+    if all_completed:
+        _update_streak(cursor, user_id)
+
+    return new_card
+
+
+def record_review(user_id, flashcard_id, rating, elapsed_ms=None):
+    """Enregistre une réponse en une seule transaction, sans piocher de carte
+
+    Appelé dans review_transaction par la route de vote, avec la pioche de la
+    carte suivante dans la file de la session d'étude.
+
+    Args:
+        elapsed_ms: Temps de réponse mesuré par le navigateur (None si inconnu)
+
+    Returns:
+        AnkiCard avec le nouvel état de la carte
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        return _apply_review(cursor, user_id, flashcard_id, rating, elapsed_ms)
+
+
+@contextmanager
+def review_transaction():
+    """Transaction d'écriture d'un vote : réponse et pioche de la carte suivante
+
+    Remplace l'enchaînement get_user_progress / update_progress /
+    get_user_flashcard_counts / update_daily_activity / update_streak /
+    piocher_carte, qui ouvrait au moins six connexions par vote. Les appels
+    faits dans le bloc partagent la connexion du pool et sa transaction.
+
+    Budget de requêtes d'un vote (une connexion, un COMMIT):
+        1. BEGIN IMMEDIATE (prend le verrou d'écriture d'emblée)
+        2. SELECT de la progression de la carte notée (record_review)
+        3. UPSERT de user_progress et delta de deck_counters
+        4. SELECT des compteurs matérialisés (nouvelles/réapprendre/réviser)
+        5. UPSERT de daily_activity et des scores du classement
+        6. SELECT (+ UPDATE éventuel) du streak, seulement si tout est terminé
+        7. SELECT de la carte suivante de la file (get_card_with_progress) ;
+           la file n'est recalculée (get_due_queue) que lorsqu'elle est vide
+
+    Sans pool, chaque appel a sa propre connexion : le bloc n'ouvre alors pas
+    de transaction commune (elle bloquerait les écritures imbriquées).
+    """
+    if not DB_SETTINGS['pool']:
+        yield None
+        return
+
+    with get_db_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        yield conn
+
+
+# --- COMPTEURS MATÉRIALISÉS PAR DECK ---
+#
+# deck_counters garde, pour chaque (utilisateur, deck), le nombre de cartes
+# nouvelles, en apprentissage dues et en révision dues, calculé à l'instant
+# counted_until, ainsi que le nombre total de cartes (card_count) et de cartes
+# en apprentissage, dues ou non (learning_cards). next_due est un minorant de la prochaine échéance après
+# counted_until. Seules les écritures modifient la table (create_deck,
+# create_flashcard, delete_deck, et update_progress/_apply_review pour le seul
+# deck de la carte notée), en appliquant un delta au lieu de tout recompter.
+# Les lectures n'écrivent jamais: tant que next_due > maintenant, la ligne est
+# exacte; sinon les cartes devenues dues dans (counted_until, maintenant] y
+# sont ajoutées par une recherche bornée sur idx_progress_user_deck_due.
+
+# Compteurs à l'instant :now des decks sélectionnés par la clause WHERE ajoutée
+# par l'appelant. Sans ligne dans deck_counters (deck créé hors de create_deck),
+# le deck est compté entièrement, toujours sans écrire.
+_CURRENT_DECK_COUNTERS = '''
+    SELECT
+        d.id as deck_id, d.name, d.folder_id, d.created_at,
+        COALESCE(dc.new_count, (
+            SELECT COUNT(*)
+            FROM flashcards f
+            LEFT JOIN user_progress up
+                ON f.id = up.flashcard_id AND up.user_id = :user_id
+            WHERE f.deck_id = d.id AND up.id IS NULL
+        )) as new,
+        COALESCE(dc.learning_count, 0) + CASE
+            WHEN dc.deck_id IS NULL OR dc.next_due <= :now THEN (
+                SELECT COUNT(*)
+                FROM user_progress up
+                WHERE up.user_id = :user_id AND up.deck_id = d.id
+                AND up.due_date > COALESCE(dc.counted_until, '') AND up.due_date <= :now
+                AND up.is_learning = 1
+            )
+            ELSE 0
+        END as relearn,
+        COALESCE(dc.review_count, 0) + CASE
+            WHEN dc.deck_id IS NULL OR dc.next_due <= :now THEN (
+                SELECT COUNT(*)
+                FROM user_progress up
+                WHERE up.user_id = :user_id AND up.deck_id = d.id
+                AND up.due_date > COALESCE(dc.counted_until, '') AND up.due_date <= :now
+                AND up.is_learning = 0
+            )
+            ELSE 0
+        END as review,
+        COALESCE(dc.card_count, (
+            SELECT COUNT(*) FROM flashcards f WHERE f.deck_id = d.id
+        )) as total,
+        COALESCE(dc.learning_cards, (
+            SELECT COUNT(*)
+            FROM user_progress up
+            WHERE up.user_id = :user_id AND up.deck_id = d.id AND up.is_learning = 1
+        )) as learning
+    FROM decks d
+    LEFT JOIN deck_counters dc ON dc.deck_id = d.id AND dc.user_id = :user_id
+'''
+
+
+def _rebuild_deck_counters(cursor, user_id, deck_id, now):
+    """Recalcule entièrement la ligne de compteurs d'un (utilisateur, deck)"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO deck_counters
+            (user_id, deck_id, new_count, learning_count, review_count,
+             counted_until, next_due, studied_until, card_count, learning_cards)
+        SELECT
+            ?, ?,
+            COUNT(CASE WHEN up.id IS NULL THEN 1 END),
+            COUNT(CASE WHEN up.is_learning = 1 AND up.due_date <= ? THEN 1 END),
+            COUNT(CASE WHEN up.is_learning = 0 AND up.due_date <= ? THEN 1 END),
+            ?,
+            MIN(CASE WHEN up.due_date > ? THEN up.due_date END),
+            COALESCE(MIN(CASE WHEN up.due_date IS NULL THEN f.id END) - 1, MAX(f.id), 0),
+            COUNT(f.id),
+            COUNT(CASE WHEN up.is_learning = 1 THEN 1 END)
+        FROM flashcards f
+        LEFT JOIN user_progress up
+            ON f.id = up.flashcard_id AND up.user_id = ?
+        WHERE f.deck_id = ?
+    ''', (user_id, deck_id, now, now, now, now, user_id, deck_id))
+
+
+def _backfill_deck_counters(cursor):
+    """Crée les compteurs manquants des decks et de leur propriétaire (base antérieure)"""
+    cursor.execute('''
+        SELECT d.id as deck_id, d.user_id
+        FROM decks d
+        LEFT JOIN deck_counters dc ON dc.deck_id = d.id AND dc.user_id = d.user_id
+        WHERE d.user_id IS NOT NULL AND dc.deck_id IS NULL
+    ''')
+    now = datetime.now().isoformat()
+    for pair in cursor.fetchall():
+        _rebuild_deck_counters(cursor, pair['user_id'], pair['deck_id'], now)
+
+
+def _refresh_deck_counters(cursor, user_id, deck_id, now=None):
+    """Avance jusqu'à now la ligne de compteurs d'un (utilisateur, deck) et la retourne
+
+    Chemin d'écriture seulement (_write_progress): la ligne est construite si
+    elle n'existe pas, et avancée si une échéance a été franchie depuis le
+    dernier calcul. Les lectures passent par _user_deck_counters.
+    """
+    if now is None:
+        now = datetime.now().isoformat()
+
+    cursor.execute(
+        'SELECT * FROM deck_counters WHERE user_id = ? AND deck_id = ?',
+        (user_id, deck_id)
+    )
+    counters = cursor.fetchone()
+
+    if counters is None:
+        _rebuild_deck_counters(cursor, user_id, deck_id, now)
+    elif counters['next_due'] is not None and counters['next_due'] <= now:
+        # Cartes devenues dues depuis le dernier calcul
+        cursor.execute('''
+            SELECT
+                COUNT(CASE WHEN is_learning = 1 THEN 1 END) as learning,
+                COUNT(CASE WHEN is_learning = 0 THEN 1 END) as review
+            FROM user_progress
+            WHERE user_id = ? AND deck_id = ? AND due_date > ? AND due_date <= ?
+        ''', (user_id, deck_id, counters['counted_until'], now))
+        became_due = cursor.fetchone()
+
+        # Prochaine échéance exacte après now
+        cursor.execute('''
+            SELECT due_date
+            FROM user_progress
+            WHERE user_id = ? AND deck_id = ? AND due_date > ?
+            ORDER BY due_date
+            LIMIT 1
+        ''', (user_id, deck_id, now))
+        next_row = cursor.fetchone()
+
+        cursor.execute('''
+            UPDATE deck_counters
+            SET learning_count = learning_count + ?,
+                review_count = review_count + ?,
+                counted_until = ?,
+                next_due = ?
+            WHERE user_id = ? AND deck_id = ?
+        ''', (became_due['learning'], became_due['review'], now,
+              next_row['due_date'] if next_row else None, user_id, deck_id))
+    else:
+        return counters
+
+    cursor.execute(
+        'SELECT * FROM deck_counters WHERE user_id = ? AND deck_id = ?',
+        (user_id, deck_id)
+    )
+    return cursor.fetchone()
+
+
+def _user_deck_counters(cursor, user_id, deck_id=None):
+    """Retourne les compteurs à jour des decks d'un utilisateur (ou du seul deck deck_id), sans écrire
+
+    Returns:
+        Dictionnaire {deck_id: {'new': ..., 'relearn': ..., 'review': ...}}
+    """
+    where = 'd.id = :deck_id' if deck_id is not None else 'd.user_id = :user_id'
+    cursor.execute(f'{_CURRENT_DECK_COUNTERS} WHERE {where}', {
+        'user_id': user_id, 'deck_id': deck_id, 'now': datetime.now().isoformat()
+    })
+    return {
+        row['deck_id']: {'new': row['new'], 'relearn': row['relearn'], 'review': row['review']}
+        for row in cursor.fetchall()
+    }
+
+
+def rebuild_deck_counters(user_id=None):
+    """Reconstruit les compteurs matérialisés (réparation après un import SQL direct)
+
+    Args:
+        user_id: Limite la reconstruction aux compteurs de cet utilisateur (tous si None)
+
+    Returns:
+        Nombre de lignes de compteurs reconstruites
+    """
+    now = datetime.now().isoformat()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if user_id is None:
+            cursor.execute('DELETE FROM deck_counters')
+            cursor.execute('SELECT id as deck_id, user_id FROM decks WHERE user_id IS NOT NULL')
+        else:
+            cursor.execute('DELETE FROM deck_counters WHERE user_id = ?', (user_id,))
+            cursor.execute('SELECT id as deck_id, user_id FROM decks WHERE user_id = ?', (user_id,))
+
+        pairs = cursor.fetchall()
+        for pair in pairs:
+            _rebuild_deck_counters(cursor, pair['user_id'], pair['deck_id'], now)
+        return len(pairs)
+
+
+# --- CACHE DU TEXTE DES PDF ---
+
+def get_pdf_page_count(content_hash):
+    """Retourne le nombre de pages d'un PDF déjà vu (None si inconnu)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT page_count FROM pdf_documents WHERE content_hash = ?',
+            (content_hash,)
+        )
+        row = cursor.fetchone()
+        return row['page_count'] if row else None
+
+
+def get_cached_pdf_pages(content_hash, first_page, last_page):
+    """Récupère le texte en cache des pages first_page à last_page (0-indexed, incluses)
+
+    Returns:
+        Dictionnaire {page: texte} des pages présentes dans le cache
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT page, text FROM pdf_pages
+            WHERE content_hash = ? AND page BETWEEN ? AND ?
+        ''', (content_hash, first_page, last_page))
+        return {row['page']: row['text'] for row in cursor.fetchall()}
+
+
+def save_pdf_pages(content_hash, page_count, pages):
+    """Enregistre le texte extrait de pages d'un PDF
+
+    Args:
+        content_hash: Empreinte du contenu du fichier
+        page_count: Nombre total de pages du document
+        pages: Dictionnaire {page (0-indexed): texte}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR IGNORE INTO pdf_documents (content_hash, page_count) VALUES (?, ?)',
+            (content_hash, page_count)
+        )
+        cursor.executemany(
+            'INSERT OR REPLACE INTO pdf_pages (content_hash, page, text) VALUES (?, ?, ?)',
+            ((content_hash, page, text) for page, text in pages.items())
+        )
+
+
+def delete_pdf_cache(content_hash):
+    """Supprime le texte en cache d'un PDF"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM pdf_pages WHERE content_hash = ?', (content_hash,))
+        cursor.execute('DELETE FROM pdf_documents WHERE content_hash = ?', (content_hash,))
+
+
+# --- FONCTIONS POUR LES TÂCHES DE FOND ---
+
+def create_job(user_id, kind, params):
+    """Ajoute une tâche en attente et retourne son ID
+
+    Args:
+        params: Dictionnaire des paramètres (sérialisé en JSON)
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO jobs (user_id, kind, params) VALUES (?, ?, ?)',
+            (user_id, kind, json.dumps(params))
+        )
+        return cursor.lastrowid
+
+
+def claim_next_job(worker_pid):
+    """Réserve la plus ancienne tâche en attente (None si la file est vide)
+
+    La sélection et le passage à l'état 'running' se font dans la même
+    transaction d'écriture : deux workers ne peuvent pas prendre la même tâche.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+        )
+        job = cursor.fetchone()
+        if job is None:
+            return None
+
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'running', worker_pid = ?, started_at = CURRENT_TIMESTAMP,
+                attempts = attempts + 1
+            WHERE id = ?
+        ''', (worker_pid, job['id']))
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job['id'],))
+        return cursor.fetchone()
+
+
+def update_job_progress(job_id, progress):
+    """Met à jour le message de progression d'une tâche"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE jobs SET progress = ? WHERE id = ?', (progress, job_id))
+
+
+def finish_job(job_id, result=None, error=None):
+    """Termine une tâche avec son résultat (dictionnaire) ou son erreur"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs
+            SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', ('failed' if error else 'done',
+              json.dumps(result) if result is not None else None, error, job_id))
+
+
+def get_job(job_id):
+    """Récupère une tâche par son ID"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        return cursor.fetchone()
+
+
+def requeue_orphan_jobs(is_alive, max_attempts=None):
+    """Remet en attente les tâches 'running' dont le processus n'existe plus
+
+    Une tâche déjà réservée max_attempts fois (qui fait peut-être tomber son
+    worker) est marquée 'failed' au lieu d'être reprise à chaque redémarrage.
+
+    Args:
+        is_alive: Fonction qui indique si un PID de worker est encore vivant
+        max_attempts: Nombre maximal de réservations d'une tâche (None = illimité)
+
+    Returns:
+        Nombre de tâches remises en attente
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, worker_pid, attempts FROM jobs WHERE status = 'running'")
+        orphans = [job for job in cursor.fetchall()
+                   if job['worker_pid'] is None or not is_alive(job['worker_pid'])]
+        abandoned = [(job['id'],) for job in orphans
+                     if max_attempts and job['attempts'] >= max_attempts]
+        requeued = [(job['id'],) for job in orphans
+                    if not (max_attempts and job['attempts'] >= max_attempts)]
+
+        cursor.executemany(
+            "UPDATE jobs SET status = 'pending', worker_pid = NULL WHERE id = ?",
+            requeued
+        )
+        cursor.executemany('''
+            UPDATE jobs
+            SET status = 'failed', worker_pid = NULL, finished_at = CURRENT_TIMESTAMP,
+                error = 'Tâche interrompue à chaque tentative, abandonnée'
+            WHERE id = ?
+        ''', abandoned)
+        return len(requeued)
+
+
+# --- CACHE DES RÉPONSES DE GÉNÉRATION ---
+
+def get_generation_cache(cache_key, min_created_at):
+    """Retourne la réponse en cache (texte JSON) si elle date d'après min_created_at
+
+    Met à jour sa date de dernière utilisation (éviction LRU).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT response FROM generation_cache WHERE cache_key = ? AND created_at >= ?',
+            (cache_key, min_created_at)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        cursor.execute(
+            'UPDATE generation_cache SET last_used = ? WHERE cache_key = ?',
+            (time.time(), cache_key)
+        )
+        return row['response']
+
+
+def save_generation_cache(cache_key, kind, response, max_entries, min_created_at):
+    """Enregistre une réponse et applique les limites du cache
+
+    Les entrées expirées (avant min_created_at) sont supprimées, puis les moins
+    récemment utilisées au-delà de max_entries.
+    """
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO generation_cache
+                (cache_key, kind, response, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (cache_key, kind, response, now, now))
+
+        cursor.execute('DELETE FROM generation_cache WHERE created_at < ?', (min_created_at,))
+        cursor.execute('''
+            DELETE FROM generation_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM generation_cache
+                ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,))
+
+
+def clear_generation_cache():
+    """Vide le cache des réponses de génération"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM generation_cache')
+
+
+# --- FONCTIONS POUR LE LIMITEUR DE DÉBIT DES API ---
+
+def enqueue_rate_waiter(bucket_key, user_id):
+    """Inscrit une demande d'appel dans la file d'attente d'un bucket et retourne son ID"""
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO rate_waiters (bucket_key, user_id, enqueued_at, seen_at)
+            VALUES (?, ?, ?, ?)
+        ''', (bucket_key, user_id, now, now))
+        return cursor.lastrowid
+
+
+def peek_rate_token(waiter_id, bucket_key, limits, stale_after):
+    """Indique, sans écrire, si une demande en attente peut être servie maintenant
+
+    Reprend les règles de try_acquire_rate_token en lecture seule : les demandes
+    non revues depuis stale_after et les réservations expirées sont ignorées
+    au lieu d'être supprimées. Les processus en attente ne prennent ainsi le
+    verrou d'écriture que pour réclamer un jeton.
+
+    Returns:
+        Délai conseillé avant de réessayer (0 si la demande peut réclamer un jeton)
+    """
+    now = time.time()
+    today = datetime.now().date().isoformat()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT w.id
+            FROM rate_waiters w
+            LEFT JOIN rate_users u
+                ON u.bucket_key = w.bucket_key AND u.user_id = w.user_id
+            WHERE w.bucket_key = ? AND (w.seen_at >= ? OR w.id = ?)
+            ORDER BY COALESCE(u.last_served, 0), w.id
+            LIMIT 1
+        ''', (bucket_key, now - stale_after, waiter_id))
+        head = cursor.fetchone()
+        if head is None or head['id'] != waiter_id:
+            return 1 / limits['rate']
+
+        cursor.execute(
+            'SELECT COUNT(*) FROM rate_leases WHERE bucket_key = ? AND expires_at >= ?',
+            (bucket_key, now)
+        )
+        if limits['max_concurrent'] and cursor.fetchone()[0] >= limits['max_concurrent']:
+            return 0.5
+
+        cursor.execute('SELECT * FROM rate_buckets WHERE bucket_key = ?', (bucket_key,))
+        bucket = cursor.fetchone()
+        if bucket is None:
+            return 0
+        tokens = min(float(limits['burst']),
+                     bucket['tokens'] + (now - bucket['updated_at']) * limits['rate'])
+        day_count = bucket['day_count'] if bucket['day'] == today else 0
+        if limits['per_day'] and day_count >= limits['per_day']:
+            return 60
+        if tokens < 1:
+            return (1 - tokens) / limits['rate']
+        return 0
+
+
+def touch_rate_waiter(waiter_id):
+    """Signale qu'une demande est toujours en attente (sinon abandonnée après stale_after)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE rate_waiters SET seen_at = ? WHERE id = ?', (time.time(), waiter_id)
+        )
+
+
+def try_acquire_rate_token(waiter_id, bucket_key, limits, stale_after):
+    """Tente d'accorder un appel à une demande en attente
+
+    Dans une seule transaction d'écriture : recharge le bucket, choisit la
+    demande servie en premier (l'utilisateur servi le moins récemment, puis la
+    plus ancienne demande) et, si c'est celle-ci et que les limites le
+    permettent, consomme un jeton et ouvre une réservation de concurrence.
+
+    Args:
+        limits: Dictionnaire avec rate (jetons/s), burst, per_day, max_concurrent, lease_seconds
+        stale_after: Délai (s) après lequel une demande non revue est abandonnée
+
+    Returns:
+        Tuple (lease_id, attente) : lease_id vaut None si l'appel n'est pas encore
+        accordé, attente est le délai conseillé avant de réessayer.
+    """
+    now = time.time()
+    today = datetime.now().date().isoformat()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+
+        # Nettoyage : demandes abandonnées et réservations expirées
+        cursor.execute(
+            'UPDATE rate_waiters SET seen_at = ? WHERE id = ?', (now, waiter_id)
+        )
+        cursor.execute(
+            'DELETE FROM rate_waiters WHERE bucket_key = ? AND seen_at < ?',
+            (bucket_key, now - stale_after)
+        )
+        cursor.execute(
+            'DELETE FROM rate_leases WHERE bucket_key = ? AND expires_at < ?',
+            (bucket_key, now)
+        )
+
+        cursor.execute('SELECT * FROM rate_buckets WHERE bucket_key = ?', (bucket_key,))
+        bucket = cursor.fetchone()
+        if bucket is None:
+            tokens, day_count = float(limits['burst']), 0
+        else:
+            tokens = min(float(limits['burst']),
+                         bucket['tokens'] + (now - bucket['updated_at']) * limits['rate'])
+            day_count = bucket['day_count'] if bucket['day'] == today else 0
+
+        cursor.execute('''
+            INSERT INTO rate_buckets (bucket_key, tokens, updated_at, day, day_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(bucket_key) DO UPDATE SET
+                tokens = excluded.tokens,
+                updated_at = excluded.updated_at,
+                day = excluded.day,
+                day_count = excluded.day_count
+        ''', (bucket_key, tokens, now, today, day_count))
+
+        # File équitable : l'utilisateur servi le moins récemment passe en premier
+        cursor.execute('''
+            SELECT w.id
+            FROM rate_waiters w
+            LEFT JOIN rate_users u
+                ON u.bucket_key = w.bucket_key AND u.user_id = w.user_id
+            WHERE w.bucket_key = ?
+            ORDER BY COALESCE(u.last_served, 0), w.id
+            LIMIT 1
+        ''', (bucket_key,))
+        head = cursor.fetchone()
+        if head is None or head['id'] != waiter_id:
+            return None, 1 / limits['rate']
+
+        cursor.execute('SELECT COUNT(*) FROM rate_leases WHERE bucket_key = ?', (bucket_key,))
+        if limits['max_concurrent'] and cursor.fetchone()[0] >= limits['max_concurrent']:
+            return None, 0.5
+        if limits['per_day'] and day_count >= limits['per_day']:
+            return None, 60
+        if tokens < 1:
+            return None, (1 - tokens) / limits['rate']
+
+        cursor.execute('''
+            SELECT enqueued_at, user_id FROM rate_waiters WHERE id = ?
+        ''', (waiter_id,))
+        waiter = cursor.fetchone()
+        cursor.execute('''
+            UPDATE rate_buckets
+            SET tokens = tokens - 1, day_count = day_count + 1,
+                granted = granted + 1, throttle_seconds = throttle_seconds + ?
+            WHERE bucket_key = ?
+        ''', (now - waiter['enqueued_at'], bucket_key))
+        cursor.execute('DELETE FROM rate_waiters WHERE id = ?', (waiter_id,))
+        if waiter['user_id'] is not None:
+            cursor.execute('''
+                INSERT OR REPLACE INTO rate_users (bucket_key, user_id, last_served)
+                VALUES (?, ?, ?)
+            ''', (bucket_key, waiter['user_id'], now))
+        cursor.execute(
+            'INSERT INTO rate_leases (bucket_key, expires_at) VALUES (?, ?)',
+            (bucket_key, now + limits['lease_seconds'])
+        )
+        return cursor.lastrowid, 0
+
+
+def cancel_rate_waiter(waiter_id, bucket_key):
+    """Retire une demande de la file (délai d'attente dépassé) et la compte comme rejetée"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM rate_waiters WHERE id = ?', (waiter_id,))
+        cursor.execute(
+            'UPDATE rate_buckets SET rejected = rejected + 1 WHERE bucket_key = ?',
+            (bucket_key,)
+        )
+
+
+def release_rate_lease(lease_id):
+    """Libère la réservation de concurrence d'un appel terminé"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM rate_leases WHERE id = ?', (lease_id,))
+
+
+def get_rate_limit_metrics():
+    """Retourne les métriques de chaque bucket (file d'attente, appels en cours, attente)"""
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT
+                b.bucket_key, b.tokens, b.day, b.day_count,
+                b.granted, b.rejected, b.throttle_seconds,
+                (SELECT COUNT(*) FROM rate_waiters w
+                 WHERE w.bucket_key = b.bucket_key) as queue_depth,
+                (SELECT COUNT(*) FROM rate_leases l
+                 WHERE l.bucket_key = b.bucket_key AND l.expires_at >= ?) as in_flight
+            FROM rate_buckets b
+            ORDER BY b.bucket_key
+        ''', (now,))
+        return cursor.fetchall()
+
+
+# --- FONCTIONS POUR L'INDEX DES QUASI-DOUBLONS ---
+
+def get_unindexed_flashcards(deck_id):
+    """Retourne les flashcards d'un deck ajoutées depuis la dernière indexation
+
+    Les IDs de flashcards (AUTOINCREMENT) ne sont jamais réutilisés : il suffit
+    de mémoriser le dernier ID indexé par deck.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT f.id, f.question
+            FROM flashcards f
+            WHERE f.deck_id = ?
+            AND f.id > COALESCE(
+                (SELECT last_flashcard_id FROM duplicate_index_state WHERE deck_id = ?), 0
+            )
+            ORDER BY f.id
+        ''', (deck_id, deck_id))
+        return cursor.fetchall()
+
+
+def save_duplicate_index(deck_id, buckets, terms, last_flashcard_id):
+    """Enregistre les entrées d'index de nouvelles flashcards et avance le dernier ID indexé
+
+    Les insertions sont idempotentes : deux indexations simultanées du même
+    deck ne créent pas d'entrées en double.
+
+    Args:
+        buckets: Itérable de tuples (bucket, flashcard_id)
+        terms: Itérable de tuples (term, flashcard_id)
+        last_flashcard_id: Plus grand ID de flashcard indexé
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany(
+            'INSERT OR IGNORE INTO flashcard_lsh (deck_id, bucket, flashcard_id) VALUES (?, ?, ?)',
+            ((deck_id, bucket, flashcard_id) for bucket, flashcard_id in buckets)
+        )
+        cursor.executemany(
+            'INSERT OR IGNORE INTO flashcard_terms (deck_id, term, flashcard_id) VALUES (?, ?, ?)',
+            ((deck_id, term, flashcard_id) for term, flashcard_id in terms)
+        )
+        cursor.execute('''
+            INSERT INTO duplicate_index_state (deck_id, last_flashcard_id)
+            VALUES (?, ?)
+            ON CONFLICT(deck_id) DO UPDATE SET
+                last_flashcard_id = MAX(last_flashcard_id, excluded.last_flashcard_id)
+        ''', (deck_id, last_flashcard_id))
+
+
+def get_lsh_candidates(deck_id, buckets):
+    """Retourne les flashcards du deck partageant au moins un bucket LSH (id, question)"""
+    buckets = list(buckets)
+    if not buckets:
+        return []
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT DISTINCT f.id, f.question
+            FROM flashcard_lsh l
+            JOIN flashcards f ON f.id = l.flashcard_id
+            WHERE l.deck_id = ? AND l.bucket IN ({','.join('?' * len(buckets))})
+        ''', (deck_id, *buckets))
+        return cursor.fetchall()
+
+
+def get_questions_by_terms(deck_id, terms, limit):
+    """Retourne les questions du deck qui partagent le plus de termes avec une liste
+
+    Chaque terme commun compte pour 1 / (nombre de questions du deck qui le
+    contiennent) : les termes rares pèsent plus que ceux présents partout.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            WITH termes AS (
+                SELECT DISTINCT value AS term FROM json_each(?)
+            ),
+            frequences AS (
+                SELECT t.term, COUNT(*) as df
+                FROM flashcard_terms t
+                JOIN termes USING (term)
+                WHERE t.deck_id = ?
+                GROUP BY t.term
+            )
+            SELECT f.id, f.question, SUM(1.0 / fr.df) as score
+            FROM flashcard_terms t
+            JOIN frequences fr ON fr.term = t.term
+            JOIN flashcards f ON f.id = t.flashcard_id
+            WHERE t.deck_id = ?
+            GROUP BY f.id
+            ORDER BY score DESC, f.id DESC
+            LIMIT ?
+        ''', (json.dumps(list(terms)), deck_id, deck_id, limit))
+        return cursor.fetchall()
+
+
+# --- FONCTIONS POUR LES RÉGLAGES DE L'ALGORITHME (PRESETS) ---
+
+# Réglages compilés (anki_algorithm.SchedulerConfig), indexés par le JSON
+# enregistré : {settings: config}. Chaque révision relit le JSON du preset avec
+# la progression de la carte ; une modification (dans ce processus ou un autre)
+# change donc la clé et l'ancienne configuration n'est plus utilisée.
+_compiled_presets = {}
+_COMPILED_PRESETS_MAX = 1024
+
+
+def _compiled_preset(settings):
+    """Retourne la configuration compilée d'un preset (DEFAULT_SCHEDULER si settings est None)"""
+    if settings is None:
+        return DEFAULT_SCHEDULER
+
+    config = _compiled_presets.get(settings)
+    if config is None:
+        try:
+            config = compile_config(json.loads(settings))
+        except ValueError as e:
+            # Preset devenu invalide (paramètre retiré...) : ne pas bloquer les révisions
+            print(f"⚠️ Preset invalide ({e}), configuration par défaut utilisée")
+            config = DEFAULT_SCHEDULER
+        if len(_compiled_presets) >= _COMPILED_PRESETS_MAX:
+            _compiled_presets.clear()
+        _compiled_presets[settings] = config
+    return config
+
+
+def get_scheduler_preset(user_id, deck_id=None):
+    """Retourne les réglages enregistrés pour un deck (ou pour l'utilisateur si deck_id est None)
+
+    Returns:
+        Dictionnaire des paramètres modifiés, ou None si aucun preset
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT settings FROM scheduler_presets
+            WHERE user_id = ? AND COALESCE(deck_id, 0) = COALESCE(?, 0)
+        ''', (user_id, deck_id))
+        row = cursor.fetchone()
+        return json.loads(row['settings']) if row else None
+
+
+def get_scheduler_config(user_id, deck_id=None):
+    """Retourne la configuration compilée qui s'applique aux révisions d'un deck
+
+    Réglages du deck, sinon ceux de l'utilisateur, sinon DEFAULT_SCHEDULER.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT settings FROM scheduler_presets
+            WHERE user_id = ? AND COALESCE(deck_id, 0) IN (0, COALESCE(?, 0))
+            ORDER BY deck_id IS NULL
+            LIMIT 1
+        ''', (user_id, deck_id))
+        row = cursor.fetchone()
+    return _compiled_preset(row['settings'] if row else None)
+
+
+def get_user_scheduler_configs(user_id):
+    """Retourne les configurations compilées d'un utilisateur
+
+    Returns:
+        Tuple (configuration de l'utilisateur, {deck_id: configuration du deck})
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            'UPDATE users SET password_hash = ? WHERE username = ?',
-            (new_password_hash, username)
+            'SELECT deck_id, settings FROM scheduler_presets WHERE user_id = ?', (user_id,)
         )
+        rows = cursor.fetchall()
 
+    user_config = DEFAULT_SCHEDULER
+    deck_configs = {}
+    for row in rows:
+        if row['deck_id'] is None:
+            user_config = _compiled_preset(row['settings'])
+        else:
+            deck_configs[row['deck_id']] = _compiled_preset(row['settings'])
+    return user_config, deck_configs
 
-# --- FONCTIONS POUR LES DECKS ---
 
-def create_deck(name, user_id=None):
-    """Crée un nouveau deck pour un utilisateur"""
+def get_progress_for_simulation(user_id):
+    """Retourne la progression de toutes les cartes vues d'un utilisateur, avec deck et dossier
+
+    Format attendu par anki_algorithm.simulate.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO decks (name, user_id) VALUES (?, ?)', (name, user_id))
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
-            # Le deck existe déjà, vérifier s'il appartient à cet utilisateur
-            if user_id:
-                cursor.execute('SELECT id FROM decks WHERE name = ? AND user_id = ?', (name, user_id))
-            else:
-                cursor.execute('SELECT id FROM decks WHERE name = ?', (name,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            # Si le deck existe mais appartient à un autre utilisateur, créer un nom unique
-            cursor.execute('INSERT INTO decks (name, user_id) VALUES (?, ?)',
-                         (f"{name}_{user_id}", user_id))
-            return cursor.lastrowid
+        cursor.execute('''
+            SELECT
+                up.ease_factor, up.interval, up.due_date, up.step,
+                up.is_learning, up.repetitions, f.deck_id, d.folder_id
+            FROM user_progress up
+            JOIN flashcards f ON f.id = up.flashcard_id
+            JOIN decks d ON d.id = f.deck_id
+            WHERE up.user_id = ?
+        ''', (user_id,))
+        return cursor.fetchall()
 
 
-def get_deck_by_name(name):
-    """Récupère un deck par son nom"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks WHERE name = ?', (name,))
-        return cursor.fetchone()
+def save_scheduler_preset(user_id, settings, deck_id=None):
+    """Enregistre les réglages d'un deck (ou de l'utilisateur si deck_id est None)
 
+    Les réglages sont validés avant l'enregistrement.
+
+    Raises:
+        ValueError si un paramètre est inconnu ou invalide
+    """
+    compile_config(settings)
 
-def get_all_decks():
-    """Récupère tous les decks"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks ORDER BY name')
-        return cursor.fetchall()
-
-
-def get_user_decks(user_id):
-    """Récupère tous les decks d'un utilisateur"""
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE scheduler_presets
+            SET settings = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ? AND COALESCE(deck_id, 0) = COALESCE(?, 0)
+        ''', (json.dumps(settings, sort_keys=True), user_id, deck_id))
+        if cursor.rowcount == 0:
+            cursor.execute('''
+                INSERT INTO scheduler_presets (user_id, deck_id, settings)
+                VALUES (?, ?, ?)
+            ''', (user_id, deck_id, json.dumps(settings, sort_keys=True)))
+
+
+def delete_scheduler_preset(user_id, deck_id=None):
+    """Supprime les réglages d'un deck (ou de l'utilisateur si deck_id est None)"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM decks WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-        return cursor.fetchall()
-
-
-def delete_deck(deck_id):
-    """Supprime un deck et toutes ses flashcards"""
+        cursor.execute('''
+            DELETE FROM scheduler_presets
+            WHERE user_id = ? AND COALESCE(deck_id, 0) = COALESCE(?, 0)
+        ''', (user_id, deck_id))
+        return cursor.rowcount > 0
+
+
+# --- JOURNAL DES RÉPONSES ---
+#
+# user_progress ne garde que le dernier état de chaque carte ; review_log garde
+# chaque réponse (ajouts seulement). Pour ne pas ajouter d'écriture au vote,
+# les réponses passent par un tampon en mémoire, écrit par lots (executemany,
+# un seul COMMIT) par un thread dédié dès batch_size réponses, au plus tard
+# flush_interval ms après, et à l'arrêt du processus. Un arrêt brutal perd au
+# plus le contenu du tampon : la progression, elle, est déjà écrite. Une
+# réponse n'entre dans le tampon qu'après le COMMIT de son vote (after_commit) :
+# un vote annulé ne laisse aucune trace dans le journal.
+#
+# Chaque écriture met à jour dans la même transaction daily_review_stats, qui
+# agrège le journal par utilisateur/jour/deck (réponses, nouvelles cartes,
+# oublis, réponses sur cartes mûres). Les statistiques lisent ces agrégats par
+# plage de dates : leur coût dépend du nombre de jours, pas de l'historique.
+
+# Intervalle (jours) à partir duquel une carte est mûre, comme dans Anki
+MATURE_INTERVAL = 21
+
+# Réglages du journal (modifiables via configure_review_log)
+REVIEW_LOG_SETTINGS = {
+    'enabled': True,
+    'batch_size': 100,        # Écriture dès que le tampon atteint ce nombre de réponses
+    'flush_interval': 2000,   # Délai maximal (ms) avant l'écriture d'une réponse
+}
+
+_review_log_buffer = []
+_review_log_lock = threading.Lock()          # Protège le tampon
+_review_log_flush_lock = threading.Lock()    # Une seule écriture à la fois
+_review_log_wakeup = threading.Event()
+_review_log_writer_pid = None
+
+
+def configure_review_log(**settings):
+    """Modifie les réglages du journal des réponses (voir REVIEW_LOG_SETTINGS)"""
+    unknown = set(settings) - set(REVIEW_LOG_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    REVIEW_LOG_SETTINGS.update(settings)
+    # Réveiller le thread d'écriture pour qu'il prenne en compte le nouveau délai
+    _review_log_wakeup.set()
+
+
+def _backfill_review_log(cursor):
+    """Reprend dans review_log la dernière réponse connue de chaque carte
+
+    Seule trace des réponses antérieures au journal : une entrée par ligne de
+    user_progress, sans note ni état précédent.
+    """
+    cursor.execute('''
+        INSERT INTO review_log
+            (user_id, flashcard_id, deck_id, new_interval, is_learning, reviewed_at)
+        SELECT
+            up.user_id, up.flashcard_id, f.deck_id,
+            COALESCE(up.interval, 0), COALESCE(up.is_learning, 1),
+            strftime('%Y-%m-%dT%H:%M:%S', up.last_reviewed, 'localtime')
+        FROM user_progress up
+        LEFT JOIN flashcards f ON f.id = up.flashcard_id
+        WHERE up.last_reviewed IS NOT NULL
+        ORDER BY up.last_reviewed
+    ''')
+
+
+def _rollup_review_log(cursor, after_id=0):
+    """Ajoute à daily_review_stats les réponses du journal d'id > after_id
+
+    Une réponse importée (rating NULL) ne compte que dans reviews. Un oubli est
+    un "Again" sur une carte en révision, une réponse mûre porte sur une carte
+    en révision d'intervalle >= MATURE_INTERVAL.
+    """
+    cursor.execute('''
+        INSERT INTO daily_review_stats (user_id, day, deck_id, reviews, new_cards, lapses, mature)
+        SELECT
+            user_id, substr(reviewed_at, 1, 10), COALESCE(deck_id, 0),
+            COUNT(*),
+            COUNT(CASE WHEN rating IS NOT NULL AND previous_interval IS NULL THEN 1 END),
+            COUNT(CASE WHEN rating = 0 AND was_learning = 0 THEN 1 END),
+            COUNT(CASE WHEN was_learning = 0 AND previous_interval >= ? THEN 1 END)
+        FROM review_log
+        WHERE id > ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT(user_id, day, deck_id) DO UPDATE SET
+            reviews = reviews + excluded.reviews,
+            new_cards = new_cards + excluded.new_cards,
+            lapses = lapses + excluded.lapses,
+            mature = mature + excluded.mature
+    ''', (MATURE_INTERVAL, after_id))
+
+
+def rebuild_daily_review_stats():
+    """Recalcule tous les agrégats quotidiens depuis review_log
+
+    Jamais nécessaire en fonctionnement normal (les agrégats sont tenus à jour
+    à chaque écriture du journal) ; utile après une correction du journal.
+    """
+    flush_review_log()
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM daily_review_stats')
+        _rollup_review_log(cursor)
 
 
-# --- FONCTIONS POUR LES FLASHCARDS ---
+def log_review(user_id, flashcard_id, deck_id, rating, previous_interval, new_interval,
+               was_learning, is_learning, elapsed_ms=None, reviewed_at=None):
+    """Ajoute une réponse au tampon du journal (écrite plus tard, par lot)
 
-def create_flashcard(deck_id, question, answer):
-    """Crée une nouvelle flashcard"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    Args:
+        previous_interval, was_learning: État avant la réponse (None pour une nouvelle carte)
+        elapsed_ms: Temps de réponse mesuré par le navigateur (None si inconnu)
+        reviewed_at: datetime de la réponse (maintenant par défaut)
+    """
+    if not REVIEW_LOG_SETTINGS['enabled']:
+        return
+
+    entry = (user_id, flashcard_id, deck_id, rating, elapsed_ms, previous_interval,
+             new_interval, was_learning, is_learning,
+             (reviewed_at or datetime.now()).isoformat(timespec='seconds'))
+    with _review_log_lock:
+        _review_log_buffer.append(entry)
+        full = len(_review_log_buffer) >= REVIEW_LOG_SETTINGS['batch_size']
+
+    _start_review_log_writer()
+    if full:
+        _review_log_wakeup.set()
+
+
+def _start_review_log_writer():
+    """Démarre le thread d'écriture du journal s'il ne tourne pas dans ce processus"""
+    global _review_log_writer_pid
+
+    if _review_log_writer_pid == os.getpid():
+        return
+    with _review_log_lock:
+        if _review_log_writer_pid == os.getpid():
+            return
+        _review_log_writer_pid = os.getpid()
+    threading.Thread(target=_review_log_writer, name='review-log', daemon=True).start()
+
+
+def _review_log_writer():
+    """Boucle du thread d'écriture : vide le tampon quand il est plein ou le délai écoulé"""
+    while True:
+        woken = _review_log_wakeup.wait(REVIEW_LOG_SETTINGS['flush_interval'] / 1000)
+        _review_log_wakeup.clear()
+        with _review_log_lock:
+            full = len(_review_log_buffer) >= REVIEW_LOG_SETTINGS['batch_size']
+        if woken and not full:
+            # Réveil après un changement de réglages : repartir avec le nouveau délai
+            continue
         try:
-            cursor.execute(
-                'INSERT INTO flashcards (deck_id, question, answer) VALUES (?, ?, ?)',
-                (deck_id, question, answer)
-            )
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
-            # La flashcard existe déjà dans ce deck
-            cursor.execute(
-                'SELECT id FROM flashcards WHERE deck_id = ? AND question = ?',
-                (deck_id, question)
-            )
-            result = cursor.fetchone()
-            return result[0] if result else None
+            flush_review_log()
+        except sqlite3.Error as e:
+            print(f"❌ Erreur lors de l'écriture du journal des réponses: {e}")
 
 
-def get_flashcards_by_deck(deck_id):
-    """Récupère toutes les flashcards d'un deck"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM flashcards WHERE deck_id = ? ORDER BY id',
-            (deck_id,)
-        )
-        return cursor.fetchall()
+def flush_review_log():
+    """Écrit les réponses en attente dans review_log et daily_review_stats, en une seule transaction
 
+    En cas d'erreur, les réponses sont remises dans le tampon pour le prochain
+    essai.
 
-def get_flashcard_by_id(flashcard_id):
-    """Récupère une flashcard par son ID"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM flashcards WHERE id = ?', (flashcard_id,))
-        return cursor.fetchone()
+    Returns:
+        Nombre de réponses écrites
+    """
+    with _review_log_flush_lock:
+        with _review_log_lock:
+            entries = _review_log_buffer[:]
+            del _review_log_buffer[:]
+        if not entries:
+            return 0
 
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                if not conn.in_transaction:
+                    cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM review_log')
+                last_id = cursor.fetchone()[0]
+                cursor.executemany('''
+                    INSERT INTO review_log
+                        (user_id, flashcard_id, deck_id, rating, elapsed_ms,
+                         previous_interval, new_interval, was_learning, is_learning,
+                         reviewed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', entries)
+                _rollup_review_log(cursor, last_id)
+        except sqlite3.Error:
+            with _review_log_lock:
+                _review_log_buffer[:0] = entries
+            raise
+        return len(entries)
+
+
+def _flush_review_log_at_exit():
+    try:
+        flush_review_log()
+    except sqlite3.Error as e:
+        print(f"❌ Réponses perdues à l'arrêt ({len(_review_log_buffer)}): {e}")
 
-# --- FONCTIONS POUR LA PROGRESSION ---
 
-def get_user_progress(user_id, flashcard_id):
-    """Récupère la progression d'un utilisateur pour une flashcard"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM user_progress WHERE user_id = ? AND flashcard_id = ?',
-            (user_id, flashcard_id)
-        )
-        return cursor.fetchone()
+atexit.register(_flush_review_log_at_exit)
 
 
-def update_progress(user_id, flashcard_id, ease_factor, interval, due_date,
-                   step, is_learning, repetitions):
-    """Met à jour ou crée la progression d'un utilisateur (système Anki)"""
+def get_review_log(user_id, since=None, until=None):
+    """Récupère les réponses d'un utilisateur, dans l'ordre chronologique
+
+    Args:
+        since, until: Bornes ISO de reviewed_at (incluse, exclue), optionnelles
+    """
+    flush_review_log()
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO user_progress
-                (user_id, flashcard_id, ease_factor, interval, due_date,
-                 step, is_learning, repetitions, last_reviewed)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id, flashcard_id)
-            DO UPDATE SET
-                ease_factor = ?,
-                interval = ?,
-                due_date = ?,
-                step = ?,
-                is_learning = ?,
-                repetitions = ?,
-                last_reviewed = CURRENT_TIMESTAMP
-        ''', (user_id, flashcard_id, ease_factor, interval, due_date,
-              step, is_learning, repetitions,
-              ease_factor, interval, due_date, step, is_learning, repetitions))
+            SELECT * FROM review_log
+            WHERE user_id = ? AND reviewed_at >= ? AND reviewed_at < ?
+            ORDER BY reviewed_at, id
+        ''', (user_id, since or '', until or '9999'))
+        return cursor.fetchall()
 
 
-def get_all_user_progress(user_id, deck_id):
-    """Récupère toute la progression d'un utilisateur pour un deck (système Anki)"""
+def get_last_review_time(user_id, before=None):
+    """Heure ISO de la dernière réponse de l'utilisateur avant before (None s'il n'y en a pas)
+
+    Une seule descente dans idx_review_log_user : sert à valider les caches
+    des données d'activité.
+    """
+    flush_review_log()
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT
-                f.id, f.question, f.answer,
-                up.ease_factor, up.interval, up.due_date,
-                up.step, up.is_learning, up.repetitions
-            FROM flashcards f
-            LEFT JOIN user_progress up
-                ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            ORDER BY
-                CASE
-                    WHEN up.due_date IS NULL THEN 0
-                    WHEN up.due_date <= datetime('now') THEN 1
-                    ELSE 2
-                END,
-                up.due_date
-        ''', (user_id, deck_id))
-        return cursor.fetchall()
+            SELECT MAX(reviewed_at) FROM review_log
+            WHERE user_id = ? AND reviewed_at < ?
+        ''', (user_id, before or '9999'))
+        return cursor.fetchone()[0]
 
 
 # --- FONCTIONS POUR LES PROMPTS PERSONNALISÉS ---
@@ -563,110 +2807,75 @@ def save_user_prompt(user_id, custom_prompt):
 def get_user_flashcard_counts(user_id):
     """Récupère les compteurs de cartes nouvelles/à réapprendre/à réviser pour un utilisateur"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Cartes nouvelles (jamais étudiées)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND up.id IS NULL
-        ''', (user_id, user_id))
-        new_count = cursor.fetchone()['new_cards']
-
-        # Cartes à réapprendre (en apprentissage et dues)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
-
-        # Cartes à réviser (matures et dues)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id))
-        review_count = cursor.fetchone()['review_cards']
-
+        counts = _count_user_cards(conn.cursor(), user_id)
         return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
+            'new': counts['new_cards'],
+            'relearn': counts['relearn_cards'],
+            'review': counts['review_cards']
         }
 
 
 def get_user_statistics(user_id):
-    """Récupère les statistiques complètes d'un utilisateur (style Anki)"""
+    """Récupère les statistiques complètes d'un utilisateur (style Anki)
+
+    Les compteurs de cartes par deck sont lus dans deck_counters (voir
+    _CURRENT_DECK_COUNTERS), sans parcourir les cartes; les totaux en sont la
+    somme. L'activité vient de daily_review_stats, lue par plage sur sa clé
+    (user_id, day) : chaque réponse compte, pas seulement la dernière de
+    chaque carte.
+    """
+    from datetime import date, timedelta
+
+    flush_review_log()
+    today = date.today().isoformat()
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # Statistiques globales
-        cursor.execute('''
-            SELECT
-                COUNT(DISTINCT d.id) as total_decks,
-                COUNT(DISTINCT f.id) as total_cards,
-                COUNT(DISTINCT CASE WHEN up.id IS NOT NULL THEN f.id END) as cards_studied,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 1 THEN f.id END) as cards_learning,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 0 THEN f.id END) as cards_mature,
-                COUNT(DISTINCT CASE WHEN up.due_date <= datetime('now') THEN f.id END) as cards_due
-            FROM decks d
-            LEFT JOIN flashcards f ON d.id = f.deck_id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-        ''', (user_id, user_id))
-        global_stats = cursor.fetchone()
-
-        # Cartes révisées aujourd'hui
-        cursor.execute('''
-            SELECT COUNT(DISTINCT flashcard_id) as cards_today
-            FROM user_progress
-            WHERE user_id = ?
-            AND date(last_reviewed) = date('now')
-        ''', (user_id,))
-        today_stats = cursor.fetchone()
-
         # Statistiques par deck
-        cursor.execute('''
-            SELECT
-                d.name as deck_name,
-                COUNT(DISTINCT f.id) as total,
-                COUNT(DISTINCT CASE WHEN up.id IS NOT NULL THEN f.id END) as studied,
-                COUNT(DISTINCT CASE WHEN up.due_date <= datetime('now') THEN f.id END) as due,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 1 THEN f.id END) as learning,
-                COUNT(DISTINCT CASE WHEN up.is_learning = 0 THEN f.id END) as mature
-            FROM decks d
-            LEFT JOIN flashcards f ON d.id = f.deck_id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            GROUP BY d.id, d.name
+        cursor.execute(f'''
+            {_CURRENT_DECK_COUNTERS}
+            WHERE d.user_id = :user_id
             ORDER BY d.name
-        ''', (user_id, user_id))
-        deck_stats = cursor.fetchall()
+        ''', {'user_id': user_id, 'now': datetime.now().isoformat()})
+        deck_stats = [{
+            'deck_name': deck['name'],
+            'total': deck['total'],
+            'studied': deck['total'] - deck['new'],
+            'due': deck['relearn'] + deck['review'],
+            'learning': deck['learning'],
+            'mature': deck['total'] - deck['new'] - deck['learning'],
+        } for deck in cursor.fetchall()]
+
+        # Statistiques globales (chaque carte appartient à un seul deck)
+        global_stats = {
+            'total_decks': len(deck_stats),
+            'total_cards': sum(deck['total'] for deck in deck_stats),
+            'cards_studied': sum(deck['studied'] for deck in deck_stats),
+            'cards_learning': sum(deck['learning'] for deck in deck_stats),
+            'cards_mature': sum(deck['mature'] for deck in deck_stats),
+            'cards_due': sum(deck['due'] for deck in deck_stats),
+        }
 
-        # Activité des 30 derniers jours
+        # Activité des 30 derniers jours (aujourd'hui compris)
         cursor.execute('''
             SELECT
-                date(last_reviewed) as date,
-                COUNT(DISTINCT flashcard_id) as cards_reviewed
-            FROM user_progress
-            WHERE user_id = ?
-            AND date(last_reviewed) >= date('now', '-30 days')
-            GROUP BY date(last_reviewed)
-            ORDER BY date(last_reviewed)
-        ''', (user_id,))
+                day as date,
+                SUM(reviews) as reviews,
+                SUM(new_cards) as new_cards,
+                SUM(lapses) as lapses,
+                SUM(mature) as mature
+            FROM daily_review_stats
+            WHERE user_id = ? AND day >= ?
+            GROUP BY day
+            ORDER BY day
+        ''', (user_id, (date.today() - timedelta(days=29)).isoformat()))
         activity_stats = cursor.fetchall()
 
+        today_stats = {'reviews': 0, 'new_cards': 0, 'lapses': 0, 'mature': 0}
+        if activity_stats and activity_stats[-1]['date'] == today:
+            today_stats = dict(activity_stats[-1])
+
         return {
             'global': global_stats,
             'today': today_stats,
@@ -757,183 +2966,254 @@ def get_folder_statistics(user_id, folder_id):
     """Récupère les statistiques d'un dossier (nouvelles/réapprendre/réviser)"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        counters = _user_deck_counters(cursor, user_id)
 
-        # Cartes nouvelles dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ? AND up.id IS NULL
-        ''', (user_id, user_id, folder_id))
-        new_count = cursor.fetchone()['new_cards']
+        cursor.execute(
+            'SELECT id FROM decks WHERE user_id = ? AND folder_id = ?',
+            (user_id, folder_id)
+        )
+        stats = {'new': 0, 'relearn': 0, 'review': 0}
+        for row in cursor.fetchall():
+            for key in stats:
+                stats[key] += counters[row['id']][key]
+        return stats
 
-        # Cartes à réapprendre dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id, folder_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
 
-        # Cartes à réviser dans ce dossier
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ? AND d.folder_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, user_id, folder_id))
-        review_count = cursor.fetchone()['review_cards']
+def get_deck_statistics(user_id, deck_id):
+    """Récupère les statistiques d'un deck (nouvelles/réapprendre/réviser)"""
+    with get_db_connection() as conn:
+        counters = _user_deck_counters(conn.cursor(), user_id, deck_id)
+        return counters.get(deck_id, {'new': 0, 'relearn': 0, 'review': 0})
 
-        return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
-        }
 
+def get_folder_tree_statistics(user_id):
+    """Récupère en une seule requête les statistiques de tous les decks et dossiers
 
-def get_deck_statistics(user_id, deck_id):
-    """Récupère les statistiques d'un deck (nouvelles/réapprendre/réviser)"""
+    Remplace les appels récursifs get_user_folders / get_folder_statistics /
+    get_decks_in_folder / get_deck_statistics (plusieurs requêtes par dossier
+    et par deck). Les compteurs par deck viennent de deck_counters, lus sans
+    écrire (voir _CURRENT_DECK_COUNTERS); ceux d'un dossier incluent ceux de
+    ses sous-dossiers.
+
+    Returns:
+        Liste de lignes (kind, id, name, parent_id, created_at, new, relearn, review)
+        où kind vaut 'folder' ou 'deck'. Pour un deck, parent_id est son folder_id.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute(f'''
+            WITH RECURSIVE
+            deck_stats AS (
+                {_CURRENT_DECK_COUNTERS}
+                WHERE d.user_id = :user_id
+            ),
+            -- Chaque dossier est relié à lui-même et à tous ses ancêtres
+            -- (UNION et non UNION ALL: protège contre un cycle parent_id)
+            folder_ancestors(folder_id, ancestor_id) AS (
+                SELECT id, id FROM folders WHERE user_id = :user_id
+                UNION
+                SELECT fa.folder_id, p.parent_id
+                FROM folder_ancestors fa
+                INNER JOIN folders p ON p.id = fa.ancestor_id
+                WHERE p.parent_id IS NOT NULL
+            )
+            SELECT 'deck' as kind, deck_id as id, name, folder_id as parent_id, created_at,
+                   new, relearn, review
+            FROM deck_stats
+            UNION ALL
+            SELECT 'folder' as kind, fo.id, fo.name, fo.parent_id, fo.created_at,
+                   COALESCE(SUM(ds.new), 0), COALESCE(SUM(ds.relearn), 0),
+                   COALESCE(SUM(ds.review), 0)
+            FROM folders fo
+            LEFT JOIN folder_ancestors fa ON fa.ancestor_id = fo.id
+            LEFT JOIN deck_stats ds ON ds.folder_id = fa.folder_id
+            WHERE fo.user_id = :user_id
+            GROUP BY fo.id
+        ''', {'user_id': user_id, 'now': datetime.now().isoformat()})
+        return cursor.fetchall()
 
-        # Cartes nouvelles dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as new_cards
-            FROM flashcards f
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ? AND up.id IS NULL
-        ''', (user_id, deck_id))
-        new_count = cursor.fetchone()['new_cards']
 
-        # Cartes à réapprendre dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as relearn_cards
-            FROM flashcards f
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            AND up.is_learning = 1
-            AND up.due_date <= datetime('now')
-        ''', (user_id, deck_id))
-        relearn_count = cursor.fetchone()['relearn_cards']
+# --- FONCTIONS POUR LES STREAKS ---
 
-        # Cartes à réviser dans ce deck
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as review_cards
-            FROM flashcards f
-            INNER JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE f.deck_id = ?
-            AND up.is_learning = 0
-            AND up.due_date <= datetime('now')
-        ''', (user_id, deck_id))
-        review_count = cursor.fetchone()['review_cards']
+def _count_user_cards(cursor, user_id):
+    """Compte les cartes nouvelles/à réapprendre/à réviser d'un utilisateur
 
-        return {
-            'new': new_count,
-            'relearn': relearn_count,
-            'review': review_count
-        }
+    Somme des compteurs matérialisés de ses decks (voir deck_counters).
+    """
+    counts = {'new_cards': 0, 'relearn_cards': 0, 'review_cards': 0}
+    for deck in _user_deck_counters(cursor, user_id).values():
+        counts['new_cards'] += deck['new']
+        counts['relearn_cards'] += deck['relearn']
+        counts['review_cards'] += deck['review']
+    counts['cards_due'] = sum(counts.values())
+    return counts
 
 
-# --- FONCTIONS POUR LES STREAKS ---
+def _record_daily_activity(cursor, user_id, cards_reviewed, cards_due, all_completed):
+    """Met à jour l'entrée du jour dans daily_activity et les scores du classement avec le curseur fourni"""
+    from datetime import date, timedelta
+
+    today = date.today()
+    cursor.execute('''
+        INSERT INTO daily_activity
+            (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, date)
+        DO UPDATE SET
+            cards_reviewed = cards_reviewed + ?,
+            cards_due_completed = ?,
+            all_cards_completed = ?
+    ''', (user_id, today, cards_reviewed, cards_due, all_completed,
+          cards_reviewed, cards_due, all_completed))
+
+    if not cards_reviewed:
+        return
+
+    # Remise à zéro différée du streak interrompu de cet utilisateur
+    _persist_lapsed_streak(cursor, user_id, today)
+
+    # Score total : cartes × streak enregistré (mis à jour par _update_streak)
+    cursor.execute('''
+        INSERT INTO leaderboard_scores (user_id, period, period_start, cards, streak, score)
+        SELECT id, 'all', '', ?, COALESCE(streak_count, 0), ? * COALESCE(streak_count, 0)
+        FROM users WHERE id = ?
+        ON CONFLICT(user_id, period, period_start) DO UPDATE SET
+            cards = cards + excluded.cards,
+            streak = excluded.streak,
+            score = (cards + excluded.cards) * excluded.streak
+    ''', (cards_reviewed, cards_reviewed, user_id))
+
+    # Scores de la semaine et du mois : cartes révisées sur la période
+    cursor.executemany('''
+        INSERT INTO leaderboard_scores (user_id, period, period_start, cards, score)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, period, period_start) DO UPDATE SET
+            cards = cards + excluded.cards,
+            score = score + excluded.score
+    ''', [(user_id, period, leaderboard_period_start(period, today), cards_reviewed, cards_reviewed)
+          for period in ('week', 'month')])
+
+
+def _persist_lapsed_streak(cursor, user_id, today):
+    """Écrit la remise à zéro du streak de user_id s'il est interrompu
+
+    Seule la ligne de l'utilisateur qui répond est modifiée ; pour les autres,
+    les lectures calculent le streak réel avec effective_streak. Le score total
+    est remis à zéro ensuite par _record_daily_activity (cartes × streak).
+    """
+    cursor.execute(
+        'SELECT streak_count, last_streak_date FROM users WHERE id = ?',
+        (user_id,)
+    )
+    etat = cursor.fetchone()
+    if etat and etat['streak_count'] and \
+            not effective_streak(etat['streak_count'], etat['last_streak_date'], today):
+        cursor.execute('UPDATE users SET streak_count = 0 WHERE id = ?', (user_id,))
+
 
 def update_daily_activity(user_id, cards_reviewed, all_completed):
     """Met à jour l'activité quotidienne de l'utilisateur"""
-    from datetime import datetime, date
-
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        today = date.today()
 
         # Récupérer le nombre de cartes dues aujourd'hui
-        cursor.execute('''
-            SELECT COUNT(DISTINCT f.id) as cards_due
-            FROM flashcards f
-            INNER JOIN decks d ON f.deck_id = d.id
-            LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
-            WHERE d.user_id = ?
-            AND (up.due_date IS NULL OR up.due_date <= datetime('now'))
-        ''', (user_id, user_id))
-        cards_due = cursor.fetchone()['cards_due']
+        cards_due = _count_user_cards(cursor, user_id)['cards_due']
 
         # Mettre à jour ou créer l'entrée du jour
-        cursor.execute('''
-            INSERT INTO daily_activity
-                (user_id, date, cards_reviewed, cards_due_completed, all_cards_completed)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id, date)
-            DO UPDATE SET
-                cards_reviewed = cards_reviewed + ?,
-                cards_due_completed = ?,
-                all_cards_completed = ?
-        ''', (user_id, today, cards_reviewed, cards_due, all_completed,
-              cards_reviewed, cards_due, all_completed))
+        _record_daily_activity(cursor, user_id, cards_reviewed, cards_due, all_completed)
 
         # Mettre à jour le streak si toutes les cartes sont terminées
+        # (même connexion pour ne pas se bloquer sur notre propre verrou d'écriture)
         if all_completed:
-            update_streak(user_id)
+            _update_streak(cursor, user_id)
 
 
-def update_streak(user_id):
-    """Met à jour le streak de l'utilisateur"""
-    from datetime import datetime, date, timedelta
+def _update_streak(cursor, user_id):
+    """Met à jour le streak de l'utilisateur avec le curseur fourni"""
+    from datetime import date, timedelta
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        today = date.today()
+    today = date.today()
+
+    # Récupérer les infos actuelles de streak
+    cursor.execute(
+        'SELECT streak_count, last_streak_date FROM users WHERE id = ?',
+        (user_id,)
+    )
+    result = cursor.fetchone()
+    current_streak = result['streak_count'] or 0
+    last_date = result['last_streak_date']
 
-        # Récupérer les infos actuelles de streak
+    # Si c'est le premier streak ou si last_date est None
+    if not last_date:
         cursor.execute(
-            'SELECT streak_count, last_streak_date FROM users WHERE id = ?',
-            (user_id,)
+            'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
+            (today, user_id)
         )
-        result = cursor.fetchone()
-        current_streak = result['streak_count'] or 0
-        last_date = result['last_streak_date']
+        _update_leaderboard_streak(cursor, user_id, 1)
+        return 1
 
-        # Si c'est le premier streak ou si last_date est None
-        if not last_date:
-            cursor.execute(
-                'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
-                (today, user_id)
-            )
-            return 1
+    # Convertir last_date en objet date
+    if isinstance(last_date, str):
+        last_date = datetime.strptime(last_date, '%Y-%m-%d').date()
+
+    # Si c'était hier, on incrémente
+    if last_date == today - timedelta(days=1):
+        new_streak = current_streak + 1
+        cursor.execute(
+            'UPDATE users SET streak_count = ?, last_streak_date = ? WHERE id = ?',
+            (new_streak, today, user_id)
+        )
+        _update_leaderboard_streak(cursor, user_id, new_streak)
+        return new_streak
+    # Si c'est aujourd'hui, on garde le même
+    elif last_date == today:
+        return current_streak
+    # Sinon, le streak est cassé, on recommence à 1
+    else:
+        cursor.execute(
+            'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
+            (today, user_id)
+        )
+        _update_leaderboard_streak(cursor, user_id, 1)
+        return 1
 
-        # Convertir last_date en objet date
-        if isinstance(last_date, str):
-            last_date = datetime.strptime(last_date, '%Y-%m-%d').date()
 
-        # Si c'était hier, on incrémente
-        if last_date == today - timedelta(days=1):
-            new_streak = current_streak + 1
-            cursor.execute(
-                'UPDATE users SET streak_count = ?, last_streak_date = ? WHERE id = ?',
-                (new_streak, today, user_id)
-            )
-            return new_streak
-        # Si c'est aujourd'hui, on garde le même
-        elif last_date == today:
-            return current_streak
-        # Sinon, le streak est cassé, on recommence à 1
-        else:
-            cursor.execute(
-                'UPDATE users SET streak_count = 1, last_streak_date = ? WHERE id = ?',
-                (today, user_id)
-            )
-            return 1
+def _update_leaderboard_streak(cursor, user_id, streak):
+    """Répercute un nouveau streak sur le score total du classement"""
+    cursor.execute('''
+        UPDATE leaderboard_scores SET streak = ?, score = cards * ?
+        WHERE user_id = ? AND period = 'all' AND period_start = ''
+    ''', (streak, streak, user_id))
 
 
-def get_user_streak(user_id):
-    """Récupère le streak actuel de l'utilisateur"""
+def update_streak(user_id):
+    """Met à jour le streak de l'utilisateur"""
+    with get_db_connection() as conn:
+        return _update_streak(conn.cursor(), user_id)
+
+
+def effective_streak(streak_count, last_streak_date, today=None):
+    """Streak réel à partir de l'état enregistré, sans accès à la base
+
+    Le streak est interrompu si le dernier jour validé n'est ni aujourd'hui ni
+    hier ; users.streak_count n'est remis à zéro qu'à la prochaine écriture
+    (_record_daily_activity ou _update_streak).
+    """
     from datetime import date, timedelta
 
+    if not last_streak_date:
+        return 0
+    if isinstance(last_streak_date, str):
+        last_streak_date = datetime.strptime(last_streak_date, '%Y-%m-%d').date()
+
+    today = today or date.today()
+    if last_streak_date < today - timedelta(days=1):
+        return 0
+    return streak_count or 0
+
+
+def get_user_streak_state(user_id):
+    """Récupère l'état enregistré du streak: (streak_count, last_streak_date ISO ou None)"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
@@ -942,31 +3222,15 @@ def get_user_streak(user_id):
         )
         result = cursor.fetchone()
 
-        if not result:
-            return 0
-
-        streak = result['streak_count'] or 0
-        last_date = result['last_streak_date']
+    if not result:
+        return 0, None
+    last_date = result['last_streak_date']
+    return result['streak_count'] or 0, str(last_date) if last_date else None
 
-        # Si pas de date ou si la dernière date est trop ancienne (> 1 jour), streak = 0
-        if not last_date:
-            return 0
-
-        from datetime import datetime
-        if isinstance(last_date, str):
-            last_date = datetime.strptime(last_date, '%Y-%m-%d').date()
-
-        # Si la dernière date n'est pas aujourd'hui ou hier, le streak est cassé
-        today = date.today()
-        if last_date < today - timedelta(days=1):
-            # Réinitialiser le streak
-            cursor.execute(
-                'UPDATE users SET streak_count = 0 WHERE id = ?',
-                (user_id,)
-            )
-            return 0
 
-        return streak
+def get_user_streak(user_id):
+    """Récupère le streak actuel de l'utilisateur (lecture seule)"""
+    return effective_streak(*get_user_streak_state(user_id))
 
 
 def get_yearly_activity(user_id, year=None):
@@ -979,14 +3243,14 @@ def get_yearly_activity(user_id, year=None):
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # Récupérer toutes les activités de l'année
+        # Récupérer toutes les activités de l'année (plage sur UNIQUE(user_id, date))
         cursor.execute('''
             SELECT date, cards_reviewed, all_cards_completed
             FROM daily_activity
             WHERE user_id = ?
-            AND strftime('%Y', date) = ?
+            AND date >= ? AND date < ?
             ORDER BY date
-        ''', (user_id, str(year)))
+        ''', (user_id, f'{year}-01-01', f'{year + 1}-01-01'))
 
         activities = cursor.fetchall()
 
@@ -1005,27 +3269,134 @@ def get_yearly_activity(user_id, year=None):
         return activity_dict, max_cards
 
 
-def get_leaderboard():
-    """Récupère le classement des utilisateurs"""
+def get_latest_activity(user_id, year):
+    """Dernière journée d'activité d'une année (None si aucune)
+
+    Seule l'entrée du jour est modifiée (_record_daily_activity): cette ligne
+    suffit à savoir si le calendrier de l'année, tiré de la même table, a
+    changé.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT date, cards_reviewed, all_cards_completed
+            FROM daily_activity
+            WHERE user_id = ?
+            AND date >= ? AND date < ?
+            ORDER BY date DESC
+            LIMIT 1
+        ''', (user_id, f'{year}-01-01', f'{year + 1}-01-01'))
+        return cursor.fetchone()
+
+
+# --- FONCTIONS POUR LE CLASSEMENT ---
+#
+# leaderboard_scores garde un score par utilisateur et par période : 'all'
+# (cartes révisées depuis le début × streak), 'week' et 'month' (cartes
+# révisées pendant la semaine ou le mois commencé à period_start). Les scores
+# sont mis à jour à chaque réponse (_record_daily_activity) et à chaque
+# changement de streak (_update_streak). Un streak interrompu n'est remis à
+# zéro qu'à la réponse suivante de son utilisateur : le classement total le
+# compte à 0 à la lecture, pour l'affichage comme pour le tri.
+
+LEADERBOARD_PERIODS = ('all', 'week', 'month')
+
+
+def leaderboard_period_start(period, day):
+    """Début de la période contenant le jour day ('' pour le classement total)"""
+    from datetime import timedelta
+
+    if period == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if period == 'month':
+        return day.replace(day=1).isoformat()
+    return ''
+
+
+def _ensure_leaderboard_rows(cursor):
+    """Crée le score total (à 0) des utilisateurs qui n'en ont pas encore"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO leaderboard_scores (user_id, period, period_start)
+        SELECT id, 'all', '' FROM users
+    ''')
+
+
+def _backfill_leaderboard_scores(cursor):
+    """Calcule les scores du classement depuis l'historique de daily_activity"""
+    cursor.execute('''
+        INSERT INTO leaderboard_scores (user_id, period, period_start, cards, streak, score)
+        SELECT
+            da.user_id, 'all', '', SUM(da.cards_reviewed), COALESCE(u.streak_count, 0),
+            SUM(da.cards_reviewed) * COALESCE(u.streak_count, 0)
+        FROM daily_activity da
+        JOIN users u ON u.id = da.user_id
+        GROUP BY da.user_id
+    ''')
+    cursor.execute('''
+        INSERT INTO leaderboard_scores (user_id, period, period_start, cards, score)
+        SELECT user_id, 'week', date(date, 'weekday 0', '-6 days') as debut,
+               SUM(cards_reviewed), SUM(cards_reviewed)
+        FROM daily_activity
+        GROUP BY user_id, debut
+        UNION ALL
+        SELECT user_id, 'month', strftime('%Y-%m-01', date) as debut,
+               SUM(cards_reviewed), SUM(cards_reviewed)
+        FROM daily_activity
+        GROUP BY user_id, debut
+    ''')
+
+
+def get_leaderboard(period='all', limit=100):
+    """Récupère le classement des utilisateurs visibles
+
+    Args:
+        period: 'all' (cartes révisées totales × streak), 'week' ou 'month'
+            (cartes révisées depuis le début de la semaine ou du mois)
+
+    Un streak qui n'a pas été prolongé hier ou aujourd'hui est compté à 0,
+    même s'il n'a pas encore été remis à zéro dans users.
+    """
+    from datetime import date, timedelta
+
+    if period not in LEADERBOARD_PERIODS:
+        raise ValueError(f"Période inconnue: {period}")
+
+    today = date.today()
+    streak_from = (today - timedelta(days=1)).isoformat()
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # Calculer le score (cartes révisées totales × streak)
+        if period != 'all':
+            cursor.execute('''
+                SELECT
+                    u.id, u.username,
+                    CASE WHEN u.last_streak_date >= ? THEN u.streak_count ELSE 0 END as streak_count,
+                    ls.cards as total_cards, ls.score
+                FROM leaderboard_scores ls
+                JOIN users u ON u.id = ls.user_id
+                WHERE ls.period = ? AND ls.period_start = ?
+                AND u.show_in_leaderboard = 1
+                ORDER BY ls.score DESC, ls.streak DESC
+                LIMIT ?
+            ''', (streak_from, period, leaderboard_period_start(period, today), limit))
+            return cursor.fetchall()
+
+        # Tri sur le score réel (0 si le streak est interrompu) et non sur le
+        # score enregistré, qui n'est remis à zéro qu'à la réponse suivante
         cursor.execute('''
             SELECT
-                u.id,
-                u.username,
-                u.streak_count,
-                COALESCE(SUM(da.cards_reviewed), 0) as total_cards,
-                (COALESCE(SUM(da.cards_reviewed), 0) * COALESCE(u.streak_count, 0)) as score
-            FROM users u
-            LEFT JOIN daily_activity da ON u.id = da.user_id
-            WHERE u.show_in_leaderboard = 1
-            GROUP BY u.id, u.username, u.streak_count
-            ORDER BY score DESC, u.streak_count DESC
-            LIMIT 100
-        ''')
-
+                u.id, u.username,
+                CASE WHEN u.last_streak_date >= ? THEN ls.streak ELSE 0 END as streak_count,
+                ls.cards as total_cards,
+                CASE WHEN u.last_streak_date >= ? THEN ls.score ELSE 0 END as score
+            FROM leaderboard_scores ls
+            JOIN users u ON u.id = ls.user_id
+            WHERE ls.period = 'all' AND ls.period_start = ''
+            AND u.show_in_leaderboard = 1
+            ORDER BY score DESC, streak_count DESC, total_cards DESC, u.id
+            LIMIT ?
+        ''', (streak_from, streak_from, limit))
         return cursor.fetchall()
 
 
@@ -1077,8 +3448,15 @@ def get_show_in_leaderboard(user_id):
 
 
 if __name__ == '__main__':
+    import sys
+
     # Initialiser la base de données
     init_database()
     # Exécuter les migrations pour les bases existantes
     run_migrations()
     print("✅ Base de données configurée avec succès!")
+
+    # python database.py rebuild-counters : reconstruit deck_counters
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-counters':
+        rebuilt = rebuild_deck_counters()
+        print(f"✅ {rebuilt} compteurs de decks reconstruits")
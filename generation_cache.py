@@ -0,0 +1,66 @@
+"""
+Cache des réponses des API de génération (flashcards et fiches)
+
+La clé est l'empreinte de tout ce qui détermine la réponse : type de
+génération, provider, modèle, template de prompt, texte envoyé, nombre de
+flashcards et questions déjà présentes dans le deck. Un second clic sur
+"Générer" avec les mêmes paramètres est servi depuis la table
+generation_cache sans appeler l'API (ni consommer de quota).
+
+Les entrées expirent après CACHE_SETTINGS['ttl'] secondes et le cache garde
+au plus CACHE_SETTINGS['max_entries'] réponses (les moins récemment utilisées
+sont supprimées). Les générations en mode test (clé API non configurée) ne
+sont jamais mises en cache.
+"""
+import hashlib
+import json
+import time
+
+from database import get_generation_cache, save_generation_cache
+
+# Réglages du cache (modifiables avec configure_generation_cache)
+CACHE_SETTINGS = {
+    'ttl': 7 * 24 * 3600,   # Durée de validité d'une réponse (secondes)
+    'max_entries': 500,     # Nombre maximal de réponses conservées
+}
+
+
+def configure_generation_cache(**settings):
+    """Modifie les réglages du cache (voir CACHE_SETTINGS)"""
+    unknown = set(settings) - set(CACHE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    CACHE_SETTINGS.update(settings)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def generation_cache_key(kind, provider, model, prompt_template, texte,
+                         nb_flashcards=None, existing_questions=None):
+    """Calcule la clé de cache d'une génération"""
+    parts = {
+        'kind': kind,
+        'provider': provider,
+        'model': model,
+        'prompt_template': _digest(prompt_template),
+        'texte': _digest(texte),
+        'nb_flashcards': nb_flashcards,
+        'existing_questions': _digest('\n'.join(existing_questions or [])),
+    }
+    return _digest(json.dumps(parts, sort_keys=True))
+
+
+def get_cached_generation(cache_key):
+    """Retourne la réponse en cache pour cette clé (None si absente ou expirée)"""
+    response = get_generation_cache(cache_key, time.time() - CACHE_SETTINGS['ttl'])
+    return json.loads(response) if response is not None else None
+
+
+def cache_generation(cache_key, kind, value):
+    """Met en cache une réponse (valeur sérialisable en JSON)"""
+    save_generation_cache(
+        cache_key, kind, json.dumps(value),
+        CACHE_SETTINGS['max_entries'], time.time() - CACHE_SETTINGS['ttl']
+    )
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Import de decks de flashcards depuis des fichiers CSV, TSV ou des exports texte d'Anki
+
+Le fichier est lu ligne par ligne et inséré par lots (create_flashcards_bulk) :
+la mémoire utilisée ne dépend pas de la taille du fichier. Les questions déjà
+présentes dans le deck sont ignorées (contrainte UNIQUE(deck_id, question)).
+
+Usage:
+    python import_decks.py flashcards_data/stat.csv
+    python import_decks.py flashcards_data/*.csv --user test_user
+    python import_decks.py export_anki.txt --deck "Espagnol" --chunk-size 1000
+"""
+import argparse
+import csv
+import os
+import sys
+from itertools import islice
+
+from database import (
+    init_database, run_migrations, create_deck, create_flashcards_bulk,
+    get_user_by_username
+)
+
+# Nombre de lignes insérées par transaction
+CHUNK_SIZE = 500
+
+# Séparateurs reconnus dans l'en-tête "#separator:" des exports Anki
+ANKI_SEPARATORS = {
+    'tab': '\t', 'comma': ',', 'semicolon': ';', 'pipe': '|',
+    'space': ' ', 'colon': ':'
+}
+
+# Colonnes de métadonnées des exports Anki (ne contiennent pas de champ de la note)
+ANKI_META_COLUMNS = ('guid', 'notetype', 'deck', 'tags')
+
+
+def delimiter_for_filename(filename):
+    """Devine le séparateur d'après l'extension (None si inconnue)"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.tsv', '.txt'):
+        return '\t'
+    if extension == '.csv':
+        return ','
+    return None
+
+
+def _read_rows(lines, delimiter=None):
+    """Lit les lignes d'un fichier et renvoie les lignes CSV des champs question/réponse
+
+    Les en-têtes "#cle:valeur" placés en tête des exports Anki sont interprétés
+    (séparateur, colonnes de métadonnées) puis ignorés.
+
+    Yields:
+        Liste des champs de chaque ligne, sans les colonnes de métadonnées
+    """
+    lines = iter(lines)
+    meta_columns = set()
+    first_line = None
+
+    for line in lines:
+        if not line.startswith('#'):
+            first_line = line
+            break
+        key, _, value = line[1:].strip().partition(':')
+        key = key.strip().lower()
+        value = value.strip()
+        if key == 'separator':
+            delimiter = ANKI_SEPARATORS.get(value.lower(), value[:1] or delimiter)
+        elif key.endswith(' column') and key[:-len(' column')] in ANKI_META_COLUMNS:
+            if value.isdigit():
+                meta_columns.add(int(value) - 1)
+
+    if first_line is None:
+        return
+
+    if delimiter is None:
+        delimiter = '\t' if '\t' in first_line else ','
+
+    reader = csv.reader(_chain_first(first_line, lines), delimiter=delimiter)
+    for row in reader:
+        if meta_columns:
+            row = [field for i, field in enumerate(row) if i not in meta_columns]
+        yield row
+
+
+def _chain_first(first_line, lines):
+    """Remet la première ligne déjà lue devant le reste du flux"""
+    yield first_line
+    yield from lines
+
+
+def import_flashcards(lines, deck_id, delimiter=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Importe des flashcards dans un deck à partir d'un flux de lignes
+
+    Args:
+        lines: Itérable de lignes (fichier ouvert avec newline='')
+        deck_id: ID du deck de destination
+        delimiter: Séparateur des champs (deviné si None)
+        chunk_size: Nombre de lignes insérées par transaction
+        progress: Fonction appelée après chaque lot avec le dictionnaire des compteurs
+
+    Returns:
+        Dictionnaire {'read', 'inserted', 'skipped', 'invalid'}
+    """
+    stats = {'read': 0, 'inserted': 0, 'skipped': 0, 'invalid': 0}
+
+    def valid_rows():
+        for row in _read_rows(lines, delimiter):
+            stats['read'] += 1
+            question = row[0].strip() if len(row) > 0 else ''
+            answer = row[1].strip() if len(row) > 1 else ''
+            if not question or not answer:
+                stats['invalid'] += 1
+                continue
+            yield question, answer
+
+    rows = valid_rows()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        result = create_flashcards_bulk(deck_id, chunk)
+        stats['inserted'] += result['inserted']
+        stats['skipped'] += result['skipped']
+        if progress:
+            progress(stats)
+
+    return stats
+
+
+def import_file(path, deck_name=None, user_id=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Importe un fichier dans un deck (créé si besoin, nommé d'après le fichier par défaut)
+
+    Returns:
+        Tuple (deck_id, statistiques de import_flashcards)
+    """
+    if deck_name is None:
+        deck_name = os.path.splitext(os.path.basename(path))[0]
+
+    deck_id = create_deck(deck_name, user_id)
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        stats = import_flashcards(f, deck_id, delimiter_for_filename(path),
+                                  chunk_size, progress)
+    return deck_id, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Importe des decks depuis des fichiers CSV/TSV ou des exports texte d'Anki"
+    )
+    parser.add_argument('fichiers', nargs='+', help="Fichiers à importer")
+    parser.add_argument('--deck', help="Nom du deck (par défaut : nom du fichier)")
+    parser.add_argument('--user', help="Nom de l'utilisateur propriétaire du deck")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f"Lignes par transaction (défaut : {CHUNK_SIZE})")
+    args = parser.parse_args(argv)
+
+    init_database()
+    run_migrations()
+
+    user_id = None
+    if args.user:
+        user = get_user_by_username(args.user)
+        if not user:
+            print(f"❌ Utilisateur introuvable : {args.user}")
+            return 1
+        user_id = user['id']
+
+    for path in args.fichiers:
+        print(f"📥 Import de {path}")
+
+        def progress(stats):
+            print(f"   ... {stats['read']} lignes lues, {stats['inserted']} ajoutées", end='\r')
+
+        try:
+            deck_id, stats = import_file(path, args.deck, user_id, args.chunk_size, progress)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"❌ Erreur lors de l'import de {path}: {e}")
+            return 1
+
+        print(f"✅ Deck {deck_id}: {stats['inserted']} flashcard(s) ajoutée(s), "
+              f"{stats['skipped']} doublon(s), {stats['invalid']} ligne(s) invalide(s)")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
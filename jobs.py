@@ -0,0 +1,181 @@
+"""
+File de tâches de fond persistée dans SQLite (table jobs)
+
+Les appels aux API de génération durent de 10 à 60 secondes : au lieu de les
+exécuter dans la requête Flask, l'endpoint crée une tâche et rend la main.
+Un nombre borné de threads de travail réservent les tâches en attente
+(claim_next_job), exécutent le traitement associé à leur type et enregistrent
+le résultat. Les tâches étant en base, elles survivent à un redémarrage : les
+tâches interrompues sont remises en attente au démarrage des workers, au plus
+MAX_JOB_ATTEMPTS fois.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import traceback
+
+from database import (
+    create_job, claim_next_job, update_job_progress, finish_job, get_job,
+    requeue_orphan_jobs
+)
+
+# Nombre de threads de travail par processus
+JOB_WORKERS = 4
+
+# Délai (secondes) entre deux consultations de la file quand aucune tâche n'est signalée
+POLL_INTERVAL = 5
+
+# Nombre maximal de réservations d'une tâche interrompue (processus tombé)
+# avant qu'elle soit marquée en échec
+MAX_JOB_ATTEMPTS = 3
+
+
+class JobError(Exception):
+    """Erreur attendue d'une tâche : son message est présenté à l'utilisateur"""
+
+
+_handlers = {}
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_workers = []
+_workers_pid = None
+_workers_stop = None
+
+
+def register_handler(kind, handler):
+    """Associe un type de tâche à sa fonction de traitement
+
+    Le traitement est appelé avec (user_id, params, progress) où progress(message)
+    met à jour l'avancement. Il retourne un dictionnaire de résultat ou lève
+    JobError.
+    """
+    _handlers[kind] = handler
+
+
+def _pid_alive(pid):
+    """Indique si un processus existe encore sur cette machine"""
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_job(job):
+    """Exécute une tâche réservée et enregistre son résultat"""
+    handler = _handlers.get(job['kind'])
+    if handler is None:
+        finish_job(job['id'], error=f"Type de tâche inconnu: {job['kind']}")
+        return
+
+    def progress(message):
+        update_job_progress(job['id'], message)
+
+    try:
+        result = handler(job['user_id'], json.loads(job['params']), progress)
+    except JobError as e:
+        print(f"❌ Tâche {job['id']} en échec: {e}")
+        finish_job(job['id'], error=str(e))
+    except Exception as e:
+        print(f"❌ ERREUR dans la tâche {job['id']}: {e}")
+        traceback.print_exc()
+        finish_job(job['id'], error=f'Erreur serveur: {e}')
+    else:
+        finish_job(job['id'], result=result)
+
+
+def _worker_loop(stop):
+    while not stop.is_set():
+        job = claim_next_job(os.getpid())
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        run_job(job)
+
+
+def start_workers(workers=None):
+    """Démarre les threads de travail de ce processus (sans effet s'ils tournent déjà)
+
+    Appelée par le processus qui sert les requêtes (voir app.py) : les tâches
+    restées en attente ou interrompues par un redémarrage sont reprises sans
+    attendre une nouvelle soumission.
+    """
+    global _workers_pid, _workers_stop
+
+    # Pas de workers dans les processus lancés par multiprocessing (pool
+    # d'extraction des PDF), qui réimportent le module principal
+    if multiprocessing.parent_process() is not None:
+        return
+
+    with _lock:
+        # Après un fork, les threads du parent n'existent pas dans l'enfant
+        if _workers and _workers_pid == os.getpid():
+            return
+        _workers.clear()
+        _workers_pid = os.getpid()
+        _workers_stop = threading.Event()
+
+        requeued = requeue_orphan_jobs(_pid_alive, MAX_JOB_ATTEMPTS)
+        if requeued:
+            print(f"🔁 {requeued} tâche(s) interrompue(s) remise(s) en attente")
+
+        for i in range(workers or JOB_WORKERS):
+            thread = threading.Thread(target=_worker_loop, args=(_workers_stop,),
+                                      name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def stop_workers(timeout=None):
+    """Arrête les threads de travail de ce processus après leur tâche en cours"""
+    with _lock:
+        if not _workers or _workers_pid != os.getpid():
+            _workers.clear()
+            return
+        threads = list(_workers)
+        _workers.clear()
+        _workers_stop.set()
+        _wakeup.set()
+
+    for thread in threads:
+        thread.join(timeout)
+
+
+def submit_job(user_id, kind, params):
+    """Crée une tâche et réveille un worker
+
+    Returns:
+        ID de la tâche
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Type de tâche inconnu: {kind}")
+
+    job_id = create_job(user_id, kind, params)
+    start_workers()
+    _wakeup.set()
+    return job_id
+
+
+def job_status(job_id):
+    """Retourne l'état d'une tâche sous forme de dictionnaire (None si inconnue)"""
+    job = get_job(job_id)
+    if job is None:
+        return None
+
+    return {
+        'job_id': job['id'],
+        'user_id': job['user_id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'result': json.loads(job['result']) if job['result'] else None,
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at']
+    }
@@ -0,0 +1,199 @@
+"""
+Détection des quasi-doublons de flashcards, par deck et hors ligne
+
+La contrainte UNIQUE(deck_id, question) ne rejette que les questions
+identiques ; une question reformulée ("Qu'est-ce qu'une loi normale ?" /
+"Qu'est-ce que la loi normale ?") passe. Chaque question est
+réduite à l'ensemble de ses trigrammes de caractères (après normalisation),
+résumé par une signature MinHash découpée en bandes (LSH) : deux questions
+proches partagent au moins une bande avec une forte probabilité. Les bandes
+sont indexées dans la table flashcard_lsh ; la recherche des doublons d'une
+question ne lit que les cartes qui partagent une bande avec elle, puis
+vérifie la similarité de Jaccard exacte.
+
+Les mots de chaque question sont aussi indexés (table flashcard_terms) pour
+choisir les questions existantes les plus proches d'un extrait de cours, à
+inclure dans le prompt de génération.
+
+L'index d'un deck est mis à jour à la demande (index_deck) : seules les
+cartes ajoutées depuis la dernière indexation sont traitées.
+"""
+import hashlib
+import random
+import zlib
+
+from database import (
+    get_unindexed_flashcards, save_duplicate_index, get_lsh_candidates,
+    get_questions_by_terms
+)
+
+# Réglages de la détection (modifiables avec configure_near_duplicates)
+DUPLICATE_SETTINGS = {
+    'threshold': 0.6,   # Similarité de Jaccard (trigrammes) à partir de laquelle deux questions sont des doublons
+}
+
+# Signature MinHash : BANDS bandes de ROWS valeurs. Avec 10 bandes de 3, une
+# paire de similarité 0.6 est candidate avec une probabilité de 0.91, une paire
+# à 0.2 (questions sans rapport) avec 0.08 seulement. Modifier ces valeurs
+# impose de reconstruire les index.
+BANDS = 10
+ROWS = 3
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+
+# Mots trop fréquents pour caractériser une question
+MOTS_VIDES = {
+    'dans', 'pour', 'avec', 'sans', 'sont', 'être', 'cette', 'celui', 'celle', 'quel', 'quelle',
+    'quels', 'quelles', 'comment', 'pourquoi', 'quoi', 'questce', 'entre', 'leur', 'leurs',
+    'plus', 'moins', 'tout', 'tous', 'toute', 'toutes', 'fait', 'faire', 'peut', 'donner', 'donne',
+    'what', 'which', 'with', 'from', 'that', 'this', 'does', 'define', 'définir', 'définition',
+}
+
+
+def configure_near_duplicates(**settings):
+    """Modifie les réglages de la détection (voir DUPLICATE_SETTINGS)"""
+    unknown = set(settings) - set(DUPLICATE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    DUPLICATE_SETTINGS.update(settings)
+
+
+def normaliser_question(question):
+    """Forme normalisée d'une question pour la détection des doublons"""
+    return ' '.join(''.join(c for c in question.casefold() if c.isalnum() or c.isspace()).split())
+
+
+def shingles(question):
+    """Ensemble des trigrammes de caractères de la question normalisée"""
+    texte = normaliser_question(question)
+    if len(texte) <= SHINGLE_SIZE:
+        return {texte} if texte else set()
+    return {texte[i:i + SHINGLE_SIZE] for i in range(len(texte) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a, b):
+    """Similarité de Jaccard de deux ensembles"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_buckets(shingle_set):
+    """Buckets LSH (un par bande) d'un ensemble de trigrammes
+
+    Chaque bucket est un entier 64 bits signé, stable d'un processus à l'autre.
+    """
+    if not shingle_set:
+        return []
+
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr((band, rows)).encode('ascii'), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def termes(texte):
+    """Mots caractéristiques d'un texte (normalisés, 4 lettres ou plus, hors mots vides)"""
+    return {mot for mot in normaliser_question(texte).split()
+            if len(mot) >= 4 and mot not in MOTS_VIDES}
+
+
+def index_deck(deck_id):
+    """Indexe les flashcards du deck ajoutées depuis la dernière indexation
+
+    Returns:
+        Nombre de flashcards indexées
+    """
+    cards = get_unindexed_flashcards(deck_id)
+    if not cards:
+        return 0
+
+    buckets = []
+    terms = []
+    for card in cards:
+        buckets.extend((bucket, card['id']) for bucket in lsh_buckets(shingles(card['question'])))
+        terms.extend((term, card['id']) for term in termes(card['question']))
+
+    save_duplicate_index(deck_id, buckets, terms, cards[-1]['id'])
+    return len(cards)
+
+
+def find_near_duplicates(deck_id, question):
+    """Retourne les questions du deck quasi identiques à une question
+
+    L'index du deck doit être à jour (index_deck).
+
+    Returns:
+        Liste de tuples (flashcard_id, question, similarité), la plus proche en premier
+    """
+    shingle_set = shingles(question)
+    doublons = []
+    for candidate in get_lsh_candidates(deck_id, lsh_buckets(shingle_set)):
+        similarite = jaccard(shingle_set, shingles(candidate['question']))
+        if similarite >= DUPLICATE_SETTINGS['threshold']:
+            doublons.append((candidate['id'], candidate['question'], similarite))
+    doublons.sort(key=lambda d: -d[2])
+    return doublons
+
+
+def filter_near_duplicates(deck_id, cards):
+    """Retire d'une liste de cartes générées les quasi-doublons
+
+    Une carte est retirée si sa question est proche d'une question du deck
+    (deck_id peut être None pour un nouveau deck) ou d'une carte déjà retenue
+    dans la liste.
+
+    Args:
+        cards: Liste de dictionnaires avec au moins la clé 'question'
+
+    Returns:
+        Tuple (cartes retenues, cartes retirées)
+    """
+    if deck_id is not None:
+        index_deck(deck_id)
+
+    retenues = []
+    retirees = []
+    # Index LSH en mémoire des cartes retenues : {bucket: [trigrammes, ...]}
+    vues = {}
+    for card in cards:
+        shingle_set = shingles(card['question'])
+        buckets = lsh_buckets(shingle_set)
+
+        doublon = any(
+            jaccard(shingle_set, autre) >= DUPLICATE_SETTINGS['threshold']
+            for bucket in buckets for autre in vues.get(bucket, ())
+        )
+        if not doublon and deck_id is not None:
+            doublon = bool(find_near_duplicates(deck_id, card['question']))
+
+        if doublon:
+            retirees.append(card)
+            continue
+
+        retenues.append(card)
+        for bucket in buckets:
+            vues.setdefault(bucket, []).append(shingle_set)
+
+    return retenues, retirees
+
+
+def relevant_questions(deck_id, texte, limit=50):
+    """Choisit les questions existantes du deck les plus proches d'un extrait de cours
+
+    Les questions qui partagent le plus de mots rares avec l'extrait passent en
+    premier : ce sont celles que le modèle risque de reformuler.
+
+    Returns:
+        Liste de questions (au plus limit)
+    """
+    index_deck(deck_id)
+    return [row['question'] for row in get_questions_by_terms(deck_id, termes(texte), limit)]
@@ -0,0 +1,186 @@
+"""
+Extraction du texte des PDF avec cache par page
+
+Le texte de chaque page est conservé dans la base (tables pdf_documents et
+pdf_pages), indexé par l'empreinte SHA-256 du contenu du fichier et le numéro
+de page. Une nouvelle génération à partir du même PDF, ou d'une autre plage de
+pages, ne ré-analyse que les pages jamais extraites.
+
+Les pages manquantes d'un grand document sont réparties par plages contiguës
+sur un ProcessPoolExecutor (extract_text de PyPDF2 est du Python pur, limité
+par le CPU) ; les petits documents restent extraits en série. Le pool est
+créé une fois par processus, avec la méthode de démarrage 'spawn' : un fork
+du serveur, qui a plusieurs threads (requêtes, tâches de fond, journal des
+réponses), pourrait hériter d'un verrou pris par l'un d'eux.
+"""
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyPDF2 import PdfReader
+
+from database import get_pdf_page_count, get_cached_pdf_pages, save_pdf_pages
+
+# Réglages de l'extraction parallèle (modifiables avec configure_extraction)
+EXTRACTION_SETTINGS = {
+    'workers': os.cpu_count() or 1,   # Nombre de processus (1 = toujours en série)
+    'min_pages_parallel': 24,         # En dessous, l'extraction reste en série
+}
+
+# Empreintes déjà calculées : {chemin: (mtime_ns, taille, empreinte)}
+_hash_memo = {}
+
+# Pool de processus partagé par les extractions (voir _get_pool)
+_pool = None
+_pool_workers = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def configure_extraction(**settings):
+    """Modifie les réglages de l'extraction parallèle (voir EXTRACTION_SETTINGS)"""
+    unknown = set(settings) - set(EXTRACTION_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+    EXTRACTION_SETTINGS.update(settings)
+
+
+def hash_pdf(pdf_path):
+    """Calcule l'empreinte SHA-256 du contenu d'un fichier
+
+    Le résultat est mémorisé tant que la date de modification et la taille
+    du fichier ne changent pas.
+    """
+    stat = os.stat(pdf_path)
+    memo = _hash_memo.get(pdf_path)
+    if memo and memo[:2] == (stat.st_mtime_ns, stat.st_size):
+        return memo[2]
+
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    content_hash = digest.hexdigest()
+    _hash_memo[pdf_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+    return content_hash
+
+
+def _page_bounds(page_count, page_range):
+    """Convertit une plage (page_debut, page_fin) 1-indexed en bornes 0-indexed [debut, fin)"""
+    if not page_range:
+        return 0, page_count
+    page_debut, page_fin = page_range
+    return max(0, page_debut - 1), min(page_count, page_fin)
+
+
+def _extraire_plage(pdf_path, pages):
+    """Extrait une liste de pages dans un processus de travail (ouvre son propre lecteur)"""
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or '') for i in pages]
+
+
+def _get_pool(workers):
+    """Retourne le pool de processus de ce processus, créé au premier besoin
+
+    Il est recréé si le nombre de processus demandé change, ou dans un
+    processus issu d'un fork (les processus du pool appartiennent au parent).
+    """
+    global _pool, _pool_workers, _pool_pid
+
+    with _pool_lock:
+        if _pool is not None and (_pool_pid != os.getpid() or _pool_workers != workers):
+            if _pool_pid == os.getpid():
+                _pool.shutdown(wait=False)
+            _pool = None
+
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_extraction_pool():
+    """Arrête les processus du pool d'extraction (sans effet s'il n'existe pas)"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+atexit.register(shutdown_extraction_pool)
+
+
+def _extraire_en_parallele(pdf_path, missing, workers):
+    """Répartit les pages manquantes en plages contiguës sur le pool de processus
+
+    Returns:
+        Dictionnaire {page: texte}
+    """
+    taille = -(-len(missing) // workers)
+    plages = [missing[i:i + taille] for i in range(0, len(missing), taille)]
+
+    extracted = {}
+    executor = _get_pool(workers)
+    for resultats in executor.map(_extraire_plage, [pdf_path] * len(plages), plages):
+        extracted.update(resultats)
+    return extracted
+
+
+def _extraire_manquantes(pdf_path, reader, missing):
+    """Extrait les pages manquantes, en parallèle si le document est assez grand"""
+    workers = EXTRACTION_SETTINGS['workers']
+    if workers > 1 and len(missing) >= EXTRACTION_SETTINGS['min_pages_parallel']:
+        try:
+            return _extraire_en_parallele(pdf_path, missing, workers)
+        except (BrokenProcessPool, OSError) as e:
+            print(f"⚠️ Extraction parallèle impossible ({e}), extraction en série")
+            # Un pool cassé ne sert plus : le prochain appel en crée un neuf
+            shutdown_extraction_pool()
+
+    if reader is None:
+        reader = PdfReader(pdf_path)
+    return {i: reader.pages[i].extract_text() or '' for i in missing}
+
+
+def extraire_pages(pdf_path, page_range=None):
+    """Retourne la liste des textes des pages demandées, dans l'ordre
+
+    Args:
+        pdf_path: Chemin vers le fichier PDF
+        page_range: Tuple (page_debut, page_fin) 1-indexed, ou None pour tout le document
+    """
+    content_hash = hash_pdf(pdf_path)
+    reader = None
+
+    page_count = get_pdf_page_count(content_hash)
+    if page_count is None:
+        reader = PdfReader(pdf_path)
+        page_count = len(reader.pages)
+
+    debut, fin = _page_bounds(page_count, page_range)
+    if debut >= fin:
+        return []
+
+    pages = get_cached_pdf_pages(content_hash, debut, fin - 1)
+    missing = [i for i in range(debut, fin) if i not in pages]
+
+    if missing:
+        extracted = _extraire_manquantes(pdf_path, reader, missing)
+        save_pdf_pages(content_hash, page_count, extracted)
+        pages.update(extracted)
+
+    return [pages[i] for i in range(debut, fin)]
+
+
+def extraire_texte(pdf_path, page_range=None):
+    """Retourne le texte des pages demandées, chaque page suivie d'un saut de ligne"""
+    return ''.join(page + '\n' for page in extraire_pages(pdf_path, page_range))
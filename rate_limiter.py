@@ -0,0 +1,163 @@
+"""
+Limiteur de débit des API de génération, partagé entre processus
+
+Chaque couple (provider, clé API) a son bucket de jetons dans la base (table
+rate_buckets) : tous les workers et processus qui utilisent la même clé
+consomment les mêmes jetons, ce qui évite les erreurs 429 des quotas (Gemini
+gratuit : 60 requêtes par minute, 1500 par jour). La clé API n'est jamais
+stockée, seulement une empreinte.
+
+Les demandes en attente sont inscrites dans rate_waiters et servies
+équitablement : l'utilisateur servi le moins récemment passe en premier, un
+utilisateur qui lance une génération de 20 segments ne bloque donc pas les
+autres. L'attente est bornée (RATE_LIMIT_SETTINGS['max_wait']) : au-delà,
+RateLimitError est levée avec un message présentable à l'utilisateur.
+
+Le nombre d'appels simultanés par bucket est aussi plafonné (réservations
+dans rate_leases, libérées à la fin de l'appel ou expirées après
+lease_seconds si le processus meurt).
+
+Les demandes en attente interrogent la base en lecture seule et ne prennent
+le verrou d'écriture que pour réclamer un jeton. Les SDK ne refont pas
+eux-mêmes les appels échoués (max_retries=0 dans api_clients.py) : chaque
+tentative passe par le bucket.
+"""
+import hashlib
+import time
+from contextlib import contextmanager
+
+from database import (
+    enqueue_rate_waiter, peek_rate_token, touch_rate_waiter, try_acquire_rate_token,
+    cancel_rate_waiter, release_rate_lease, get_rate_limit_metrics
+)
+
+# Limites par provider (surchargeables dans config.py avec API_RATE_LIMITS,
+# appliqué au démarrage de app.py via configure_rate_limiter)
+#   per_minute: débit soutenu, burst: appels possibles d'un coup,
+#   per_day: quota journalier (None = illimité), max_concurrent: appels simultanés
+DEFAULT_RATE_LIMITS = {
+    'gemini': {'per_minute': 60, 'burst': 5, 'per_day': 1500, 'max_concurrent': 8},
+    'claude': {'per_minute': 50, 'burst': 5, 'per_day': None, 'max_concurrent': 8},
+    'openai': {'per_minute': 500, 'burst': 20, 'per_day': None, 'max_concurrent': 16},
+}
+
+# Réglages du limiteur (modifiables avec configure_rate_limiter)
+RATE_LIMIT_SETTINGS = {
+    'enabled': True,
+    'max_wait': 60.0,                                           # Attente maximale d'un appel (s)
+    'poll_interval': 0.25,                                      # Attente minimale entre deux essais (s)
+    'lease_seconds': 150.0,                                     # Durée max d'une réservation (s)
+    'limits': {provider: dict(limits) for provider, limits in DEFAULT_RATE_LIMITS.items()},
+}
+
+
+class RateLimitError(Exception):
+    """Attente trop longue avant de pouvoir appeler l'API : le message est présentable"""
+
+
+def configure_rate_limiter(**settings):
+    """Modifie les réglages du limiteur (voir RATE_LIMIT_SETTINGS)"""
+    unknown = set(settings) - set(RATE_LIMIT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Réglages inconnus: {', '.join(sorted(unknown))}")
+
+    # Les limites fournies complètent celles par défaut, provider par provider
+    limits = settings.pop('limits', None)
+    if limits:
+        for provider, overrides in limits.items():
+            RATE_LIMIT_SETTINGS['limits'].setdefault(provider, {}).update(overrides)
+    RATE_LIMIT_SETTINGS.update(settings)
+
+
+def bucket_key(provider, api_key):
+    """Identifiant du bucket d'un couple (provider, clé API), sans la clé en clair"""
+    digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+    return f'{provider}:{digest}'
+
+
+def _limits(provider):
+    limits = RATE_LIMIT_SETTINGS['limits'][provider]
+    return {
+        'rate': limits['per_minute'] / 60.0,
+        'burst': max(1, limits.get('burst') or 1),
+        'per_day': limits.get('per_day'),
+        'max_concurrent': limits.get('max_concurrent'),
+        'lease_seconds': RATE_LIMIT_SETTINGS['lease_seconds'],
+    }
+
+
+@contextmanager
+def limiteur_api(provider, api_key, user_id=None):
+    """Attend son tour avant un appel à l'API, pour la durée du bloc with
+
+    Usage:
+        with limiteur_api('claude', config.ANTHROPIC_API_KEY, user_id):
+            client.messages.create(...)
+
+    Raises:
+        RateLimitError: si l'appel n'a pas pu être accordé dans le délai max_wait
+    """
+    if not RATE_LIMIT_SETTINGS['enabled'] or provider not in RATE_LIMIT_SETTINGS['limits']:
+        yield
+        return
+
+    key = bucket_key(provider, api_key)
+    limits = _limits(provider)
+    poll = RATE_LIMIT_SETTINGS['poll_interval']
+    deadline = time.monotonic() + RATE_LIMIT_SETTINGS['max_wait']
+    # Une demande non revue pendant ce délai est considérée comme abandonnée
+    stale_after = max(10.0, 4 * max(poll, 1 / limits['rate']))
+
+    waiter_id = enqueue_rate_waiter(key, user_id)
+    vu = time.monotonic()
+    while True:
+        # Attente en lecture seule : le verrou d'écriture n'est pris que pour
+        # réclamer un jeton, ou pour signaler de temps en temps que la demande vit
+        attente = peek_rate_token(waiter_id, key, limits, stale_after)
+        if attente <= 0:
+            lease_id, attente = try_acquire_rate_token(waiter_id, key, limits, stale_after)
+            vu = time.monotonic()
+            if lease_id is not None:
+                break
+        elif time.monotonic() - vu >= stale_after / 3:
+            touch_rate_waiter(waiter_id)
+            vu = time.monotonic()
+
+        restant = deadline - time.monotonic()
+        if restant <= 0:
+            cancel_rate_waiter(waiter_id, key)
+            print(f"⏳ Limite de débit atteinte pour {provider} (utilisateur {user_id})")
+            raise RateLimitError(
+                f"Trop de requêtes vers l'API {provider} en ce moment, "
+                "réessayez dans quelques minutes"
+            )
+        time.sleep(min(max(attente, poll), restant, stale_after / 2))
+
+    try:
+        yield
+    finally:
+        release_rate_lease(lease_id)
+
+
+def rate_limiter_metrics():
+    """Métriques des buckets : file d'attente, appels en cours, temps d'attente
+
+    Returns:
+        Liste de dictionnaires (un par bucket)
+    """
+    metrics = []
+    for row in get_rate_limit_metrics():
+        granted = row['granted']
+        metrics.append({
+            'bucket': row['bucket_key'],
+            'queue_depth': row['queue_depth'],
+            'in_flight': row['in_flight'],
+            'tokens': round(row['tokens'], 2),
+            'day': row['day'],
+            'day_count': row['day_count'],
+            'granted': granted,
+            'rejected': row['rejected'],
+            'throttle_seconds': round(row['throttle_seconds'], 3),
+            'avg_throttle_seconds': round(row['throttle_seconds'] / granted, 3) if granted else 0.0,
+        })
+    return metrics
@@ -14,16 +14,35 @@ Usage:
 import unittest
 import os
 import tempfile
+import time
 from werkzeug.security import generate_password_hash
+import io
 
 # Importer toutes les fonctions à tester
 import database
 from database import (
     init_database, set_database_path,
     create_user, get_user_by_username, get_all_users,
-    create_deck, get_deck_by_name, get_all_decks, delete_deck,
+    create_deck, get_deck_by_name, get_all_decks, delete_deck, get_user_decks,
     create_flashcard, get_flashcards_by_deck, get_flashcard_by_id,
-    get_user_progress, update_progress, get_all_user_progress
+    get_user_progress, update_progress, get_all_user_progress,
+    get_user_flashcard_counts, review_transaction, get_next_card,
+    get_due_queue, record_review, get_card_with_progress,
+    create_folder, move_deck_to_folder, get_folder_tree_statistics,
+    get_deck_statistics, rebuild_deck_counters, create_flashcards_bulk
+)
+from import_decks import import_flashcards
+import import_decks
+import pdf_extraction
+import jobs
+import generation_cache
+import rate_limiter
+import near_duplicates
+import random
+from datetime import datetime, timedelta
+from anki_algorithm import (
+    AnkiCard, DEFAULT_CONFIG, calculate_next_review, calculate_next_review_batch, compile_config,
+    simulate
 )
 
 
@@ -57,7 +76,9 @@ class TestDatabase(unittest.TestCase):
 
     def tearDown(self):
         """Exécuté après chaque test - Nettoie la base de données temporaire"""
-        # Fermer et supprimer le fichier temporaire
+        # Écrire le journal en attente, fermer la connexion du pool puis supprimer le fichier temporaire
+        database.flush_review_log()
+        database.close_db_connection()
         os.close(self.test_db_fd)
         os.unlink(self.test_db_path)
 
@@ -135,6 +156,27 @@ class TestDecks(TestDatabase):
         # Devrait retourner le même ID
         self.assertEqual(deck_id1, deck_id2)
 
+    def test_manual_cards_append_to_user_deck(self):
+        """Test que des cartes créées à la main sous un nom existant s'ajoutent au deck de l'utilisateur
+
+        Même enchaînement que creer_flashcard_manuelle : create_deck puis
+        create_flashcards_bulk, une fois par carte saisie.
+        """
+        alice = create_user("alice", generate_password_hash("pass"))
+        bob = create_user("bob", generate_password_hash("pass"))
+
+        first = create_deck("Vocabulaire", alice)
+        create_flashcards_bulk(first, [("Hola", "Bonjour")])
+        second = create_deck("Vocabulaire", alice)
+        create_flashcards_bulk(second, [("Gracias", "Merci")])
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(get_flashcards_by_deck(first)), 2)
+        self.assertEqual(len(get_user_decks(alice)), 1)
+
+        # Un autre utilisateur a son propre deck du même nom
+        self.assertNotEqual(create_deck("Vocabulaire", bob), first)
+
     def test_get_deck_by_name(self):
         """Test de récupération d'un deck par nom"""
         deck_id = create_deck("Test Deck")
@@ -406,6 +448,1447 @@ class TestIntegration(TestDatabase):
         self.assertEqual(bob_history[0]['score'], 3)
 
 
+class TestReviewPipeline(TestDatabase):
+    """Tests pour l'enregistrement d'une réponse et la pioche en une seule transaction"""
+
+    def _vote(self, user_id, deck_id, flashcard_id, rating):
+        """Enchaînement de la route de vote : réponse puis pioche, dans review_transaction"""
+        with review_transaction():
+            record_review(user_id, flashcard_id, rating)
+            queue = get_due_queue(user_id, deck_id, 10)
+            return get_card_with_progress(user_id, queue[0]) if queue else None
+
+    def test_record_review_creates_progress(self):
+        """Test que la réponse crée la progression et l'activité du jour"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc1 = create_flashcard(deck_id, "Q1?", "A1")
+        create_flashcard(deck_id, "Q2?", "A2")
+
+        next_card = self._vote(user_id, deck_id, fc1, 2)
+
+        progress = get_user_progress(user_id, fc1)
+        self.assertIsNotNone(progress)
+        self.assertEqual(progress['step'], 1)
+        self.assertEqual(progress['is_learning'], 1)
+
+        # La carte suivante est la nouvelle carte restante
+        self.assertEqual(next_card['question'], "Q2?")
+
+        with database.get_db_connection() as conn:
+            activity = conn.execute(
+                'SELECT cards_reviewed FROM daily_activity WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        self.assertEqual(activity['cards_reviewed'], 1)
+
+    def test_record_review_updates_streak_when_all_done(self):
+        """Test que le streak est mis à jour quand toutes les cartes sont terminées"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc = create_flashcard(deck_id, "Q?", "A")
+
+        # Facile: graduation immédiate, plus aucune carte due
+        self.assertIsNone(self._vote(user_id, deck_id, fc, 3))
+
+        self.assertEqual(get_user_flashcard_counts(user_id),
+                         {'new': 0, 'relearn': 0, 'review': 0})
+        user = get_user_by_username("student")
+        self.assertEqual(user['streak_count'], 1)
+
+    def test_vote_uses_single_connection_and_commit(self):
+        """Test que le vote et la pioche n'ouvrent qu'une connexion et ne font qu'un COMMIT"""
+        from unittest import mock
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc = create_flashcard(deck_id, "Q?", "A")
+        create_flashcard(deck_id, "Q2?", "A2")
+
+        database.reset_db_connections()
+        statements = []
+        with mock.patch('database.sqlite3.connect', wraps=database.sqlite3.connect) as connect:
+            with database.get_db_connection() as conn:
+                conn.set_trace_callback(statements.append)
+            self._vote(user_id, deck_id, fc, 2)
+            with database.get_db_connection() as conn:
+                conn.set_trace_callback(None)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(statements.count('BEGIN IMMEDIATE'), 1)
+        self.assertEqual(statements.count('COMMIT'), 1)
+
+    def test_failed_draw_rolls_back_vote(self):
+        """Test qu'une erreur pendant la pioche annule aussi la réponse"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc = create_flashcard(deck_id, "Q?", "A")
+
+        with self.assertRaises(RuntimeError):
+            with review_transaction():
+                record_review(user_id, fc, 2)
+                raise RuntimeError("pioche impossible")
+
+        self.assertIsNone(get_user_progress(user_id, fc))
+        self.assertEqual(get_next_card(user_id, deck_id)['id'], fc)
+
+
+class TestNextCard(TestDatabase):
+    """Tests pour la pioche indexée de la carte suivante"""
+
+    def _set_due(self, user_id, flashcard_id, due_date):
+        """Crée une progression en révision avec l'échéance donnée"""
+        update_progress(user_id, flashcard_id, 2.5, 1, due_date.isoformat(), 0, 0, 1)
+
+    def test_overdue_before_new(self):
+        """Test que la carte la plus en retard passe avant les nouvelles"""
+        from datetime import datetime, timedelta
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        create_flashcard(deck_id, "Nouvelle", "A")
+        fc_late = create_flashcard(deck_id, "En retard", "A")
+        fc_later = create_flashcard(deck_id, "Très en retard", "A")
+        now = datetime.now()
+        self._set_due(user_id, fc_late, now - timedelta(hours=1))
+        self._set_due(user_id, fc_later, now - timedelta(days=2))
+
+        self.assertEqual(get_next_card(user_id, deck_id)['id'], fc_later)
+
+    def test_new_card_when_nothing_due(self):
+        """Test qu'une nouvelle carte est piochée quand rien n'est en retard"""
+        from datetime import datetime, timedelta
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc_future = create_flashcard(deck_id, "Plus tard", "A")
+        fc_new = create_flashcard(deck_id, "Nouvelle", "A")
+        self._set_due(user_id, fc_future, datetime.now() + timedelta(days=1))
+
+        carte = get_next_card(user_id, deck_id)
+        self.assertEqual(carte['id'], fc_new)
+        self.assertIsNone(carte['due_date'])
+
+    def test_earliest_future_card(self):
+        """Test que la prochaine carte à venir est piochée en dernier recours"""
+        from datetime import datetime, timedelta
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        other_deck = create_deck("Autre", user_id)
+        fc_far = create_flashcard(deck_id, "Dans un mois", "A")
+        fc_soon = create_flashcard(deck_id, "Demain", "A")
+        fc_other = create_flashcard(other_deck, "Autre deck", "A")
+        now = datetime.now()
+        self._set_due(user_id, fc_far, now + timedelta(days=30))
+        self._set_due(user_id, fc_soon, now + timedelta(days=1))
+        self._set_due(user_id, fc_other, now - timedelta(days=1))
+
+        self.assertEqual(get_next_card(user_id, deck_id)['id'], fc_soon)
+
+    def test_due_queue_uses_index(self):
+        """Test que la file des cartes dues est lue via l'index composite"""
+        with database.get_db_connection() as conn:
+            plan = conn.execute('''
+                EXPLAIN QUERY PLAN
+                SELECT f.id FROM user_progress up
+                INNER JOIN flashcards f ON f.id = up.flashcard_id
+                WHERE up.user_id = ? AND up.due_date <= ? AND f.deck_id = ?
+                ORDER BY up.due_date LIMIT 1
+            ''', (1, '2000-01-01', 1)).fetchall()
+        details = ' '.join(row['detail'] for row in plan)
+        self.assertIn('idx_progress_user_due', details)
+        self.assertNotIn('TEMP B-TREE', details)
+
+    def test_next_card_queries_are_bounded_seeks(self):
+        """Test que les cartes dues d'un deck et ses nouvelles cartes sont lues par recherche d'index"""
+        with database.get_db_connection() as conn:
+            due_plan = conn.execute('''
+                EXPLAIN QUERY PLAN
+                SELECT f.id FROM user_progress up
+                INNER JOIN flashcards f ON f.id = up.flashcard_id
+                WHERE up.user_id = ? AND up.deck_id = ? AND up.due_date <= ?
+                ORDER BY up.due_date LIMIT 1
+            ''', (1, 1, '2000-01-01')).fetchall()
+            new_plan = conn.execute('''
+                EXPLAIN QUERY PLAN
+                SELECT f.id FROM flashcards f
+                LEFT JOIN user_progress up ON f.id = up.flashcard_id AND up.user_id = ?
+                WHERE f.deck_id = ? AND f.id > ? AND up.due_date IS NULL
+                ORDER BY f.id LIMIT 1
+            ''', (1, 1, 0)).fetchall()
+        due_details = ' '.join(row['detail'] for row in due_plan)
+        self.assertIn('idx_progress_user_deck_due (user_id=? AND deck_id=? AND due_date<?)', due_details)
+        self.assertNotIn('TEMP B-TREE', due_details)
+        self.assertIn('deck_id=? AND rowid>?', ' '.join(row['detail'] for row in new_plan))
+
+    def test_new_card_cursor_follows_reviews(self):
+        """Test que le curseur des nouvelles cartes avance avec les premières révisions"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        cards = [create_flashcard(deck_id, f"Q{i}", "A") for i in range(3)]
+
+        def studied_until():
+            with database.get_db_connection() as conn:
+                return database._studied_until(conn.cursor(), user_id, deck_id)
+
+        record_review(user_id, cards[0], 2)
+        record_review(user_id, cards[2], 2)  # Hors ordre: le curseur s'arrête à cards[1]
+        self.assertEqual(studied_until(), cards[0])
+        self.assertEqual(get_next_card(user_id, deck_id)['id'], cards[1])
+
+        record_review(user_id, cards[1], 2)
+        self.assertEqual(studied_until(), cards[2])
+
+        # Une carte ajoutée ensuite est au-delà du curseur
+        fc_added = create_flashcard(deck_id, "Ajoutée", "A")
+        self.assertEqual(get_next_card(user_id, deck_id)['id'], fc_added)
+        self.assertEqual(get_due_queue(user_id, deck_id, 10), [fc_added])
+
+        rebuild_deck_counters(user_id)
+        self.assertEqual(studied_until(), cards[2])
+
+
+class TestStudyQueue(TestDatabase):
+    """Tests pour la file préchargée des sessions d'étude"""
+
+    def test_due_queue_order_and_limit(self):
+        """Test que la file contient les cartes en retard puis les nouvelles"""
+        from datetime import datetime, timedelta
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc_new1 = create_flashcard(deck_id, "Nouvelle 1", "A")
+        fc_new2 = create_flashcard(deck_id, "Nouvelle 2", "A")
+        fc_late = create_flashcard(deck_id, "En retard", "A")
+        fc_future = create_flashcard(deck_id, "Plus tard", "A")
+        now = datetime.now()
+        update_progress(user_id, fc_late, 2.5, 1, (now - timedelta(days=1)).isoformat(), 0, 0, 1)
+        update_progress(user_id, fc_future, 2.5, 1, (now + timedelta(days=1)).isoformat(), 0, 0, 1)
+
+        self.assertEqual(get_due_queue(user_id, deck_id, 10), [fc_late, fc_new1, fc_new2])
+        self.assertEqual(get_due_queue(user_id, deck_id, 2), [fc_late, fc_new1])
+
+    def test_record_review_returns_new_state(self):
+        """Test que record_review enregistre et retourne le nouvel état"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Maths", user_id)
+        fc = create_flashcard(deck_id, "Q?", "A")
+
+        new_card = record_review(user_id, fc, 0)
+
+        self.assertTrue(new_card.is_learning)
+        carte = get_card_with_progress(user_id, fc)
+        self.assertEqual(carte['question'], "Q?")
+        self.assertEqual(carte['due_date'], new_card.due_date.isoformat())
+
+
+class TestFolderTree(TestDatabase):
+    """Tests pour les statistiques agrégées de l'arborescence"""
+
+    def test_folder_stats_roll_up_subfolders(self):
+        """Test que les compteurs d'un dossier incluent ses sous-dossiers"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        parent = create_folder(user_id, "Maths")
+        child = create_folder(user_id, "Analyse", parent)
+        deck_parent = create_deck("Algèbre", user_id)
+        deck_child = create_deck("Intégrales", user_id)
+        deck_root = create_deck("Racine", user_id)
+        move_deck_to_folder(deck_parent, parent)
+        move_deck_to_folder(deck_child, child)
+        create_flashcard(deck_parent, "Q1", "A")
+        create_flashcard(deck_child, "Q2", "A")
+        create_flashcard(deck_child, "Q3", "A")
+        create_flashcard(deck_root, "Q4", "A")
+
+        rows = {(r['kind'], r['id']): r for r in get_folder_tree_statistics(user_id)}
+
+        self.assertEqual(rows[('folder', parent)]['new'], 3)
+        self.assertEqual(rows[('folder', child)]['new'], 2)
+        self.assertEqual(rows[('deck', deck_child)]['new'], 2)
+        self.assertEqual(rows[('deck', deck_child)]['parent_id'], child)
+        self.assertIsNone(rows[('deck', deck_root)]['parent_id'])
+
+    def test_empty_folder_and_other_users(self):
+        """Test qu'un dossier vide compte zéro et que les autres utilisateurs sont ignorés"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        other_id = create_user("other", generate_password_hash("pass"))
+        folder = create_folder(user_id, "Vide")
+        other_deck = create_deck("Autre", other_id)
+        create_flashcard(other_deck, "Q", "A")
+
+        rows = get_folder_tree_statistics(user_id)
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['kind'], rows[0]['id'], rows[0]['new']), ('folder', folder, 0))
+
+
+class TestConnectionPool(TestDatabase):
+    """Tests pour le pool de connexions"""
+
+    def test_connection_reused_in_thread(self):
+        """Test que la connexion est réutilisée d'un appel à l'autre"""
+        with database.get_db_connection() as conn1:
+            pass
+        with database.get_db_connection() as conn2:
+            pass
+        self.assertIs(conn1, conn2)
+
+    def test_wal_mode_enabled(self):
+        """Test que la base est en mode WAL"""
+        with database.get_db_connection() as conn:
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode.lower(), 'wal')
+
+    def test_nested_blocks_share_transaction(self):
+        """Test qu'une erreur dans le bloc externe annule aussi le bloc imbriqué"""
+        with self.assertRaises(RuntimeError):
+            with database.get_db_connection():
+                create_user("ghost", generate_password_hash("pass"))
+                raise RuntimeError("échec après l'insertion")
+
+        self.assertIsNone(get_user_by_username("ghost"))
+
+    def test_caught_nested_error_not_committed(self):
+        """Test qu'un bloc imbriqué en échec, rattrapé par l'appelant, n'est pas validé par le bloc externe"""
+        def failing_create(username):
+            with database.get_db_connection():
+                create_user(username, generate_password_hash("pass"))
+                raise RuntimeError("échec après l'insertion")
+
+        with database.get_db_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            create_user("kept", generate_password_hash("pass"))
+            with self.assertRaises(RuntimeError):
+                failing_create("ghost")
+            create_user("kept_after", generate_password_hash("pass"))
+
+        # Transaction ouverte par le bloc imbriqué lui-même
+        with database.get_db_connection():
+            with self.assertRaises(RuntimeError):
+                failing_create("ghost_2")
+            create_user("kept_last", generate_password_hash("pass"))
+
+        for username in ("kept", "kept_after", "kept_last"):
+            self.assertIsNotNone(get_user_by_username(username))
+        self.assertIsNone(get_user_by_username("ghost"))
+        self.assertIsNone(get_user_by_username("ghost_2"))
+
+    def test_connection_per_thread(self):
+        """Test que chaque thread a sa propre connexion"""
+        import threading
+
+        with database.get_db_connection() as main_conn:
+            pass
+        other = []
+
+        def worker():
+            with database.get_db_connection() as conn:
+                other.append(conn)
+                create_user("thread_user", generate_password_hash("pass"))
+            database.close_db_connection()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other[0], main_conn)
+        self.assertIsNotNone(get_user_by_username("thread_user"))
+
+    def test_configure_rejects_unknown_setting(self):
+        """Test que les réglages inconnus sont refusés"""
+        with self.assertRaises(ValueError):
+            database.configure_database(journal='WAL')
+
+
+class TestDeckCounters(TestDatabase):
+    """Tests pour les compteurs matérialisés par deck"""
+
+    def _counters_after_rebuild(self, user_id, deck_id):
+        rebuild_deck_counters(user_id)
+        return get_deck_statistics(user_id, deck_id)
+
+    def test_incremental_counts_match_rebuild(self):
+        """Test que les mises à jour incrémentales donnent le même résultat qu'un recalcul"""
+        from datetime import datetime, timedelta
+
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Test Deck", user_id)
+        cards = [create_flashcard(deck_id, f"Q{i}", "A") for i in range(5)]
+        self.assertEqual(get_deck_statistics(user_id, deck_id),
+                         {'new': 5, 'relearn': 0, 'review': 0})
+
+        past = (datetime.now() - timedelta(days=1)).isoformat()
+        future = (datetime.now() + timedelta(days=3)).isoformat()
+        update_progress(user_id, cards[0], 2.5, 0, past, 0, 1, 0)
+        update_progress(user_id, cards[1], 2.5, 1, past, 0, 0, 1)
+        update_progress(user_id, cards[2], 2.5, 3, future, 0, 0, 2)
+        record_review(user_id, cards[3], 2)
+        # Une carte due qui repart dans le futur
+        update_progress(user_id, cards[0], 2.5, 4, future, 0, 0, 1)
+
+        incremental = get_deck_statistics(user_id, deck_id)
+        self.assertEqual(incremental, {'new': 1, 'relearn': 0, 'review': 1})
+        self.assertEqual(self._counters_after_rebuild(user_id, deck_id), incremental)
+
+    def test_card_becoming_due_is_counted(self):
+        """Test qu'une carte dont l'échéance est franchie entre dans les compteurs"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Test Deck", user_id)
+        fc = create_flashcard(deck_id, "Q", "A")
+
+        soon = '2000-01-01T00:00:00'
+        get_deck_statistics(user_id, deck_id)
+        # Simule une échéance future au moment du calcul, franchie depuis
+        with database.get_db_connection() as conn:
+            conn.execute(
+                "UPDATE deck_counters SET counted_until = '1999-01-01T00:00:00'"
+            )
+        update_progress(user_id, fc, 2.5, 1, soon, 0, 0, 1)
+
+        self.assertEqual(get_deck_statistics(user_id, deck_id),
+                         {'new': 0, 'relearn': 0, 'review': 1})
+
+    def test_new_card_and_deleted_deck(self):
+        """Test que l'ajout d'une carte et la suppression d'un deck mettent à jour les compteurs"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Test Deck", user_id)
+        create_flashcard(deck_id, "Q1", "A")
+        self.assertEqual(get_user_flashcard_counts(user_id)['new'], 1)
+
+        create_flashcard(deck_id, "Q2", "A")
+        create_flashcard(deck_id, "Q2", "A")  # Doublon ignoré
+        self.assertEqual(get_user_flashcard_counts(user_id)['new'], 2)
+
+        delete_deck(deck_id)
+        self.assertEqual(get_user_flashcard_counts(user_id)['new'], 0)
+        with database.get_db_connection() as conn:
+            remaining = conn.execute('SELECT COUNT(*) FROM deck_counters').fetchone()[0]
+        self.assertEqual(remaining, 0)
+
+    def _counter_rows(self):
+        with database.get_db_connection() as conn:
+            return {row['deck_id']: tuple(row) for row in conn.execute('SELECT * FROM deck_counters')}
+
+    def _make_stale(self, user_id, deck_id, flashcard_id):
+        """Carte devenue due après le dernier calcul des compteurs du deck"""
+        update_progress(user_id, flashcard_id, 2.5, 1, '2000-01-01T00:00:00', 0, 0, 1)
+        with database.get_db_connection() as conn:
+            conn.execute('''
+                UPDATE deck_counters
+                SET review_count = 0, counted_until = '1999-01-01T00:00:00',
+                    next_due = '2000-01-01T00:00:00'
+                WHERE deck_id = ?
+            ''', (deck_id,))
+
+    def test_reads_do_not_write(self):
+        """Test que la lecture des compteurs n'écrit pas, même quand une échéance est franchie"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        folder = create_folder(user_id, "Langues")
+        deck_id = create_deck("Test Deck", user_id)
+        move_deck_to_folder(deck_id, folder)
+        fc = create_flashcard(deck_id, "Q1", "A")
+        create_flashcard(deck_id, "Q2", "A")
+        self._make_stale(user_id, deck_id, fc)
+        # Deck créé sans passer par create_deck: pas de ligne de compteurs
+        with database.get_db_connection() as conn:
+            legacy = conn.execute(
+                "INSERT INTO decks (name, user_id) VALUES ('Ancien', ?)", (user_id,)
+            ).lastrowid
+        create_flashcard(legacy, "Q3", "A")
+
+        rows = self._counter_rows()
+        with database.get_db_connection() as conn:
+            changes = conn.total_changes
+        expected = {'new': 1, 'relearn': 0, 'review': 1}
+        self.assertEqual(get_deck_statistics(user_id, deck_id), expected)
+        self.assertEqual(get_deck_statistics(user_id, legacy), {'new': 1, 'relearn': 0, 'review': 0})
+        self.assertEqual(database.get_folder_statistics(user_id, folder), expected)
+        self.assertEqual(get_user_flashcard_counts(user_id), {'new': 2, 'relearn': 0, 'review': 1})
+        tree = {(r['kind'], r['id']): r for r in get_folder_tree_statistics(user_id)}
+        self.assertEqual(tree[('folder', folder)]['review'], 1)
+        self.assertEqual(tree[('deck', legacy)]['new'], 1)
+        with database.get_db_connection() as conn:
+            self.assertEqual(conn.total_changes, changes)
+        self.assertEqual(self._counter_rows(), rows)
+
+    def test_vote_updates_only_its_deck(self):
+        """Test qu'un vote n'écrit que les compteurs du deck de la carte notée"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Voté", user_id)
+        other_deck = create_deck("Autre", user_id)
+        fc = create_flashcard(deck_id, "Q", "A")
+        self._make_stale(user_id, other_deck, create_flashcard(other_deck, "Q", "A"))
+        other_row = self._counter_rows()[other_deck]
+
+        record_review(user_id, fc, 2)
+
+        self.assertEqual(self._counter_rows()[other_deck], other_row)
+        self.assertEqual(get_user_flashcard_counts(user_id), {'new': 0, 'relearn': 0, 'review': 1})
+        with database.get_db_connection() as conn:
+            activity = conn.execute('SELECT cards_due_completed FROM daily_activity').fetchone()
+        self.assertEqual(activity['cards_due_completed'], 1)
+
+
+class TestBulkFlashcards(TestDatabase):
+    """Tests pour l'insertion groupée de flashcards"""
+
+    def test_bulk_insert_counts(self):
+        """Test que les doublons (base et lot) sont comptés comme ignorés"""
+        deck_id = create_deck("Test Deck")
+        create_flashcard(deck_id, "Q1", "A1")
+
+        result = create_flashcards_bulk(deck_id, [
+            ("Q1", "A1"), ("Q2", "A2"), ("Q3", "A3"), ("Q3", "autre")
+        ])
+
+        self.assertEqual(result, {'inserted': 2, 'skipped': 2})
+        self.assertEqual(len(get_flashcards_by_deck(deck_id)), 3)
+
+    def test_bulk_insert_empty_and_counters(self):
+        """Test une liste vide et la mise à jour des compteurs de cartes nouvelles"""
+        user_id = create_user("student", generate_password_hash("pass"))
+        deck_id = create_deck("Test Deck", user_id)
+        self.assertEqual(create_flashcards_bulk(deck_id, []), {'inserted': 0, 'skipped': 0})
+        self.assertEqual(get_deck_statistics(user_id, deck_id)['new'], 0)
+
+        create_flashcards_bulk(deck_id, ((f"Q{i}", "A") for i in range(50)))
+
+        self.assertEqual(get_deck_statistics(user_id, deck_id)['new'], 50)
+
+
+class TestImportDecks(TestDatabase):
+    """Tests pour l'import de decks CSV/TSV"""
+
+    def test_import_csv_in_chunks(self):
+        """Test l'import d'un CSV par lots, avec champs multilignes, doublons et lignes invalides"""
+        deck_id = create_deck("Import")
+        data = io.StringIO(
+            'Q1,A1\n'
+            '"Q2, avec virgule","ligne 1\nligne 2"\n'
+            'Q1,doublon\n'
+            'sans réponse\n'
+            'Q3,A3\n'
+        )
+        batches = []
+
+        stats = import_flashcards(data, deck_id, chunk_size=2,
+                                  progress=lambda s: batches.append(s['read']))
+
+        self.assertEqual(stats, {'read': 5, 'inserted': 3, 'skipped': 1, 'invalid': 1})
+        self.assertEqual(batches, [2, 5])
+        answers = {c['question']: c['answer'] for c in get_flashcards_by_deck(deck_id)}
+        self.assertEqual(answers["Q2, avec virgule"], "ligne 1\nligne 2")
+
+    def test_reimport_appends_to_existing_deck(self):
+        """Test qu'un second import sous le même nom complète le deck de l'utilisateur (importer_deck)"""
+        user_id = create_user("importer", generate_password_hash("pass"))
+        paths = []
+        for content in ('Q1,A1\nQ2,A2\n', 'Q2,A2\nQ3,A3\n'):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+                f.write(content)
+            paths.append(f.name)
+        try:
+            first, _ = import_decks.import_file(paths[0], 'Import', user_id)
+            second, stats = import_decks.import_file(paths[1], 'Import', user_id)
+        finally:
+            for path in paths:
+                os.unlink(path)
+
+        self.assertEqual(first, second)
+        self.assertEqual((stats['inserted'], stats['skipped']), (1, 1))
+        self.assertEqual(len(get_flashcards_by_deck(first)), 3)
+
+    def test_import_anki_text_export(self):
+        """Test l'import d'un export texte Anki (en-têtes, séparateur, colonnes de métadonnées)"""
+        deck_id = create_deck("Anki")
+        data = io.StringIO(
+            '#separator:tab\n'
+            '#html:true\n'
+            '#guid column:1\n'
+            'abc123\tHola\tBonjour\n'
+            'def456\tGracias\tMerci\n'
+        )
+
+        stats = import_flashcards(data, deck_id)
+
+        self.assertEqual(stats['inserted'], 2)
+        answers = {c['question']: c['answer'] for c in get_flashcards_by_deck(deck_id)}
+        self.assertEqual(answers, {'Hola': 'Bonjour', 'Gracias': 'Merci'})
+
+
+class TestPdfCache(TestDatabase):
+    """Tests pour le cache du texte des PDF"""
+
+    def setUp(self):
+        super().setUp()
+        from PyPDF2 import PdfWriter
+
+        writer = PdfWriter()
+        for _ in range(4):
+            writer.add_blank_page(width=200, height=200)
+        fd, self.pdf_path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            writer.write(f)
+
+    def tearDown(self):
+        os.unlink(self.pdf_path)
+        super().tearDown()
+
+    def test_pages_extracted_once(self):
+        """Test qu'une page déjà extraite n'est jamais ré-analysée"""
+        from unittest import mock
+
+        texte = pdf_extraction.extraire_texte(self.pdf_path, (2, 3))
+        self.assertEqual(texte, "\n\n")
+
+        with database.get_db_connection() as conn:
+            cached = conn.execute('SELECT page FROM pdf_pages ORDER BY page').fetchall()
+        self.assertEqual([row['page'] for row in cached], [1, 2])
+
+        # Plage déjà en cache : PdfReader ne doit pas être appelé
+        with mock.patch.object(pdf_extraction, 'PdfReader', side_effect=AssertionError):
+            self.assertEqual(pdf_extraction.extraire_pages(self.pdf_path, (2, 3)), ['', ''])
+
+        # Document complet : seules les pages manquantes sont ajoutées
+        self.assertEqual(len(pdf_extraction.extraire_pages(self.pdf_path)), 4)
+        self.assertEqual(database.get_pdf_page_count(pdf_extraction.hash_pdf(self.pdf_path)), 4)
+
+    def test_parallel_extraction_keeps_order(self):
+        """Test que l'extraction par un pool de processus renvoie les pages dans l'ordre"""
+        settings = dict(pdf_extraction.EXTRACTION_SETTINGS)
+        pdf_extraction.configure_extraction(workers=2, min_pages_parallel=2)
+        try:
+            pages = pdf_extraction.extraire_pages(self.pdf_path)
+        finally:
+            pdf_extraction.configure_extraction(**settings)
+
+        self.assertEqual(pages, ['', '', '', ''])
+        self.assertEqual(
+            database.get_cached_pdf_pages(pdf_extraction.hash_pdf(self.pdf_path), 0, 3),
+            {0: '', 1: '', 2: '', 3: ''}
+        )
+
+    def test_parallel_pool_reused_with_spawn(self):
+        """Test que le pool d'extraction est créé une fois, avec la méthode 'spawn'"""
+        settings = dict(pdf_extraction.EXTRACTION_SETTINGS)
+        pdf_extraction.configure_extraction(workers=2, min_pages_parallel=2)
+        try:
+            pdf_extraction.extraire_pages(self.pdf_path, (1, 2))
+            pool = pdf_extraction._pool
+            pdf_extraction.extraire_pages(self.pdf_path, (3, 4))
+            self.assertIs(pdf_extraction._pool, pool)
+            self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+        finally:
+            pdf_extraction.configure_extraction(**settings)
+            pdf_extraction.shutdown_extraction_pool()
+
+    def test_out_of_bounds_range(self):
+        """Test qu'une plage hors du document est tronquée"""
+        self.assertEqual(len(pdf_extraction.extraire_pages(self.pdf_path, (3, 99))), 2)
+        self.assertEqual(pdf_extraction.extraire_pages(self.pdf_path, (10, 12)), [])
+
+
+class TestJobs(TestDatabase):
+    """Tests pour la file de tâches de fond"""
+
+    def test_claim_is_exclusive_and_fifo(self):
+        """Test qu'une tâche n'est réservée qu'une fois, dans l'ordre d'arrivée"""
+        first = database.create_job(None, 'test', {'n': 1})
+        second = database.create_job(None, 'test', {'n': 2})
+
+        self.assertEqual(database.claim_next_job(1)['id'], first)
+        self.assertEqual(database.claim_next_job(2)['id'], second)
+        self.assertIsNone(database.claim_next_job(3))
+
+    def test_run_job_records_result_and_error(self):
+        """Test l'enregistrement du résultat, de l'avancement et des erreurs"""
+        def handler(user_id, params, progress):
+            progress("calcul")
+            if params['n'] < 0:
+                raise jobs.JobError("n négatif")
+            return {'double': params['n'] * 2}
+
+        jobs.register_handler('test_double', handler)
+        ok = database.create_job(None, 'test_double', {'n': 21})
+        ko = database.create_job(None, 'test_double', {'n': -1})
+        jobs.run_job(database.claim_next_job(os.getpid()))
+        jobs.run_job(database.claim_next_job(os.getpid()))
+
+        self.assertEqual(jobs.job_status(ok)['status'], 'done')
+        self.assertEqual(jobs.job_status(ok)['result'], {'double': 42})
+        self.assertEqual(jobs.job_status(ok)['progress'], "calcul")
+        self.assertEqual(jobs.job_status(ko)['status'], 'failed')
+        self.assertEqual(jobs.job_status(ko)['error'], "n négatif")
+
+    def test_orphan_jobs_requeued(self):
+        """Test qu'une tâche interrompue par l'arrêt de son processus est remise en attente"""
+        job_id = database.create_job(None, 'test', {})
+        database.claim_next_job(999999)
+
+        self.assertEqual(database.requeue_orphan_jobs(lambda pid: False), 1)
+        self.assertEqual(jobs.job_status(job_id)['status'], 'pending')
+
+    def test_orphan_job_abandoned_after_max_attempts(self):
+        """Test qu'une tâche qui fait tomber son worker n'est pas reprise indéfiniment"""
+        job_id = database.create_job(None, 'test', {})
+        for _ in range(2):
+            database.claim_next_job(999999)
+            self.assertEqual(database.requeue_orphan_jobs(lambda pid: False, 3), 1)
+
+        database.claim_next_job(999999)
+        self.assertEqual(database.requeue_orphan_jobs(lambda pid: False, 3), 0)
+        status = jobs.job_status(job_id)
+        self.assertEqual(status['status'], 'failed')
+        self.assertIsNotNone(status['error'])
+        self.assertIsNone(database.claim_next_job(999999))
+
+    def test_workers_run_queued_job_at_startup(self):
+        """Test qu'une tâche restée en file est exécutée au démarrage des workers, sans nouvelle soumission"""
+        jobs.register_handler('test_startup', lambda user_id, params, progress: {'n': params['n']})
+        pending = database.create_job(None, 'test_startup', {'n': 1})
+        interrupted = database.create_job(None, 'test_startup', {'n': 2})
+        database.claim_next_job(999999)
+
+        jobs.start_workers(workers=1)
+        try:
+            for _ in range(100):
+                if all(jobs.job_status(job_id)['status'] == 'done'
+                       for job_id in (pending, interrupted)):
+                    break
+                time.sleep(0.05)
+        finally:
+            jobs.stop_workers(timeout=5)
+
+        self.assertEqual(jobs.job_status(pending)['result'], {'n': 1})
+        self.assertEqual(jobs.job_status(interrupted)['result'], {'n': 2})
+
+
+class TestGenerationCache(TestDatabase):
+    """Tests pour le cache des réponses de génération"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings = dict(generation_cache.CACHE_SETTINGS)
+
+    def tearDown(self):
+        generation_cache.configure_generation_cache(**self.settings)
+        super().tearDown()
+
+    def _key(self, **overrides):
+        parts = dict(kind='flashcards', provider='claude', model='m', prompt_template='P {texte}',
+                     texte='texte', nb_flashcards=10, existing_questions=['Q1'])
+        parts.update(overrides)
+        return generation_cache.generation_cache_key(**parts)
+
+    def test_key_depends_on_every_input(self):
+        """Test que chaque paramètre de la demande change la clé"""
+        base = self._key()
+        self.assertEqual(base, self._key())
+        for change in [dict(provider='openai'), dict(model='m2'), dict(prompt_template='P2'),
+                       dict(texte='autre'), dict(nb_flashcards=11),
+                       dict(existing_questions=['Q1', 'Q2'])]:
+            self.assertNotEqual(base, self._key(**change), change)
+
+    def test_hit_and_ttl(self):
+        """Test qu'une réponse est relue puis expire après le TTL"""
+        cards = [{'question': 'Q', 'reponse': 'R'}]
+        generation_cache.cache_generation(self._key(), 'flashcards', cards)
+        self.assertEqual(generation_cache.get_cached_generation(self._key()), cards)
+        self.assertIsNone(generation_cache.get_cached_generation(self._key(texte='x')))
+
+        generation_cache.configure_generation_cache(ttl=-1)
+        self.assertIsNone(generation_cache.get_cached_generation(self._key()))
+
+    def test_lru_eviction(self):
+        """Test que le cache garde les réponses les plus récemment utilisées"""
+        generation_cache.configure_generation_cache(max_entries=2)
+        generation_cache.cache_generation(self._key(texte='a'), 'fiche', 'A')
+        generation_cache.cache_generation(self._key(texte='b'), 'fiche', 'B')
+        generation_cache.get_cached_generation(self._key(texte='a'))
+        generation_cache.cache_generation(self._key(texte='c'), 'fiche', 'C')
+
+        self.assertEqual(generation_cache.get_cached_generation(self._key(texte='a')), 'A')
+        self.assertIsNone(generation_cache.get_cached_generation(self._key(texte='b')))
+        self.assertEqual(generation_cache.get_cached_generation(self._key(texte='c')), 'C')
+
+
+class TestRateLimiter(TestDatabase):
+    """Tests pour le limiteur de débit des API"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings = dict(rate_limiter.RATE_LIMIT_SETTINGS)
+        self.settings['limits'] = {p: dict(l) for p, l in self.settings['limits'].items()}
+        rate_limiter.configure_rate_limiter(max_wait=0.05, poll_interval=0.01, limits={
+            'gemini': {'per_minute': 1, 'burst': 2, 'per_day': 1500, 'max_concurrent': 8}
+        })
+
+    def tearDown(self):
+        rate_limiter.RATE_LIMIT_SETTINGS.update(self.settings)
+        super().tearDown()
+
+    def _acquire(self, user_id=1, api_key='cle'):
+        with rate_limiter.limiteur_api('gemini', api_key, user_id):
+            pass
+
+    def test_burst_then_bounded_wait(self):
+        """Test que le bucket accorde burst appels puis rejette après l'attente maximale"""
+        self._acquire()
+        self._acquire()
+        with self.assertRaises(rate_limiter.RateLimitError):
+            self._acquire()
+
+        # Une autre clé API a son propre bucket
+        self._acquire(api_key='autre-cle')
+
+        metrics = {m['bucket']: m for m in rate_limiter.rate_limiter_metrics()}
+        bucket = metrics[rate_limiter.bucket_key('gemini', 'cle')]
+        self.assertEqual(bucket['granted'], 2)
+        self.assertEqual(bucket['rejected'], 1)
+        self.assertEqual(bucket['queue_depth'], 0)
+        self.assertEqual(bucket['in_flight'], 0)
+
+    def test_daily_quota(self):
+        """Test que le quota journalier bloque même avec des jetons disponibles"""
+        rate_limiter.configure_rate_limiter(limits={'gemini': {'per_minute': 6000, 'per_day': 2}})
+        self._acquire()
+        self._acquire()
+        with self.assertRaises(rate_limiter.RateLimitError):
+            self._acquire()
+
+    def test_fair_queuing_between_users(self):
+        """Test que l'utilisateur servi le moins récemment passe en premier"""
+        key = rate_limiter.bucket_key('gemini', 'cle')
+        limits = rate_limiter._limits('gemini')
+        self._acquire(user_id=1)
+
+        waiter_1 = database.enqueue_rate_waiter(key, 1)
+        waiter_2 = database.enqueue_rate_waiter(key, 2)
+
+        # L'utilisateur 1 vient d'être servi : l'utilisateur 2 passe devant lui
+        lease, _ = database.try_acquire_rate_token(waiter_1, key, limits, 10)
+        self.assertIsNone(lease)
+        lease, _ = database.try_acquire_rate_token(waiter_2, key, limits, 10)
+        self.assertIsNotNone(lease)
+        database.release_rate_lease(lease)
+
+    def test_waiting_polls_read_only(self):
+        """Test que l'attente d'un jeton n'écrit pas dans la base tant qu'il n'est pas réclamé"""
+        key = rate_limiter.bucket_key('gemini', 'cle')
+        limits = rate_limiter._limits('gemini')
+        self._acquire(user_id=1)
+
+        waiter_1 = database.enqueue_rate_waiter(key, 1)
+        waiter_2 = database.enqueue_rate_waiter(key, 2)
+        with database.get_db_connection() as conn:
+            changes = conn.total_changes
+            # L'utilisateur 2 passe devant ; l'utilisateur 1 attend sans écrire
+            self.assertGreater(database.peek_rate_token(waiter_1, key, limits, 10), 0)
+            self.assertEqual(database.peek_rate_token(waiter_2, key, limits, 10), 0)
+            self.assertEqual(conn.total_changes, changes)
+
+        lease, _ = database.try_acquire_rate_token(waiter_2, key, limits, 10)
+        self.assertIsNotNone(lease)
+        database.release_rate_lease(lease)
+
+        # Plus de jeton (burst de 2, 1 par minute) : attente d'environ une minute
+        self.assertGreater(database.peek_rate_token(waiter_1, key, limits, 10), 30)
+
+    def test_concurrency_cap(self):
+        """Test qu'un appel en cours bloque le suivant quand max_concurrent est atteint"""
+        rate_limiter.configure_rate_limiter(limits={'gemini': {'per_minute': 6000, 'max_concurrent': 1}})
+        with rate_limiter.limiteur_api('gemini', 'cle', 1):
+            with self.assertRaises(rate_limiter.RateLimitError):
+                self._acquire(user_id=2)
+        self._acquire(user_id=2)
+
+
+class TestNearDuplicates(TestDatabase):
+    """Tests pour l'index des quasi-doublons"""
+
+    def setUp(self):
+        super().setUp()
+        self.user_id = create_user('dup_user', 'hash')
+        self.deck_id = create_deck('Probas', self.user_id)
+        create_flashcards_bulk(self.deck_id, [
+            ("Qu'est-ce qu'une loi normale ?", 'R1'),
+            ('Quelle est la formule de la variance ?', 'R2'),
+            ("Qu'est-ce que l'espérance mathématique ?", 'R3'),
+        ])
+
+    def test_filter_against_deck_and_batch(self):
+        """Test que les reformulations du deck et du lot sont écartées"""
+        cards = [
+            {'question': "Qu'est-ce que la loi normale ?", 'reponse': 'x'},
+            {'question': "Qu'est-ce qu'une loi de Poisson ?", 'reponse': 'x'},
+            {'question': "Qu'est ce qu'une loi de Poisson ?", 'reponse': 'x'},
+            {'question': 'Quelle est la formule de la variance ?', 'reponse': 'x'},
+        ]
+        retenues, retirees = near_duplicates.filter_near_duplicates(self.deck_id, cards)
+        self.assertEqual([c['question'] for c in retenues], ["Qu'est-ce qu'une loi de Poisson ?"])
+        self.assertEqual(len(retirees), 3)
+
+    def test_second_save_uses_same_deck(self):
+        """Test que deux sauvegardes sous le même nom filtrent contre le même deck"""
+        other_user = create_user('other_dup_user', 'hash')
+        other_deck = create_deck('Probas', other_user)
+        self.assertNotEqual(other_deck, self.deck_id)
+
+        # Même enchaînement que sauvegarder_flashcards_db dans app.py
+        for question in ("Qu'est-ce que la loi normale ?", "Qu'est-ce qu'une loi normale ?"):
+            deck_id = create_deck('Probas', self.user_id)
+            self.assertEqual(deck_id, self.deck_id)
+            retenues, retirees = near_duplicates.filter_near_duplicates(
+                deck_id, [{'question': question, 'reponse': 'x'}])
+            self.assertEqual((retenues, len(retirees)), ([], 1))
+
+        self.assertEqual(database.get_user_deck_by_name('Probas', other_user)['id'], other_deck)
+        self.assertIsNone(database.get_user_deck_by_name('Stats', self.user_id))
+        self.assertEqual(len(get_flashcards_by_deck(self.deck_id)), 3)
+
+    def test_incremental_index_and_cascade(self):
+        """Test que seules les nouvelles cartes sont indexées et que la suppression nettoie l'index"""
+        self.assertEqual(near_duplicates.index_deck(self.deck_id), 3)
+        self.assertEqual(near_duplicates.index_deck(self.deck_id), 0)
+
+        create_flashcards_bulk(self.deck_id, [('Qu\'est-ce que la covariance ?', 'R4')])
+        self.assertEqual(near_duplicates.index_deck(self.deck_id), 1)
+        self.assertTrue(near_duplicates.find_near_duplicates(self.deck_id, 'Qu\'est ce que la covariance ?'))
+
+        delete_deck(self.deck_id)
+        with database.get_db_connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM flashcard_lsh').fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_relevant_questions(self):
+        """Test que les questions partageant les mots du texte passent en premier"""
+        texte = "La variance mesure la dispersion. Formule de la variance : E[X^2] - E[X]^2."
+        questions = near_duplicates.relevant_questions(self.deck_id, texte, limit=2)
+        self.assertEqual(questions[0], 'Quelle est la formule de la variance ?')
+        self.assertNotIn("Qu'est-ce qu'une loi normale ?", questions)
+
+
+class TestBatchScheduler(unittest.TestCase):
+    """Tests pour la version vectorisée de l'algorithme SM-2"""
+
+    def _compare(self, cards, ratings, config=None):
+        now = datetime(2024, 3, 1, 9, 30, 15, 123456)
+        batch = calculate_next_review_batch(
+            [c.ease_factor for c in cards], [c.interval for c in cards], [c.step for c in cards],
+            [c.is_learning for c in cards], [c.repetitions for c in cards], ratings, config, now
+        )
+        for i, (card, rating) in enumerate(zip(cards, ratings)):
+            expected = calculate_next_review(card, rating, config, now)
+            actual = (batch['ease_factor'][i], batch['interval'][i], batch['step'][i],
+                      bool(batch['is_learning'][i]), batch['repetitions'][i],
+                      batch['due_date'][i].astype(datetime))
+            self.assertEqual(
+                actual,
+                (expected.ease_factor, expected.interval, expected.step,
+                 expected.is_learning, expected.repetitions, expected.due_date),
+                f"carte {card.to_dict()} note {rating}"
+            )
+
+    def _random_cards(self, rng, count, nb_steps):
+        return [
+            AnkiCard(ease_factor=round(rng.uniform(1.3, 3.5), 2), interval=rng.randint(0, 400),
+                     step=rng.randrange(nb_steps), is_learning=rng.random() < 0.4,
+                     repetitions=rng.randint(0, 8))
+            for _ in range(count)
+        ]
+
+    def test_matches_scalar_default_config(self):
+        """Test que le lot donne exactement les résultats carte par carte"""
+        rng = random.Random(7)
+        cards = self._random_cards(rng, 2000, 2)
+        self._compare(cards, [rng.randint(0, 3) for _ in cards])
+
+    def test_matches_scalar_custom_config(self):
+        """Test avec des étapes, bonus et plafond personnalisés"""
+        config = dict(DEFAULT_CONFIG, learning_steps=[1, 5, 30, 240], interval_modifier=0.9,
+                      easy_bonus=1.5, max_interval=180)
+        rng = random.Random(11)
+        cards = self._random_cards(rng, 2000, 4)
+        self._compare(cards, [rng.randint(0, 3) for _ in cards], config)
+
+    def test_edge_states(self):
+        """Test des transitions limites (graduation, retour en apprentissage, ease minimal)"""
+        cards = [
+            AnkiCard(step=1, is_learning=True),
+            AnkiCard(step=0, is_learning=True),
+            AnkiCard(ease_factor=1.3, interval=10, is_learning=False, repetitions=3),
+            AnkiCard(ease_factor=1.35, interval=10, is_learning=False, repetitions=3),
+            AnkiCard(interval=30000, is_learning=False, repetitions=5),
+            AnkiCard(interval=0, is_learning=False, repetitions=0),
+            AnkiCard(interval=1, is_learning=False, repetitions=1),
+        ]
+        for rating in range(4):
+            self._compare(cards, [rating] * len(cards))
+
+
+class TestSchedulerPresets(TestDatabase):
+    """Tests pour les réglages de l'algorithme par utilisateur et par deck"""
+
+    def setUp(self):
+        super().setUp()
+        self.user_id = create_user('preset_user', 'hash')
+        self.deck_id = create_deck('Espagnol', self.user_id)
+        self.other_deck_id = create_deck('Histoire', self.user_id)
+        self.card_id = create_flashcard(self.deck_id, 'Q', 'R')
+
+    def test_compile_validates(self):
+        """Test que les réglages invalides ou inconnus sont refusés"""
+        config = compile_config({'learning_steps': [1, 10, 60], 'max_interval': 180})
+        self.assertEqual(config.learning_steps, (1, 10, 60))
+        self.assertEqual(config['max_interval'], 180)
+        with self.assertRaises(Exception):
+            config.max_interval = 10
+
+        for settings in [{'learning_steps': []}, {'learning_steps': [0]}, {'graduating_interval': 1.5},
+                         {'interval_modifier': 'x'}, {'inconnu': 1}]:
+            with self.assertRaises(ValueError, msg=settings):
+                compile_config(settings)
+        with self.assertRaises(ValueError):
+            database.save_scheduler_preset(self.user_id, {'max_interval': 0})
+
+    def test_deck_preset_overrides_user_preset(self):
+        """Test de la priorité deck > utilisateur > défaut"""
+        self.assertEqual(database.get_scheduler_config(self.user_id, self.deck_id).graduating_interval,
+                         DEFAULT_CONFIG['graduating_interval'])
+
+        database.save_scheduler_preset(self.user_id, {'graduating_interval': 2})
+        database.save_scheduler_preset(self.user_id, {'graduating_interval': 3}, self.deck_id)
+        self.assertEqual(database.get_scheduler_config(self.user_id, self.deck_id).graduating_interval, 3)
+        self.assertEqual(database.get_scheduler_config(self.user_id, self.other_deck_id).graduating_interval, 2)
+
+        self.assertTrue(database.delete_scheduler_preset(self.user_id, self.deck_id))
+        self.assertEqual(database.get_scheduler_config(self.user_id, self.deck_id).graduating_interval, 2)
+
+    def test_review_uses_preset_and_sees_edits(self):
+        """Test qu'une révision applique le preset du deck et sa dernière version"""
+        database.save_scheduler_preset(self.user_id, {'learning_steps': [5], 'easy_interval': 7}, self.deck_id)
+        card = record_review(self.user_id, self.card_id, 3)
+        self.assertEqual(card.interval, 7)
+
+        database.save_scheduler_preset(self.user_id, {'learning_steps': [5], 'easy_interval': 9}, self.deck_id)
+        card_id = create_flashcard(self.deck_id, 'Q2', 'R2')
+        self.assertEqual(record_review(self.user_id, card_id, 3).interval, 9)
+
+        # Une seule étape d'apprentissage : "Bon" fait passer la carte en révision
+        card_id = create_flashcard(self.deck_id, 'Q3', 'R3')
+        self.assertFalse(record_review(self.user_id, card_id, 2).is_learning)
+
+    def test_preset_shortened_mid_learning(self):
+        """Test qu'une carte en cours d'apprentissage survit à un preset raccourci"""
+        database.save_scheduler_preset(self.user_id, {'learning_steps': [1, 10, 60]}, self.deck_id)
+        record_review(self.user_id, self.card_id, 2)
+        card = record_review(self.user_id, self.card_id, 2)
+        self.assertEqual(card.step, 2)
+
+        database.save_scheduler_preset(self.user_id, {'learning_steps': [5]}, self.deck_id)
+        now = datetime.now()
+        card = record_review(self.user_id, self.card_id, 1)
+        self.assertTrue(card.is_learning)
+        self.assertAlmostEqual((card.due_date - now).total_seconds(), 5 * 60, delta=5)
+
+        batch = calculate_next_review_batch([2.5], [0], [2], [True], [0], [1],
+                                            {'learning_steps': [5]}, now=now)
+        self.assertEqual(batch['due_date'][0].item(), now + timedelta(minutes=5))
+
+        self.assertFalse(record_review(self.user_id, self.card_id, 2).is_learning)
+
+
+class TestSimulation(unittest.TestCase):
+    """Tests pour la prévision de charge (simulate)"""
+
+    ALWAYS_GOOD = {'learning': (0, 0, 1, 0), 'review': (0, 0, 1, 0)}
+
+    def setUp(self):
+        self.start = datetime(2024, 3, 1, 10, 0)
+
+    def _row(self, deck_id, folder_id=None, **state):
+        row = {'deck_id': deck_id, 'folder_id': folder_id, 'ease_factor': 2.5, 'interval': 0,
+               'due_date': self.start.isoformat(), 'step': 0, 'is_learning': 1, 'repetitions': 0}
+        row.update(state)
+        return row
+
+    def test_deterministic_schedule(self):
+        """Test du calendrier d'une carte toujours réussie"""
+        rows = [
+            # Nouvelle carte : deux étapes aujourd'hui, révision demain, puis dans 6 jours
+            self._row(1, folder_id=7),
+            # Carte en révision due dans 3 jours
+            self._row(2, interval=4, is_learning=0, repetitions=2,
+                      due_date=datetime(2024, 3, 4, 8, 0).isoformat()),
+        ]
+        result = simulate(rows, days=8, answer_model=self.ALWAYS_GOOD, runs=3, start=self.start)
+        self.assertEqual(result['decks'][1], [2, 1, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(result['decks'][2], [0, 0, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(result['total'], [2, 1, 0, 1, 0, 0, 0, 1])
+        self.assertEqual(result['folders'], {7: result['decks'][1], None: result['decks'][2]})
+        self.assertEqual(result['dates'][0], '2024-03-01')
+
+    def test_deck_configs_and_callable_model(self):
+        """Test des configurations par deck et d'un modèle de réponse fonction"""
+        rows = [self._row(1), self._row(2)]
+
+        def model(state):
+            import numpy as np
+            return np.tile([0.0, 0.0, 1.0, 0.0], (len(state['ease_factor']), 1))
+
+        result = simulate(rows, days=2, answer_model=model, runs=1, start=self.start,
+                          deck_configs={2: {'learning_steps': [1]}})
+        # Une seule étape d'apprentissage pour le deck 2 : un passage de moins aujourd'hui
+        self.assertEqual(result['decks'][1][0], 2)
+        self.assertEqual(result['decks'][2][0], 1)
+
+    def test_seed_reproducible(self):
+        """Test que la même graine donne la même prévision"""
+        rows = [self._row(i % 3, repetitions=i % 4, is_learning=int(i % 5 == 0), interval=i % 30)
+                for i in range(200)]
+        first = simulate(rows, days=30, runs=4, start=self.start, seed=3)
+        self.assertEqual(first, simulate(rows, days=30, runs=4, start=self.start, seed=3))
+        self.assertGreaterEqual(min(p - t for p, t in zip(first['peak'], first['total'])), -1e-9)
+
+
+class TestReviewLog(TestDatabase):
+    """Tests pour le journal des réponses (review_log) et son tampon"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings = dict(database.REVIEW_LOG_SETTINGS)
+        database.configure_review_log(batch_size=1000, flush_interval=60000)
+        self.user_id = create_user('log_user', 'hash')
+        self.deck_id = create_deck('Chimie', self.user_id)
+        self.card_id = create_flashcard(self.deck_id, 'Q', 'R')
+
+    def tearDown(self):
+        database.configure_review_log(**self.settings)
+        super().tearDown()
+
+    def _count(self):
+        with database.get_db_connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM review_log').fetchone()[0]
+
+    def test_buffered_until_flush(self):
+        """Test que les réponses attendent dans le tampon puis sont écrites ensemble"""
+        record_review(self.user_id, self.card_id, 2, elapsed_ms=4200)
+        record_review(self.user_id, self.card_id, 0)
+        self.assertEqual(self._count(), 0)
+
+        self.assertEqual(database.flush_review_log(), 2)
+        self.assertEqual(database.flush_review_log(), 0)
+
+        first, second = database.get_review_log(self.user_id)
+        self.assertEqual((first['rating'], first['elapsed_ms'], first['deck_id']), (2, 4200, self.deck_id))
+        self.assertIsNone(first['previous_interval'])
+        self.assertIsNone(first['was_learning'])
+        self.assertEqual(second['previous_interval'], first['new_interval'])
+        self.assertEqual(second['was_learning'], first['is_learning'])
+        self.assertIsNone(second['elapsed_ms'])
+
+    def test_rolled_back_vote_not_logged(self):
+        """Test qu'une réponse annulée avec sa transaction n'entre pas dans le journal"""
+        with self.assertRaises(RuntimeError):
+            with review_transaction():
+                record_review(self.user_id, self.card_id, 2)
+                raise RuntimeError("vote annulé")
+
+        # Bloc imbriqué annulé, transaction externe validée
+        with review_transaction():
+            record_review(self.user_id, self.card_id, 3)
+            with self.assertRaises(RuntimeError):
+                with database.get_db_connection():
+                    record_review(self.user_id, self.card_id, 0)
+                    raise RuntimeError("réponse annulée")
+
+        self.assertEqual(database.flush_review_log(), 1)
+        self.assertEqual([row['rating'] for row in database.get_review_log(self.user_id)], [3])
+        with database.get_db_connection() as conn:
+            reviews = conn.execute('SELECT SUM(reviews) FROM daily_review_stats').fetchone()[0]
+        self.assertEqual(reviews, 1)
+
+    def test_writer_flushes_full_batch(self):
+        """Test que le thread d'écriture vide le tampon dès batch_size réponses"""
+        database.configure_review_log(batch_size=2)
+        record_review(self.user_id, self.card_id, 2)
+        record_review(self.user_id, self.card_id, 2)
+
+        deadline = time.monotonic() + 5
+        while self._count() < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self._count(), 2)
+
+    def test_statistics_count_every_review(self):
+        """Test que l'activité compte chaque réponse, pas seulement la dernière"""
+        for rating in (0, 2, 2):
+            record_review(self.user_id, self.card_id, rating)
+
+        stats = database.get_user_statistics(self.user_id)
+        self.assertEqual((stats['today']['reviews'], stats['today']['new_cards']), (3, 1))
+        self.assertEqual([day['reviews'] for day in stats['activity']], [3])
+
+    def test_last_review_time(self):
+        """Test de l'heure de la dernière réponse, bornée par une date"""
+        self.assertIsNone(database.get_last_review_time(self.user_id))
+        for day in (datetime(2024, 12, 31, 23, 0), datetime(2025, 2, 1, 8, 0)):
+            database.log_review(self.user_id, self.card_id, self.deck_id, 2, None, 0, None, 1,
+                                reviewed_at=day)
+
+        self.assertEqual(database.get_last_review_time(self.user_id), '2025-02-01T08:00:00')
+        self.assertEqual(database.get_last_review_time(self.user_id, '2025-01-01'), '2024-12-31T23:00:00')
+
+    def test_backfill_from_progress(self):
+        """Test que la création du journal reprend la dernière réponse connue"""
+        update_progress(self.user_id, self.card_id, 2.5, 4, datetime.now().isoformat(), 0, 0, 3)
+        with database.get_db_connection() as conn:
+            conn.execute('DROP TABLE review_log')
+        init_database()
+
+        (row,) = database.get_review_log(self.user_id)
+        self.assertIsNone(row['rating'])
+        self.assertEqual((row['new_interval'], row['is_learning']), (4, 0))
+
+
+class TestDailyReviewStats(TestDatabase):
+    """Tests pour les agrégats quotidiens du journal (daily_review_stats)"""
+
+    def setUp(self):
+        super().setUp()
+        self.user_id = create_user('rollup_user', 'hash')
+        self.deck_id = create_deck('Physique', self.user_id)
+        self.other_deck_id = create_deck('Maths', self.user_id)
+
+    def _log(self, when, deck_id, rating, previous_interval=None, was_learning=None):
+        database.log_review(self.user_id, 1, deck_id, rating, previous_interval, 1,
+                            was_learning, 0, reviewed_at=when)
+
+    def _stats(self):
+        with database.get_db_connection() as conn:
+            return [tuple(row) for row in conn.execute('''
+                SELECT day, deck_id, reviews, new_cards, lapses, mature
+                FROM daily_review_stats ORDER BY day, deck_id
+            ''')]
+
+    def test_rollup_counts(self):
+        """Test des compteurs par jour et par deck, cumulés d'une écriture à l'autre"""
+        day = datetime(2024, 5, 2, 9, 0)
+        self._log(day, self.deck_id, 2)                                   # nouvelle
+        self._log(day, self.deck_id, 0, previous_interval=30, was_learning=0)  # oubli, mûre
+        self._log(day, self.other_deck_id, 2, previous_interval=3, was_learning=0)
+        database.flush_review_log()
+        self._log(day.replace(hour=22), self.deck_id, 2, previous_interval=25, was_learning=0)
+        self._log(datetime(2024, 5, 3, 0, 5), self.deck_id, 1, previous_interval=0, was_learning=1)
+        database.flush_review_log()
+
+        self.assertEqual(self._stats(), [
+            ('2024-05-02', self.deck_id, 3, 1, 1, 2),
+            ('2024-05-02', self.other_deck_id, 1, 0, 0, 0),
+            ('2024-05-03', self.deck_id, 1, 0, 0, 0),
+        ])
+
+        database.rebuild_daily_review_stats()
+        self.assertEqual(self._stats()[0], ('2024-05-02', self.deck_id, 3, 1, 1, 2))
+
+    def test_created_from_existing_log(self):
+        """Test que les agrégats sont calculés à la création de la table"""
+        self._log(datetime(2024, 5, 2, 9, 0), self.deck_id, 2)
+        database.flush_review_log()
+        with database.get_db_connection() as conn:
+            conn.execute('DROP TABLE daily_review_stats')
+        init_database()
+        self.assertEqual(self._stats(), [('2024-05-02', self.deck_id, 1, 1, 0, 0)])
+
+    def test_statistics_deck_counts_and_window(self):
+        """Test des compteurs par deck lus dans deck_counters et de la fenêtre de 30 jours"""
+        from datetime import date, timedelta
+
+        cards = [create_flashcard(self.deck_id, f"Q{i}", "A") for i in range(4)]
+        create_flashcard(self.other_deck_id, "Q", "A")
+        past = (datetime.now() - timedelta(days=1)).isoformat()
+        future = (datetime.now() + timedelta(days=3)).isoformat()
+        update_progress(self.user_id, cards[0], 2.5, 0, past, 0, 1, 0)     # apprentissage, due
+        update_progress(self.user_id, cards[1], 2.5, 3, future, 0, 0, 2)   # révision, à venir
+        update_progress(self.user_id, cards[2], 2.5, 1, past, 0, 0, 1)     # révision, due
+        update_progress(self.user_id, cards[2], 2.5, 1, future, 0, 1, 0)   # repasse en apprentissage
+
+        today = date.today()
+        for days_ago in (30, 29, 0):
+            self._log(datetime.combine(today - timedelta(days=days_ago), datetime.min.time()),
+                      self.deck_id, 2)
+        database.flush_review_log()
+
+        stats = database.get_user_statistics(self.user_id)
+        decks = {deck['deck_name']: deck for deck in stats['decks']}
+        self.assertEqual(decks['Physique'], {'deck_name': 'Physique', 'total': 4, 'studied': 3,
+                                             'due': 1, 'learning': 2, 'mature': 1})
+        self.assertEqual(decks['Maths']['total'], 1)
+        self.assertEqual(stats['global']['total_cards'], 5)
+        self.assertEqual([day['date'] for day in stats['activity']],
+                         [(today - timedelta(days=29)).isoformat(), today.isoformat()])
+
+        rebuild_deck_counters(self.user_id)
+        self.assertEqual(database.get_user_statistics(self.user_id)['decks'], stats['decks'])
+
+    def test_yearly_activity_range(self):
+        """Test que l'activité annuelle ne lit que l'année demandée"""
+        with database.get_db_connection() as conn:
+            for day, cards in (('2023-12-31', 4), ('2024-01-01', 2), ('2024-12-31', 7), ('2025-01-01', 9)):
+                conn.execute(
+                    'INSERT INTO daily_activity (user_id, date, cards_reviewed) VALUES (?, ?, ?)',
+                    (self.user_id, day, cards)
+                )
+        activity, max_cards = database.get_yearly_activity(self.user_id, 2024)
+        self.assertEqual(sorted(activity), ['2024-01-01', '2024-12-31'])
+        self.assertEqual(max_cards, 7)
+
+    def test_latest_activity_follows_votes(self):
+        """Test que la dernière journée d'activité change à chaque vote, avant l'écriture du journal"""
+        from datetime import date
+
+        year = date.today().year
+        self.assertIsNone(database.get_latest_activity(self.user_id, year))
+        card_id = create_flashcard(self.deck_id, "Q", "A")
+        record_review(self.user_id, card_id, 2)
+        first = tuple(database.get_latest_activity(self.user_id, year))[:2]
+        record_review(self.user_id, card_id, 2)
+
+        self.assertEqual(first, (date.today().isoformat(), 1))
+        self.assertEqual(database.get_latest_activity(self.user_id, year)['cards_reviewed'], 2)
+        self.assertIsNone(database.get_latest_activity(self.user_id, year - 1))
+
+
+class TestLeaderboard(TestDatabase):
+    """Tests pour les scores matérialisés du classement (leaderboard_scores)"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = create_user('alice', 'hash')
+        self.bob = create_user('bob', 'hash')
+
+    def _ranking(self, period='all'):
+        return [(row['username'], row['total_cards'], row['streak_count'], row['score'])
+                for row in database.get_leaderboard(period)]
+
+    def test_scores_follow_activity_and_streak(self):
+        """Test que les scores suivent les réponses et le streak"""
+        database.update_daily_activity(self.alice, 10, True)
+        database.update_daily_activity(self.bob, 4, False)
+        self.assertEqual(self._ranking(), [('alice', 10, 1, 10), ('bob', 4, 0, 0)])
+
+        database.update_daily_activity(self.bob, 30, True)
+        self.assertEqual(self._ranking(), [('bob', 34, 1, 34), ('alice', 10, 1, 10)])
+        self.assertEqual(self._ranking('week'), [('bob', 34, 1, 34), ('alice', 10, 1, 10)])
+
+        database.toggle_leaderboard_visibility(self.bob)
+        self.assertEqual([row[0] for row in self._ranking('month')], ['alice'])
+
+    def test_lapsed_streak_counts_as_zero(self):
+        """Test qu'un streak interrompu compte à 0 pour l'affichage et le tri, sans écriture en lecture"""
+        from datetime import date, timedelta
+        database.update_daily_activity(self.alice, 50, True)
+        database.update_daily_activity(self.bob, 5, True)
+        create_user('carol', 'hash')
+        with database.get_db_connection() as conn:
+            conn.execute('UPDATE users SET last_streak_date = ? WHERE id = ?',
+                         (date.today() - timedelta(days=3), self.alice))
+
+        with database.get_db_connection() as conn:
+            changes = conn.total_changes
+            self.assertEqual(self._ranking(), [('bob', 5, 1, 5), ('alice', 50, 0, 0), ('carol', 0, 0, 0)])
+            self.assertEqual(conn.total_changes, changes)
+
+        # La réponse d'un autre utilisateur n'écrit pas le streak d'alice
+        database.update_daily_activity(self.bob, 1, False)
+        self.assertEqual(self._ranking()[:2], [('bob', 6, 1, 6), ('alice', 50, 0, 0)])
+
+        # Le streak repart à 1 à la prochaine journée terminée
+        database.update_daily_activity(self.alice, 1, True)
+        self.assertEqual(self._ranking()[0], ('alice', 51, 1, 51))
+
+    def test_backfill_periods(self):
+        """Test du calcul des scores par période depuis daily_activity"""
+        from datetime import date, timedelta
+        today = date.today()
+        days = {today: 3, today - timedelta(days=7): 4, today - timedelta(days=40): 5}
+        with database.get_db_connection() as conn:
+            for day, cards in days.items():
+                conn.execute('INSERT INTO daily_activity (user_id, date, cards_reviewed) VALUES (?, ?, ?)',
+                             (self.alice, day, cards))
+            conn.execute('UPDATE users SET streak_count = 2, last_streak_date = ? WHERE id = ?',
+                         (today, self.alice))
+            conn.execute('DROP TABLE leaderboard_scores')
+        init_database()
+
+        month = sum(cards for day, cards in days.items() if day.month == today.month and day.year == today.year)
+        self.assertEqual(self._ranking()[0], ('alice', 12, 2, 24))
+        self.assertEqual(self._ranking('week'), [('alice', 3, 2, 3)])
+        self.assertEqual(self._ranking('month'), [('alice', month, 2, month)])
+        with self.assertRaises(ValueError):
+            database.get_leaderboard('year')
+
+
+class TestStreakRead(TestDatabase):
+    """Tests pour la lecture du streak sans écriture et la remise à zéro différée"""
+
+    def setUp(self):
+        super().setUp()
+        from datetime import date, timedelta
+        self.user_id = create_user('streak_user', 'hash')
+        self.today = date.today()
+        self.old = self.today - timedelta(days=3)
+
+    def _set_streak(self, count, day):
+        with database.get_db_connection() as conn:
+            conn.execute('UPDATE users SET streak_count = ?, last_streak_date = ? WHERE id = ?',
+                         (count, day, self.user_id))
+
+    def _stored_count(self):
+        with database.get_db_connection() as conn:
+            return conn.execute('SELECT streak_count FROM users WHERE id = ?',
+                                (self.user_id,)).fetchone()[0]
+
+    def test_effective_streak(self):
+        """Test du calcul du streak réel à partir de l'état enregistré"""
+        self.assertEqual(database.effective_streak(4, self.today.isoformat()), 4)
+        self.assertEqual(database.effective_streak(4, self.today - timedelta(days=1)), 4)
+        self.assertEqual(database.effective_streak(4, self.old.isoformat()), 0)
+        self.assertEqual(database.effective_streak(4, None), 0)
+
+    def test_lapsed_read_does_not_write(self):
+        """Test qu'un streak interrompu vaut 0 à la lecture sans être écrit"""
+        self._set_streak(5, self.old)
+        self.assertEqual(database.get_user_streak(self.user_id), 0)
+        self.assertEqual(database.get_user_streak_state(self.user_id), (5, self.old.isoformat()))
+        self.assertEqual(self._stored_count(), 5)
+
+    def test_reset_persisted_on_next_write(self):
+        """Test que la remise à zéro est écrite avec la prochaine réponse"""
+        self._set_streak(5, self.old)
+        database.update_daily_activity(self.user_id, 1, False)
+        self.assertEqual(self._stored_count(), 0)
+
+        database.update_daily_activity(self.user_id, 1, True)
+        self.assertEqual(database.get_user_streak(self.user_id), 1)
+
+    def test_reset_only_persisted_for_writer(self):
+        """Test que la réponse d'un utilisateur n'écrit pas le streak interrompu d'un autre"""
+        self._set_streak(5, self.old)
+        other = create_user('other_user', 'hash')
+        database.update_daily_activity(other, 3, True)
+
+        self.assertEqual(self._stored_count(), 5)
+        self.assertEqual(database.get_user_streak(self.user_id), 0)
+
+        database.update_daily_activity(self.user_id, 2, False)
+        self.assertEqual(self._stored_count(), 0)
+        with database.get_db_connection() as conn:
+            row = conn.execute(
+                "SELECT streak, score FROM leaderboard_scores WHERE user_id = ? AND period = 'all'",
+                (self.user_id,)
+            ).fetchone()
+        self.assertEqual((row['streak'], row['score']), (0, 0))
+
+
 def run_tests():
     """Fonction principale pour exécuter tous les tests"""
     # Créer une suite de tests
@@ -418,6 +1901,26 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestFlashcards))
     suite.addTests(loader.loadTestsFromTestCase(TestUserProgress))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
+    suite.addTests(loader.loadTestsFromTestCase(TestReviewPipeline))
+    suite.addTests(loader.loadTestsFromTestCase(TestNextCard))
+    suite.addTests(loader.loadTestsFromTestCase(TestStudyQueue))
+    suite.addTests(loader.loadTestsFromTestCase(TestFolderTree))
+    suite.addTests(loader.loadTestsFromTestCase(TestConnectionPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestDeckCounters))
+    suite.addTests(loader.loadTestsFromTestCase(TestBulkFlashcards))
+    suite.addTests(loader.loadTestsFromTestCase(TestImportDecks))
+    suite.addTests(loader.loadTestsFromTestCase(TestPdfCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestJobs))
+    suite.addTests(loader.loadTestsFromTestCase(TestGenerationCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestRateLimiter))
+    suite.addTests(loader.loadTestsFromTestCase(TestNearDuplicates))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatchScheduler))
+    suite.addTests(loader.loadTestsFromTestCase(TestSchedulerPresets))
+    suite.addTests(loader.loadTestsFromTestCase(TestSimulation))
+    suite.addTests(loader.loadTestsFromTestCase(TestReviewLog))
+    suite.addTests(loader.loadTestsFromTestCase(TestDailyReviewStats))
+    suite.addTests(loader.loadTestsFromTestCase(TestLeaderboard))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreakRead))
 
     # Exécuter les tests avec un rapport détaillé
     runner = unittest.TextTestRunner(verbosity=2)